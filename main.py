@@ -6,31 +6,61 @@
 Этот скрипт координирует работу всех модулей проекта:
 - Загружает конфигурацию (config_loader)
 - Настраивает логирование (logging_config)
-- Обрабатывает пользовательский ввод режима работы
+- Разбирает аргументы командной строки или запрашивает параметры интерактивно
 - Управляет подключением к AD (ad_operations)
 - Находит и обрабатывает CSV-файлы (csv_processing)
 - Генерирует XML-файлы (xml_generation)
 - Сохраняет результаты и пользователей, не найденных в AD
+
+Код возврата отражает результат обработки файлов (см. константы EXIT_*),
+что позволяет запускать скрипт из планировщика.
 """
 
 import os
 import sys
 import csv
-import uuid
+import time
 import logging
+import signal
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional
 import getpass
 import traceback
 
 # Импортируем модули проекта
 from modules.config_loader import CONFIG
-from modules.ad_operations import connect_to_ad, get_domain_guid
+from modules.ad_operations import (
+    connect_to_ad, get_domain_guid, close_domain_connections, sync_guid_cache, prepare_login_filter)
 from modules.xml_generation import generate_access_xml, generate_energy_xml
 from modules.csv_processing import (
-    find_csv_files, read_csv_file, write_csv_file,
-    process_user_row, get_file_encoding
+    find_csv_files, read_csv_file, write_back_csv,
+    process_rows, prefetch_ad_lookups, prefetch_ad_lookups_async, get_file_encoding,
+    INPUT_RECURSIVE, CSV_WRITEBACK
+)
+from modules.logging_config import LogManager, file_log_name, log_dir
+from modules.metrics import start_run, get_active, instrument_logger
+from modules.profiling import profile_call, profiling_requested
+from modules.metrics_exporter import write_textfile, start_http_server, stop_http_server
+from modules.duplicate_index import (
+    DuplicateIndex, DEDUP_ENABLED, DUPLICATES_CSV
+)
+from modules.guid_cache import GuidCache, CACHE_ENABLED, CACHE_PATH, CACHE_TTL_HOURS, CACHE_SYNC
+from modules.guid_table import GuidTable, TABLE_ENABLED, TABLE_PATH
+from modules.bloom_filter import PREFILTER_ENABLED
+from modules.pipeline import run_pipeline, PIPELINE_ENABLED, PIPELINE_RESOLVERS, PIPELINE_QUEUE_SIZE
+from modules.async_runner import run_async, ASYNC_ENABLED, ASYNC_CONCURRENCY
+from modules.not_found_spool import NotFoundSpool
+from modules.watcher import FolderWatcher
+from modules.api_server import ConverterService, create_server, API_HOST, API_PORT
+from modules.output_writer import atomic_write_text, sync_directories
+from modules.user_registry import UserRegistry, REGISTRY_ENABLED, REGISTRY_PATH
+from modules.table_readers import is_table_file, read_table_file
+from modules.validation import (
+    validate_rows, validate_csv_file, report_validation, VALIDATION_ENABLED
 )
-from modules.logging_config import LogManager
 
 # Константы из конфигурации
 AD_ENABLED = CONFIG['ad']['enabled']
@@ -45,6 +75,34 @@ ACCESS_SUFFIX = CONFIG['output']['access_xml_suffix']
 ENERGY_SUFFIX = CONFIG['output']['energy_xml_suffix']
 """str: Суффикс для генерируемых XML-файлов Energy."""
 
+PASSWORD_ENV = 'USER_CREATOR_AD_PASSWORD'
+"""str: Переменная окружения с паролем AD по умолчанию."""
+
+# Коды возврата
+EXIT_OK = 0
+"""int: Все файлы обработаны успешно (или файлов для обработки нет)."""
+EXIT_PARTIAL_FAILURE = 1
+"""int: Часть файлов обработана с ошибками."""
+EXIT_USAGE = 2
+"""int: Неверные аргументы командной строки (код argparse)."""
+EXIT_ALL_FAILED = 3
+"""int: Все файлы обработаны с ошибками."""
+EXIT_INIT_ERROR = 4
+"""int: Ошибка инициализации (нет параметров, не удалось подключиться к AD)."""
+
+
+def file_logger(csv_file: str) -> logging.Logger:
+    """
+    Возвращает логгер CSV-файла (имя логгера — как в LogManager, см. file_log_name).
+
+    Args:
+        csv_file (str): Путь к CSV-файлу.
+
+    Returns:
+        logging.Logger: Логгер файла.
+    """
+    return logging.getLogger(file_log_name(csv_file))
+
 
 def get_processing_mode() -> str:
     """
@@ -64,22 +122,59 @@ def get_processing_mode() -> str:
     return mode
 
 
-def initialize_ad_connection(mode: str) -> tuple:
+def read_ad_password(password_env: Optional[str] = None,
+                     password_file: Optional[str] = None) -> Optional[str]:
+    """
+    Получает пароль AD без интерактивного ввода.
+
+    Порядок поиска: файл (первая строка), указанная переменная окружения,
+    переменная окружения USER_CREATOR_AD_PASSWORD.
+
+    Args:
+        password_env (Optional[str]): Имя переменной окружения с паролем.
+        password_file (Optional[str]): Путь к файлу с паролем.
+
+    Returns:
+        Optional[str]: Пароль или None, если он не задан.
+    """
+    if password_file:
+        with open(password_file, 'r', encoding='utf-8') as f:
+            return f.readline().rstrip('\r\n')
+    if password_env:
+        return os.environ.get(password_env)
+    return os.environ.get(PASSWORD_ENV)
+
+
+def initialize_ad_connection(
+    mode: str,
+    password: Optional[str] = None,
+    domain_guid: Optional[str] = None,
+    interactive: bool = True
+) -> tuple:
     """
     Инициализирует подключение к AD и получает GUID домена.
 
     Args:
         mode (str): Режим работы ('y' или 'n').
+        password (Optional[str]): Пароль AD. Если не задан, запрашивается интерактивно.
+        domain_guid (Optional[str]): GUID домена для режима без AD. Если не задан,
+            запрашивается интерактивно.
+        interactive (bool): Разрешён ли интерактивный ввод недостающих параметров.
 
     Returns:
-        tuple: Кортеж из (ad_conn, ad_guid, not_found_in_ad) или (None, None, []) в случае ошибки.
+        tuple: Кортеж из (ad_conn, ad_guid, not_found_in_ad) или (None, None, None) в случае ошибки.
     """
     ad_guid = None
     ad_conn = None
-    not_found_in_ad = []
+    not_found_in_ad = NotFoundSpool()
 
     if mode == 'y' and AD_ENABLED:
-        password = getpass.getpass("🔐 Введите пароль AD: ")
+        if password is None:
+            if not interactive:
+                print("❌ Пароль AD не задан (--password-file, --password-env "
+                      f"или переменная окружения {PASSWORD_ENV}).")
+                return None, None, None
+            password = getpass.getpass("🔐 Введите пароль AD: ")
         ad_conn = connect_to_ad(password)
         if not ad_conn:
             print("❌ Не удалось подключиться к AD.")
@@ -90,8 +185,12 @@ def initialize_ad_connection(mode: str) -> tuple:
             print("❌ Не удалось получить GUID домена.")
             return None, None, None
     else:
-        ad_guid_input = input("Введите GUID домена (adGuid): ").strip()
-        ad_guid = ad_guid_input.upper()
+        if domain_guid is None:
+            if not interactive:
+                print("❌ GUID домена не задан (--domain-guid).")
+                return None, None, None
+            domain_guid = input("Введите GUID домена (adGuid): ")
+        ad_guid = domain_guid.strip().upper()
 
     return ad_conn, ad_guid, not_found_in_ad
 
@@ -101,27 +200,66 @@ def process_single_csv(
     mode: str,
     ad_conn,
     ad_guid: str,
-    not_found_in_ad: List[Dict]
+    not_found_in_ad: NotFoundSpool,
+    dup_index: Optional[DuplicateIndex] = None,
+    input_dir: str = '.',
+    output_dir: Optional[str] = None,
+    registry: Optional[UserRegistry] = None
 ) -> bool:
     """
     Обрабатывает один CSV-файл.
 
     Args:
-        csv_file (str): Имя CSV-файла для обработки.
+        csv_file (str): Путь к CSV-файлу относительно input_dir.
         mode (str): Режим работы ('y' или 'n').
         ad_conn: Подключение к AD (если используется).
         ad_guid (str): GUID домена AD.
-        not_found_in_ad (List[Dict]): Список для накопления пользователей, не найденных в AD.
+        not_found_in_ad (NotFoundSpool): Накопитель пользователей, не найденных в AD.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов, общий для всех файлов запуска.
+        input_dir (str): Директория с CSV-файлами.
+        output_dir (Optional[str]): Директория для XML-файлов (по умолчанию input_dir);
+            структура вложенных директорий input_dir в ней повторяется.
+        registry (Optional[UserRegistry]): Реестр пользователей для записи результатов.
 
     Returns:
         bool: True, если обработка прошла успешно, False в случае ошибки.
     """
-    file_path = os.path.join('.', csv_file)
-    base_name = os.path.splitext(csv_file)[0]
+    job = load_csv_job(csv_file, mode, ad_guid, input_dir, output_dir)
+    if job is None:
+        return False
+    return finish_csv_job(job, mode, ad_conn, ad_guid, not_found_in_ad, dup_index, registry)
+
+
+def load_csv_job(
+    csv_file: str,
+    mode: str,
+    ad_guid: str,
+    input_dir: str = '.',
+    output_dir: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Читает и проверяет один файл (первая половина process_single_csv).
+
+    Args:
+        csv_file (str): Путь к CSV-файлу относительно input_dir.
+        mode (str): Режим работы ('y' или 'n').
+        ad_guid (str): GUID домена AD.
+        input_dir (str): Директория с CSV-файлами.
+        output_dir (Optional[str]): Директория для XML-файлов (по умолчанию input_dir).
+
+    Returns:
+        Optional[Dict]: Задание для finish_csv_job (csv_file, file_path, base_name,
+            logger, rows, table_source, prefetched) или None, если файл не прочитан
+            или не прошёл проверку.
+    """
+    file_path = os.path.join(input_dir, csv_file)
+    base_name = os.path.join(output_dir or input_dir, os.path.splitext(csv_file)[0])
 
     # Создаём LogManager и получаем логгер
+    metrics = get_active()
     log_manager = LogManager(csv_file)
     logger = log_manager.get_logger()
+    instrument_logger(logger)
     logger.info(f"🚀 Начата обработка файла: {csv_file}")
 
     if mode == 'y' and AD_ENABLED:
@@ -129,52 +267,116 @@ def process_single_csv(
     else:
         logger.info(f"✅ Используется вручную введённый GUID домена: {ad_guid}")
 
-    # Определение кодировки и чтение CSV
+    # Определение кодировки и чтение CSV (или табличной выгрузки Parquet/Arrow/XLSX)
+    table_source = is_table_file(csv_file)
     try:
-        encoding = get_file_encoding(file_path)
-        logger.info(f"Определена кодировка: {encoding}")
-        rows = read_csv_file(file_path, encoding)
+        if table_source:
+            with metrics.timer('csv_read'):
+                rows = read_table_file(file_path)
+        else:
+            with metrics.timer('encoding_detection'):
+                encoding = get_file_encoding(file_path)
+            logger.info(f"Определена кодировка: {encoding}")
+            with metrics.timer('csv_read'):
+                rows = read_csv_file(file_path, encoding)
+        metrics.count('rows_read', len(rows))
         logger.info(f"Прочитано строк: {len(rows)}")
+    except ImportError as e:
+        logger.error(f"❌ Не удалось прочитать файл {file_path}: {e}")
+        return None
     except FileNotFoundError:
         logger.error(f"❌ Файл {file_path} не найден.")
-        return False
+        return None
     except UnicodeDecodeError as e:
         logger.error(f"❌ Ошибка декодирования файла {file_path}: {e}")
         logger.debug(f"Детали ошибки: {traceback.format_exc()}")
-        return False
+        return None
     except csv.Error as e:
         logger.error(f"❌ Ошибка CSV в файле {file_path}: {e}")
         logger.debug(f"Детали ошибки: {traceback.format_exc()}")
-        return False
+        return None
     except Exception as e:
         logger.error(f"❌ Неизвестная ошибка чтения файла {file_path}: {e}")
         logger.debug(f"Детали ошибки: {traceback.format_exc()}")
-        return False
+        return None
+
+    # Проверка структуры до поиска в AD и генерации XML
+    if VALIDATION_ENABLED and rows:
+        with metrics.timer('validation'):
+            validator = validate_rows(rows, csv_file)
+        try:
+            valid = report_validation(validator, base_name, logger)
+        except OSError as e:
+            logger.error(f"❌ Ошибка записи отчёта о проверке: {e}")
+            valid = not validator.failed
+        if not valid:
+            return None
+
+    return {
+        'csv_file': csv_file,
+        'file_path': file_path,
+        'base_name': base_name,
+        'logger': logger,
+        'rows': rows,
+        'table_source': table_source,
+        'prefetched': None
+    }
 
-    updated_rows = []
-    users_data = []
 
-    for row_idx, row in enumerate(rows):
+def finish_csv_job(
+    job: Dict,
+    mode: str,
+    ad_conn,
+    ad_guid: str,
+    not_found_in_ad: NotFoundSpool,
+    dup_index: Optional[DuplicateIndex] = None,
+    registry: Optional[UserRegistry] = None
+) -> bool:
+    """
+    Обрабатывает строки прочитанного файла и записывает результаты (XML, CSV, реестр).
+
+    Args:
+        job (Dict): Задание из load_csv_job.
+        mode (str): Режим работы ('y' или 'n').
+        ad_conn: Подключение к AD (если используется).
+        ad_guid (str): GUID домена AD.
+        not_found_in_ad (NotFoundSpool): Накопитель пользователей, не найденных в AD.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов, общий для всех файлов запуска.
+        registry (Optional[UserRegistry]): Реестр пользователей для записи результатов.
+
+    Returns:
+        bool: True, если обработка прошла успешно, False в случае ошибки.
+    """
+    metrics = get_active()
+    csv_file, file_path, base_name = job['csv_file'], job['file_path'], job['base_name']
+    logger, rows, table_source = job['logger'], job['rows'], job['table_source']
+
+    processing_start = time.perf_counter()
+    updated_rows, users_data = process_rows(
+        rows, csv_file, mode, ad_conn, ad_guid, not_found_in_ad, logger, dup_index,
+        prefetched=job['prefetched'])
+    metrics.add_time('row_processing', time.perf_counter() - processing_start)
+    metrics.count('users_processed', len(users_data))
+
+    # Запись в реестр пользователей
+    if registry is not None:
         try:
-            processed_row = process_user_row(
-                row, row_idx, csv_file, mode, ad_conn, ad_guid, not_found_in_ad, logger)
-            if processed_row:
-                updated_rows.append(processed_row)
-                users_data.append(processed_row)
+            with metrics.timer('registry'):
+                changed = registry.upsert_users(users_data, csv_file, ad_guid)
+            logger.info(f"Реестр пользователей: добавлено или изменено записей: {changed}")
         except Exception as e:
-            logger.error(
-                f"❌ Неожиданная ошибка при обработке строки {row_idx + 1} в файле {csv_file}: {e}")
+            logger.error(f"❌ Ошибка записи в реестр пользователей {registry.path}: {e}")
             logger.debug(f"Детали ошибки: {traceback.format_exc()}")
-            continue
 
     # Генерация XML
     try:
+        os.makedirs(os.path.dirname(base_name) or '.', exist_ok=True)
         sys_xml = generate_access_xml(ad_guid, users_data)
         energy_xml = generate_energy_xml(users_data)
-        with open(f"{base_name}{ACCESS_SUFFIX}", 'w', encoding='utf-8') as f:
-            f.write(sys_xml)
-        with open(f"{base_name}{ENERGY_SUFFIX}", 'w', encoding='utf-8') as f:
-            f.write(energy_xml)
+        with metrics.timer('xml_write'):
+            for xml_file, content in ((f"{base_name}{ACCESS_SUFFIX}", sys_xml),
+                                      (f"{base_name}{ENERGY_SUFFIX}", energy_xml)):
+                metrics.count('bytes_written', atomic_write_text(xml_file, content))
         logger.info(f"✅ Успешно сгенерированы XML-файлы: "
                     f"{base_name}{ACCESS_SUFFIX}, {base_name}{ENERGY_SUFFIX}")
     except Exception as e:
@@ -182,90 +384,755 @@ def process_single_csv(
         logger.debug(f"Детали ошибки: {traceback.format_exc()}")
         return False
 
-    # Перезапись CSV
+    # Перезапись CSV (или файл обогащения), только если строки изменились
     try:
-        write_csv_file(file_path, updated_rows)
-        logger.info(f"✅ CSV файл обновлён и сохранён: {csv_file}")
+        with metrics.timer('csv_write'):
+            # Табличную выгрузку нельзя перезаписать как CSV: для неё только файл обогащения
+            written = write_back_csv(file_path, rows, updated_rows, base_name,
+                                     'sidecar' if table_source else CSV_WRITEBACK)
+        if written:
+            metrics.count('bytes_written', os.path.getsize(written))
+            logger.info(f"✅ CSV файл обновлён и сохранён: {written}")
+        else:
+            metrics.count('csv_writes_skipped')
+            logger.info(f"CSV файл не изменился, перезапись пропущена: {csv_file}")
     except Exception as e:
         logger.error(f"❌ Ошибка записи CSV для файла {csv_file}: {e}")
         logger.debug(f"Детали ошибки: {traceback.format_exc()}")
         return False
 
+    metrics.count('files_processed')
     logger.info(f"✅ Обработка файла '{csv_file}' завершена.")
     return True
 
 
-def save_not_found_users(not_found_in_ad: List[Dict], csv_files: List[str]):
+def save_not_found_users(not_found_in_ad: NotFoundSpool, csv_files: List[str],
+                         output_dir: str = '.'):
     """
-    Сохраняет список пользователей, не найденных в AD, в отдельный CSV-файл.
+    Сохраняет пользователей, не найденных в AD, в отдельный CSV-файл.
+
+    Записи сливаются из временных файлов накопителя (внешняя сортировка по
+    логину, без повторов), после чего временные файлы удаляются.
 
     Args:
-        not_found_in_ad (List[Dict]): Список пользователей, не найденных в AD.
+        not_found_in_ad (NotFoundSpool): Накопитель пользователей, не найденных в AD.
         csv_files (List[str]): Список обработанных CSV-файлов (для получения логгера).
+        output_dir (str): Директория для сохранения файла.
     """
     if not_found_in_ad:
         try:
-            not_found_in_ad.sort(key=lambda x: x['login'])
-            with open(NOT_IN_AD_CSV, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(
-                    f, fieldnames=['login', 'name', 'person_guid'], delimiter=';')
-                writer.writeheader()
-                writer.writerows(not_found_in_ad)
+            written = not_found_in_ad.write(os.path.join(output_dir, NOT_IN_AD_CSV))
             # Логируем в последний обработанный файл
             if csv_files:
-                last_logger = logging.getLogger(
-                    os.path.splitext(csv_files[-1])[0])
+                last_logger = file_logger(csv_files[-1])
                 last_logger.warning(
-                    f"🟡 Логины не из AD сохранены в: {NOT_IN_AD_CSV}")
+                    f"🟡 Логины не из AD сохранены в: {NOT_IN_AD_CSV} (записей: {written})")
         except Exception as e:
             if csv_files:
-                last_logger = logging.getLogger(
-                    os.path.splitext(csv_files[-1])[0])
+                last_logger = file_logger(csv_files[-1])
                 last_logger.error(f"❌ Ошибка записи {NOT_IN_AD_CSV}: {e}")
                 last_logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+        finally:
+            not_found_in_ad.close()
+
+
+def save_duplicates_report(dup_index: DuplicateIndex, csv_files: List[str],
+                           output_dir: str = '.'):
+    """
+    Сохраняет отчёт о дубликатах и конфликтах логинов/GUID в отдельный CSV-файл.
+
+    Args:
+        dup_index (DuplicateIndex): Индекс дубликатов запуска.
+        csv_files (List[str]): Список обработанных CSV-файлов (для получения логгера).
+        output_dir (str): Директория для сохранения отчёта.
+    """
+    if not dup_index.records or not csv_files:
+        return
+    last_logger = file_logger(csv_files[-1])
+    try:
+        dup_index.write_report(os.path.join(output_dir, DUPLICATES_CSV))
+        last_logger.warning(
+            f"🟡 Найдено дубликатов: {len(dup_index.records)}, "
+            f"из них конфликтов: {len(dup_index.conflicts)}. Отчёт: {DUPLICATES_CSV}")
+    except Exception as e:
+        last_logger.error(f"❌ Ошибка записи {DUPLICATES_CSV}: {e}")
+        last_logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+
 
+def process_csv_files(
+    csv_files: List[str],
+    mode: str,
+    ad_conn,
+    ad_guid: str,
+    not_found_in_ad: NotFoundSpool,
+    input_dir: str = '.',
+    output_dir: str = '.',
+    jobs: int = 1,
+    password: Optional[str] = None,
+    guid_cache: Optional[GuidCache] = None,
+    registry: Optional[UserRegistry] = None,
+    pipeline: bool = PIPELINE_ENABLED,
+    use_async: bool = ASYNC_ENABLED
+) -> Dict[str, bool]:
+    """
+    Обрабатывает найденные CSV-файлы и сохраняет итоговые отчёты.
+
+    При jobs > 1 файлы обрабатываются параллельно в пуле потоков; в режиме AD
+    каждый поток открывает собственное подключение (ldap3 Connection нельзя
+    использовать из нескольких потоков одновременно).
+
+    Args:
+        csv_files (List[str]): Список CSV-файлов для обработки.
+        mode (str): Режим работы ('y' или 'n').
+        ad_conn: Подключение к AD (если используется).
+        ad_guid (str): GUID домена AD.
+        not_found_in_ad (NotFoundSpool): Накопитель пользователей, не найденных в AD.
+        input_dir (str): Директория с CSV-файлами.
+        output_dir (str): Директория для XML-файлов и отчётов.
+        jobs (int): Число файлов, обрабатываемых параллельно.
+        password (Optional[str]): Пароль AD для подключений рабочих потоков.
+        guid_cache (Optional[GuidCache]): Постоянный кэш GUID (предзагружается в индекс дубликатов).
+        registry (Optional[UserRegistry]): Реестр пользователей для записи результатов.
+        pipeline (bool): Обрабатывать файлы конвейером (modules.pipeline): чтение,
+            пакетный поиск в AD (jobs потоков, если jobs > 1) и запись выполняются
+            одновременно для разных файлов.
+        use_async (bool): Обрабатывать файлы оркестратором asyncio (modules.async_runner):
+            чтение и запись в пуле потоков, поиск в AD через подключение ldap3 ASYNC,
+            до jobs (если jobs > 1) или async.concurrency файлов одновременно.
+            Имеет приоритет над pipeline.
 
-def main():
+    Returns:
+        Dict[str, bool]: Результат обработки каждого файла.
+    """
+    metrics = get_active()
+    metrics_server = start_http_server() if metrics.enabled else None
+
+    dup_index = DuplicateIndex() if DEDUP_ENABLED else None
+    guid_table = None
+    if dup_index is not None and guid_cache is not None:
+        if TABLE_ENABLED:
+            # Один раз за запуск: все потоки читают одну таблицу без копий в словари
+            try:
+                guid_table = GuidTable.from_cache(guid_cache, TABLE_PATH if guid_cache.path else '')
+                dup_index.attach_guid_table(guid_table)
+            except Exception as e:
+                print(f"⚠️ Не удалось построить таблицу GUID {TABLE_PATH}: {e}")
+        if guid_table is None:
+            dup_index.preload_ad_guids(guid_cache.fresh_items())
+    if ad_conn is not None and PREFILTER_ENABLED:
+        login_filter = prepare_login_filter(ad_conn)
+        if login_filter is not None:
+            print(f"🧮 Фильтр логинов AD: {len(login_filter)} логинов")
+
+    thread_local = threading.local()
+    worker_connections = []
+
+    def run_one(csv_file: str) -> bool:
+        """Обрабатывает один файл в текущем потоке."""
+        conn = ad_conn
+        if jobs > 1 and ad_conn is not None:
+            conn = getattr(thread_local, 'conn', None)
+            if conn is None:
+                conn = connect_to_ad(password)
+                if conn is None:
+                    print(f"❌ Не удалось подключиться к AD для обработки файла {csv_file}.")
+                    return False
+                thread_local.conn = conn
+                worker_connections.append(conn)
+        with metrics.file_scope(csv_file):
+            try:
+                return process_single_csv(
+                    csv_file, mode, conn, ad_guid, not_found_in_ad, dup_index,
+                    input_dir, output_dir, registry)
+            except Exception as e:
+                print(f"❌ Критическая ошибка обработки файла {csv_file}: {e}")
+                logging.getLogger(__name__).debug(
+                    f"Детали ошибки: {traceback.format_exc()}")
+                return False
+
+    def finish_one(csv_file: str, success: bool):
+        """Учитывает результат обработки файла."""
+        results[csv_file] = success
+        if not success:
+            metrics.count('files_failed')
+            print(f"⚠️ Обработка файла {csv_file} завершена с ошибками.")
+        write_textfile(metrics)
+
+    def read_job(csv_file: str) -> Optional[Dict]:
+        """Этап чтения конвейера."""
+        with metrics.file_scope(csv_file):
+            return load_csv_job(csv_file, mode, ad_guid, input_dir, output_dir)
+
+    def resolve_job(job: Dict) -> Dict:
+        """Этап поиска конвейера: пакетный поиск логинов файла (подключения из пулов доменов)."""
+        if ad_conn is not None:
+            with metrics.file_scope(job['csv_file']):
+                job['prefetched'] = prefetch_ad_lookups(job['rows'], None, job['logger'], dup_index)
+        return job
+
+    async def resolve_job_async(job: Dict) -> Dict:
+        """Этап поиска оркестратора asyncio: пакетный поиск логинов файла (ldap3 ASYNC)."""
+        if ad_conn is not None:
+            job['prefetched'] = await prefetch_ad_lookups_async(job['rows'], job['logger'], dup_index)
+        return job
+
+    def write_job(job: Dict) -> bool:
+        """Этап записи конвейера."""
+        with metrics.file_scope(job['csv_file']):
+            return finish_csv_job(job, mode, ad_conn, ad_guid, not_found_in_ad, dup_index, registry)
+
+    # --- Обработка каждого файла ---
+    results: Dict[str, bool] = {}
+    if use_async:
+        run_async(csv_files, read_job, resolve_job_async, write_job,
+                  jobs if jobs > 1 else ASYNC_CONCURRENCY, on_result=finish_one)
+    elif pipeline:
+        run_pipeline(csv_files, read_job, resolve_job, write_job,
+                     jobs if jobs > 1 else PIPELINE_RESOLVERS, PIPELINE_QUEUE_SIZE, finish_one)
+    elif jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="csv") as executor:
+            futures = {executor.submit(run_one, csv_file): csv_file for csv_file in csv_files}
+            for future in as_completed(futures):
+                finish_one(futures[future], future.result())
+        for conn in worker_connections:
+            try:
+                conn.unbind()
+            except Exception:
+                pass
+    else:
+        for csv_file in csv_files:
+            finish_one(csv_file, run_one(csv_file))
+    close_domain_connections()
+
+    # --- Сохранение not_in_AD.csv ---
+    if mode == 'y' and not_found_in_ad:
+        save_not_found_users(not_found_in_ad, csv_files, output_dir)
+
+    # --- Сохранение отчёта о дубликатах ---
+    if dup_index is not None:
+        save_duplicates_report(dup_index, csv_files, output_dir)
+
+    # --- Обновление постоянного кэша GUID ---
+    if dup_index is not None and guid_cache is not None:
+        for login, guid in dup_index.resolved_ad_guids().items():
+            guid_cache.put(login, guid)
+        try:
+            guid_cache.save()
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить кэш GUID {guid_cache.path}: {e}")
+    if guid_table is not None:
+        guid_table.close()
+
+    # --- Синхронизация директорий с результатами (политика fsync batch) ---
+    sync_directories()
+
+    # --- Отчёт о метриках ---
+    if metrics.enabled:
+        try:
+            print(f"📊 Метрики запуска сохранены в: {metrics.write_report(log_dir)}")
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить метрики запуска: {e}")
+        write_textfile(metrics)
+    stop_http_server(metrics_server)
+    return results
+
+
+def run_watch(
+    mode: str,
+    ad_conn,
+    ad_guid: str,
+    input_dir: str,
+    output_dir: str,
+    jobs: int = 1,
+    password: Optional[str] = None,
+    guid_cache: Optional[GuidCache] = None,
+    recursive: bool = INPUT_RECURSIVE,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    registry: Optional[UserRegistry] = None,
+    pipeline: bool = PIPELINE_ENABLED,
+    use_async: bool = ASYNC_ENABLED
+) -> int:
+    """
+    Режим службы: обрабатывает новые и изменённые CSV-файлы во входной директории.
+
+    Подключение к AD и кэш GUID сохраняются между пакетами файлов; при
+    разрыве подключение восстанавливается перед следующим пакетом. Работа
+    завершается по Ctrl+C или SIGTERM.
+
+    Args:
+        mode (str): Режим работы ('y' или 'n').
+        ad_conn: Подключение к AD (если используется).
+        ad_guid (str): GUID домена AD.
+        input_dir (str): Наблюдаемая директория с CSV-файлами.
+        output_dir (str): Директория для XML-файлов и отчётов.
+        jobs (int): Число файлов, обрабатываемых параллельно.
+        password (Optional[str]): Пароль AD для переподключения.
+        guid_cache (Optional[GuidCache]): Постоянный кэш GUID.
+        recursive (bool): Искать файлы во вложенных директориях.
+        include (Optional[List[str]]): Glob-шаблоны включаемых файлов.
+        exclude (Optional[List[str]]): Glob-шаблоны исключаемых файлов.
+        registry (Optional[UserRegistry]): Реестр пользователей для записи результатов.
+        pipeline (bool): Конвейерная обработка файлов (см. process_csv_files).
+        use_async (bool): Обработка файлов оркестратором asyncio (см. process_csv_files).
+
+    Returns:
+        int: Код возврата (EXIT_OK после штатной остановки).
+    """
+    logger = logging.getLogger(__name__)
+    if ad_conn is not None and guid_cache is None:
+        # Без постоянного кэша GUID держим кэш в памяти на всё время работы службы
+        guid_cache = GuidCache('')
+
+    watcher = FolderWatcher(input_dir, ['Sample.csv', NOT_IN_AD_CSV, DUPLICATES_CSV],
+                            recursive=recursive, include=include, exclude=exclude)
+
+    def handle_stop(signum, frame):
+        """Останавливает службу по сигналу."""
+        print("🛑 Получен сигнал остановки, служба завершается...")
+        watcher.stop()
+
+    signal.signal(signal.SIGINT, handle_stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_stop)
+
+    print(f"👀 Наблюдение за директорией {input_dir}, результаты — в {output_dir}")
+    try:
+        while True:
+            csv_files = watcher.wait_for_files()
+            if not csv_files:
+                break
+            print(f"📥 Новые или изменённые файлы: {', '.join(csv_files)}")
+
+            if ad_conn is not None and not ad_conn.bound:
+                logger.warning("Подключение к AD потеряно, переподключение...")
+                new_conn = connect_to_ad(password)
+                if new_conn is None:
+                    # Файлы останутся кандидатами и будут обработаны после восстановления AD
+                    print("❌ Не удалось переподключиться к AD, повтор через "
+                          f"{watcher.poll_interval} с.")
+                    watcher.stop_event.wait(watcher.poll_interval)
+                    continue
+                ad_conn = new_conn
+
+            start_run()
+            results = process_csv_files(
+                csv_files, mode, ad_conn, ad_guid, NotFoundSpool(), input_dir, output_dir,
+                jobs, password, guid_cache, registry, pipeline, use_async)
+            for csv_file in csv_files:
+                watcher.mark_processed(csv_file)
+            failed = [csv_file for csv_file, success in results.items() if not success]
+            if failed:
+                print(f"⚠️ Файлов с ошибками: {len(failed)} из {len(results)}: "
+                      f"{', '.join(sorted(failed))}")
+            else:
+                print(f"✅ Обработано файлов: {len(results)}")
+    finally:
+        watcher.close()
+        if ad_conn is not None:
+            try:
+                ad_conn.unbind()
+            except Exception:
+                pass
+    return EXIT_OK
+
+
+def run_serve(
+    mode: str,
+    ad_conn,
+    ad_guid: str,
+    host: str = API_HOST,
+    port: int = API_PORT,
+    password: Optional[str] = None,
+    guid_cache: Optional[GuidCache] = None
+) -> int:
+    """
+    Режим HTTP-сервиса: преобразует CSV из запросов в XML до остановки.
+
+    Args:
+        mode (str): Режим работы ('y' или 'n').
+        ad_conn: Подключение к AD (становится первым подключением пула).
+        ad_guid (str): GUID домена AD.
+        host (str): Адрес для прослушивания.
+        port (int): Порт.
+        password (Optional[str]): Пароль AD для новых подключений пула.
+        guid_cache (Optional[GuidCache]): Постоянный кэш GUID.
+
+    Returns:
+        int: Код возврата (EXIT_OK после штатной остановки, EXIT_INIT_ERROR,
+            если порт занят).
+    """
+    service = ConverterService(mode, ad_guid, password, guid_cache)
+    if ad_conn is not None:
+        service.add_connection(ad_conn)
+    try:
+        server = create_server(service, host, port)
+    except OSError as e:
+        print(f"❌ Не удалось запустить HTTP-сервис на {host}:{port}: {e}")
+        service.close()
+        return EXIT_INIT_ERROR
+
+    def handle_stop(signum, frame):
+        """Останавливает сервис по сигналу."""
+        print("🛑 Получен сигнал остановки, сервис завершается...")
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, handle_stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_stop)
+
+    print(f"🌐 HTTP-сервис запущен: http://{host}:{port}/convert "
+          f"(одновременных запросов: {service.max_concurrent})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+    return EXIT_OK
+
+
+def run_registry_export(
+    registry: UserRegistry,
+    output_dir: str,
+    name: str,
+    ad_guid: Optional[str] = None,
+    department: Optional[str] = None,
+    organisation: Optional[str] = None,
+    changed_since: Optional[float] = None
+) -> int:
+    """
+    Генерирует XML Access/Energy для подмножества пользователей из реестра.
+
+    Исходные CSV не читаются и к AD подключение не требуется.
+
+    Args:
+        registry (UserRegistry): Реестр пользователей.
+        output_dir (str): Директория для XML-файлов.
+        name (str): Базовое имя XML-файлов.
+        ad_guid (Optional[str]): GUID домена (по умолчанию — сохранённый в реестре).
+        department (Optional[str]): Отбор по подразделению.
+        organisation (Optional[str]): Отбор по организации.
+        changed_since (Optional[float]): Отбор изменённых не раньше момента (Unix time).
+
+    Returns:
+        int: Код возврата.
+    """
+    ad_guid = (ad_guid or registry.get_ad_guid() or '').strip().upper()
+    if not ad_guid:
+        print("❌ GUID домена не задан (--domain-guid) и не сохранён в реестре.")
+        return EXIT_INIT_ERROR
+    users_data = registry.query(department, organisation, changed_since)
+    print(f"📚 Выбрано пользователей из реестра {registry.path}: {len(users_data)}")
+    base_name = os.path.join(output_dir, name)
+    try:
+        atomic_write_text(f"{base_name}{ACCESS_SUFFIX}", generate_access_xml(ad_guid, users_data))
+        atomic_write_text(f"{base_name}{ENERGY_SUFFIX}", generate_energy_xml(users_data))
+        sync_directories()
+    except Exception as e:
+        print(f"❌ Ошибка записи XML из реестра: {e}")
+        return EXIT_ALL_FAILED
+    print(f"✅ Сгенерированы XML-файлы: {base_name}{ACCESS_SUFFIX}, {base_name}{ENERGY_SUFFIX}")
+    return EXIT_OK
+
+
+def run_validate_only(
+    input_dir: str,
+    output_dir: str,
+    recursive: bool,
+    include: Optional[List[str]],
+    exclude: Optional[List[str]]
+) -> int:
+    """
+    Проверяет входные файлы без обработки (без подключения к AD).
+
+    CSV-файлы читаются потоково; для каждого файла с ошибками сохраняется
+    отчёт <имя>_validation.json.
+
+    Args:
+        input_dir (str): Директория с CSV-файлами.
+        output_dir (str): Директория для отчётов.
+        recursive (bool): Искать файлы во вложенных директориях.
+        include (Optional[List[str]]): Glob-шаблоны включаемых файлов.
+        exclude (Optional[List[str]]): Glob-шаблоны исключаемых файлов.
+
+    Returns:
+        int: Код возврата.
+    """
+    csv_files = find_csv_files(['Sample.csv', NOT_IN_AD_CSV, DUPLICATES_CSV], input_dir,
+                               recursive, include, exclude)
+    if not csv_files:
+        print("⚠️ Нет подходящих CSV-файлов для проверки.")
+        return EXIT_OK
+    failed = []
+    for csv_file in csv_files:
+        file_path = os.path.join(input_dir, csv_file)
+        base_name = os.path.join(output_dir, os.path.splitext(csv_file)[0])
+        logger = file_logger(csv_file)
+        try:
+            if is_table_file(csv_file):
+                validator = validate_rows(read_table_file(file_path), csv_file)
+            else:
+                validator = validate_csv_file(file_path, get_file_encoding(file_path), csv_file)
+            ok = report_validation(validator, base_name, logger)
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки файла {file_path}: {e}")
+            ok = False
+            validator = None
+        if validator is not None and validator.error_count:
+            print(f"{'❌' if not ok else '⚠️'} {csv_file}: ошибок {validator.error_count}")
+        else:
+            print(f"{'✅' if ok else '❌'} {csv_file}")
+        if not ok:
+            failed.append(csv_file)
+    if not failed:
+        return EXIT_OK
+    return EXIT_ALL_FAILED if len(failed) == len(csv_files) else EXIT_PARTIAL_FAILURE
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки.
+
+    Любой не указанный параметр запрашивается интерактивно, если не задан
+    --non-interactive.
+
+    Args:
+        argv (Optional[List[str]]): Аргументы (по умолчанию sys.argv[1:]).
+
+    Returns:
+        argparse.Namespace: Разобранные аргументы.
+    """
+    parser = argparse.ArgumentParser(
+        description="Обработка CSV-файлов пользователей и генерация XML Access/Energy.",
+        epilog=f"Коды возврата: {EXIT_OK} — успех, {EXIT_PARTIAL_FAILURE} — часть файлов с ошибками, "
+               f"{EXIT_USAGE} — неверные аргументы, {EXIT_ALL_FAILED} — все файлы с ошибками, "
+               f"{EXIT_INIT_ERROR} — ошибка инициализации.")
+    parser.add_argument(
+        '--mode', choices=['y', 'n'],
+        help="Режим: y — GUID пользователей из AD, n — GUID из CSV.")
+    parser.add_argument(
+        '--input-dir', default='.',
+        help="Директория с CSV-файлами (по умолчанию текущая).")
+    parser.add_argument(
+        '--output-dir',
+        help="Директория для XML-файлов и отчётов (по умолчанию --input-dir).")
+    parser.add_argument(
+        '--recursive', action=argparse.BooleanOptionalAction, default=INPUT_RECURSIVE,
+        help="Искать CSV-файлы во вложенных директориях (по умолчанию input.recursive).")
+    parser.add_argument(
+        '--include', action='append', metavar='GLOB',
+        help="Шаблон включаемых файлов (можно указать несколько раз; "
+             "по умолчанию input.include).")
+    parser.add_argument(
+        '--exclude', action='append', metavar='GLOB',
+        help="Шаблон исключаемых файлов (можно указать несколько раз; "
+             "по умолчанию input.exclude).")
+    parser.add_argument(
+        '--domain-guid',
+        help="GUID домена для режима без AD.")
+    password_group = parser.add_mutually_exclusive_group()
+    password_group.add_argument(
+        '--password-env', metavar='VAR',
+        help=f"Переменная окружения с паролем AD (по умолчанию {PASSWORD_ENV}).")
+    password_group.add_argument(
+        '--password-file', metavar='PATH',
+        help="Файл, первая строка которого — пароль AD.")
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help="Число файлов, обрабатываемых параллельно (по умолчанию 1).")
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help="Конвейерная обработка: чтение, поиск в AD и запись разных файлов "
+             "одновременно (--jobs задаёт число потоков поиска).")
+    parser.add_argument(
+        '--async', dest='use_async', action='store_true',
+        help="Обработка оркестратором asyncio: файлы читаются и записываются в пуле "
+             "потоков, поиск в AD — асинхронными запросами (--jobs задаёт число "
+             "файлов, обрабатываемых одновременно).")
+    parser.add_argument(
+        '--guid-cache', metavar='PATH',
+        help=f"Постоянный кэш GUID пользователей из AD (по умолчанию {CACHE_PATH}, "
+             "если cache.enabled в config.json).")
+    parser.add_argument(
+        '--cache-ttl', type=float, metavar='HOURS', default=CACHE_TTL_HOURS,
+        help=f"Время жизни записи кэша GUID в часах (по умолчанию {CACHE_TTL_HOURS}).")
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help="Не использовать постоянный кэш GUID.")
+    parser.add_argument(
+        '--watch', action='store_true',
+        help="Режим службы: наблюдать за --input-dir и обрабатывать новые и изменённые "
+             "CSV-файлы до остановки (Ctrl+C или SIGTERM).")
+    parser.add_argument(
+        '--serve', action='store_true',
+        help="Режим HTTP-сервиса: принимать CSV по HTTP и возвращать XML до остановки.")
+    parser.add_argument(
+        '--host', default=API_HOST,
+        help=f"Адрес HTTP-сервиса (по умолчанию {API_HOST}).")
+    parser.add_argument(
+        '--port', type=int, default=API_PORT,
+        help=f"Порт HTTP-сервиса (по умолчанию {API_PORT}).")
+    parser.add_argument(
+        '--registry', metavar='PATH',
+        help=f"Реестр пользователей SQLite (по умолчанию {REGISTRY_PATH}, "
+             "если registry.enabled в config.json).")
+    parser.add_argument(
+        '--no-registry', action='store_true',
+        help="Не записывать пользователей в реестр.")
+    parser.add_argument(
+        '--export-registry', metavar='NAME',
+        help="Не обрабатывать CSV, а сгенерировать NAME_Access.xml и NAME_Energy.xml "
+             "из реестра (с отбором --department, --organisation, --changed-since).")
+    parser.add_argument(
+        '--department',
+        help="Отбор по подразделению для --export-registry.")
+    parser.add_argument(
+        '--organisation',
+        help="Отбор по организации для --export-registry.")
+    parser.add_argument(
+        '--changed-since', metavar='ISO_DATETIME', type=datetime.fromisoformat,
+        help="Отбор пользователей, изменённых не раньше указанного момента "
+             "(например, 2025-03-01T00:00), для --export-registry.")
+    parser.add_argument(
+        '--validate-only', action='store_true',
+        help="Только проверить входные файлы (без AD и генерации XML) "
+             "и сохранить отчёты <имя>_validation.json.")
+    parser.add_argument(
+        '--non-interactive', action='store_true',
+        help="Не запрашивать недостающие параметры, а завершаться с ошибкой.")
+    parser.add_argument(
+        '--profile', action='store_true',
+        help="Профилировать обработку (cProfile и семплирование стека); "
+             "результаты сохраняются в директорию логов.")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs должен быть не меньше 1")
+    if args.watch and args.serve:
+        parser.error("--watch и --serve нельзя использовать одновременно")
+    if args.export_registry and args.no_registry:
+        parser.error("--export-registry нельзя использовать с --no-registry")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
     """
     Основная функция программы.
 
     Координирует весь процесс:
-    1. Запрашивает режим работы у пользователя.
+    1. Определяет режим работы (аргумент --mode или интерактивный ввод).
     2. Инициализирует подключение к AD (если требуется).
-    3. Находит все подходящие CSV-файлы.
-    4. Последовательно обрабатывает каждый файл.
-    5. Сохраняет список пользователей, не найденных в AD.
-    6. Выводит финальное сообщение о завершении.
+    3. Находит все подходящие CSV-файлы (или переходит в режим службы при --watch
+       либо в режим HTTP-сервиса при --serve).
+    4. Обрабатывает файлы (последовательно или параллельно, под профилировщиком,
+       если указан --profile).
+    5. Сохраняет список пользователей, не найденных в AD, и отчёт о дубликатах.
+    6. Сохраняет JSON-отчёт о метриках запуска в директорию логов.
+    7. Выводит итог и возвращает код возврата.
+
+    Args:
+        argv (Optional[List[str]]): Аргументы командной строки (по умолчанию sys.argv[1:]).
+
+    Returns:
+        int: Код возврата (см. константы EXIT_*).
     """
-    mode = get_processing_mode()
-    ad_conn, ad_guid, not_found_in_ad = initialize_ad_connection(mode)
+    args = parse_args(argv)
+    interactive = not args.non_interactive
+    input_dir = args.input_dir
+    output_dir = args.output_dir or input_dir
+
+    if not os.path.isdir(input_dir):
+        print(f"❌ Директория с CSV не существует: {input_dir}")
+        return EXIT_INIT_ERROR
+    os.makedirs(output_dir, exist_ok=True)
+
+    # --- Реестр пользователей ---
+    registry = None
+    if not args.no_registry and (REGISTRY_ENABLED or args.registry or args.export_registry):
+        try:
+            registry = UserRegistry(args.registry or REGISTRY_PATH)
+        except Exception as e:
+            print(f"❌ Не удалось открыть реестр пользователей: {e}")
+            return EXIT_INIT_ERROR
+
+    if args.export_registry:
+        changed_since = args.changed_since.timestamp() if args.changed_since else None
+        return run_registry_export(registry, output_dir, args.export_registry, args.domain_guid,
+                                   args.department, args.organisation, changed_since)
+
+    if args.validate_only:
+        return run_validate_only(input_dir, output_dir, args.recursive, args.include, args.exclude)
+
+    mode = args.mode
+    if mode is None:
+        if not interactive:
+            print("❌ Режим обработки не задан (--mode).")
+            return EXIT_INIT_ERROR
+        mode = get_processing_mode()
+    start_run()
+
+    password = None
+    if mode == 'y' and AD_ENABLED:
+        try:
+            password = read_ad_password(args.password_env, args.password_file)
+        except OSError as e:
+            print(f"❌ Не удалось прочитать файл с паролем AD: {e}")
+            return EXIT_INIT_ERROR
+        if password is None and interactive:
+            password = getpass.getpass("🔐 Введите пароль AD: ")
+    ad_conn, ad_guid, not_found_in_ad = initialize_ad_connection(
+        mode, password, args.domain_guid, interactive)
 
     if ad_conn is None and ad_guid is None:
         # Это означает ошибку при инициализации AD
-        return
+        return EXIT_INIT_ERROR
+
+    # --- Постоянный кэш GUID ---
+    guid_cache = None
+    if mode == 'y' and ad_conn is not None and not args.no_cache and (
+            CACHE_ENABLED or args.guid_cache):
+        guid_cache = GuidCache(args.guid_cache or CACHE_PATH, args.cache_ttl).load()
+        print(f"🗂️ Кэш GUID: {guid_cache.path} (записей: {len(guid_cache)})")
+        if CACHE_SYNC:
+            changed = sync_guid_cache(ad_conn, guid_cache)
+            if changed is not None:
+                print(f"🔄 Кэш GUID синхронизирован с AD: изменённых пользователей {changed}")
+            try:
+                guid_cache.save()
+            except Exception as e:
+                print(f"⚠️ Не удалось сохранить кэш GUID {guid_cache.path}: {e}")
+
+    if args.serve:
+        return run_serve(mode, ad_conn, ad_guid, args.host, args.port, password, guid_cache)
+    if args.watch:
+        return run_watch(mode, ad_conn, ad_guid, input_dir, output_dir,
+                         args.jobs, password, guid_cache,
+                         args.recursive, args.include, args.exclude, registry,
+                         args.pipeline or PIPELINE_ENABLED, args.use_async or ASYNC_ENABLED)
 
     # --- Поиск CSV-файлов ---
-    csv_files = find_csv_files(['Sample.csv', NOT_IN_AD_CSV])
+    csv_files = find_csv_files(['Sample.csv', NOT_IN_AD_CSV, DUPLICATES_CSV], input_dir,
+                               args.recursive, args.include, args.exclude)
     if not csv_files:
         print("⚠️ Нет подходящих CSV-файлов для обработки.")
-        return
+        return EXIT_OK
 
-    # --- Обработка каждого файла ---
-    for csv_file in csv_files:
-        success = process_single_csv(
-            csv_file, mode, ad_conn, ad_guid, not_found_in_ad)
-        if not success:
-            print(f"⚠️ Обработка файла {csv_file} завершена с ошибками.")
-
-    # --- Сохранение not_in_AD.csv ---
-    if mode == 'y' and not_found_in_ad:
-        save_not_found_users(not_found_in_ad, csv_files)
+    process_args = (csv_files, mode, ad_conn, ad_guid, not_found_in_ad,
+                    input_dir, output_dir, args.jobs, password, guid_cache, registry,
+                    args.pipeline or PIPELINE_ENABLED, args.use_async or ASYNC_ENABLED)
+    if args.profile or profiling_requested():
+        results = profile_call(process_csv_files, log_dir, 'cli', *process_args)
+    else:
+        results = process_csv_files(*process_args)
 
-    # Финальное сообщение
-    if csv_files:
-        final_logger = logging.getLogger(os.path.splitext(csv_files[-1])[0])
+    # Итог
+    failed = [csv_file for csv_file, success in results.items() if not success]
+    final_logger = file_logger(csv_files[-1])
+    if not failed:
         final_logger.info("✅ Все файлы успешно обработаны.")
+        return EXIT_OK
+    print(f"⚠️ Файлов с ошибками: {len(failed)} из {len(results)}: {', '.join(sorted(failed))}")
+    return EXIT_ALL_FAILED if len(failed) == len(results) else EXIT_PARTIAL_FAILURE
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
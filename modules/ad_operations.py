@@ -1,19 +1,175 @@
 """
 Модуль для работы с Active Directory.
+
+Сведения о сервере (DSA info) и схема загружаются с контроллера домена
+не при каждом подключении, а один раз в ad.server_info_ttl_hours: они
+сохраняются в файлы ad.server_info_cache и ad.schema_cache и подключаются
+к объекту Server, созданному с get_info=NONE (без запросов DSE и схемы при bind).
+
+Пользователи могут находиться в нескольких доменах леса (ad.domains):
+логин DOMAIN\\login или login@suffix направляется на контроллер своего
+домена, а логины неизвестных доменов — в глобальный каталог
+(ad.global_catalog, порт 3268). Подключения к дополнительным доменам
+берутся из пулов, по одному пулу на домен.
+
+Постоянный кэш GUID синхронизируется с основным доменом инкрементально
+(sync_guid_cache): запрашиваются только пользователи, изменённые после
+метки uSNChanged предыдущей синхронизации. Так же обновляется фильтр Блума
+логинов AD (prepare_login_filter), по которому логины, которых точно нет
+в AD, не запрашиваются вовсе.
+
+Для оркестратора asyncio (modules.async_runner) есть lookup_users_async:
+пакетные запросы к основному домену отправляются через подключение
+ldap3 со стратегией ASYNC, не дожидаясь ответов на предыдущие.
 """
+import os
+import time
 import uuid
-from typing import Optional
+import queue
+import asyncio
+import threading
+from collections import deque
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 import ldap3
-from ldap3 import Server, Connection, ALL
+from ldap3 import Server, Connection, ALL, NONE, BASE, ASYNC
+from ldap3.protocol.rfc4512 import DsaInfo, SchemaInfo
+from ldap3.utils.conv import escape_filter_chars
 import traceback
 import logging
 
 # Импортируем конфигурацию
 from .config_loader import CONFIG
+from .metrics import get_active
+from .output_writer import atomic_write_text
+from .guid_cache import GuidCache
+from .bloom_filter import (
+    BloomFilter, PREFILTER_PATH, PREFILTER_FP_RATE, PREFILTER_REBUILD_HOURS)
 
 DOMAIN_CONTROLLER = CONFIG['ad']['domain_controller']
 DOMAIN_DN = CONFIG['ad']['domain_dn']
 AD_USER = CONFIG['ad']['user']
+SERVER_INFO_CACHE = CONFIG['ad'].get('server_info_cache', 'ad_server_info.json')  # "" — без кэша
+SCHEMA_CACHE = CONFIG['ad'].get('schema_cache', 'ad_schema.json')
+SERVER_INFO_TTL_HOURS = CONFIG['ad'].get('server_info_ttl_hours', 168)
+ENRICH_BLANKS = CONFIG['ad'].get('enrich_blanks', False)
+# Колонка CSV -> атрибут AD, которым заполняется пустое значение
+ENRICH_FIELDS: Dict[str, str] = CONFIG['ad'].get(
+    'enrich_fields', {'email': 'mail', 'mobilePhone': 'mobile'})
+ENRICH_ATTRIBUTES = ['mail', 'mobile', 'displayName']
+LOOKUP_BATCH_SIZE = CONFIG['ad'].get('lookup_batch_size', 50)  # начальный размер пакета lookup_users
+LOOKUP_MIN_BATCH = CONFIG['ad'].get('lookup_min_batch_size', 1)
+LOOKUP_MAX_BATCH = CONFIG['ad'].get('lookup_max_batch_size', 500)
+LOOKUP_BATCH_STEP = CONFIG['ad'].get('lookup_batch_step', 10)
+LOOKUP_MAX_CONCURRENCY = CONFIG['ad'].get('lookup_max_concurrency', 4)
+LOOKUP_TARGET_LATENCY = CONFIG['ad'].get('lookup_target_latency_ms', 500) / 1000.0
+MAX_PAGE_SIZE = CONFIG['ad'].get('max_page_size', 0)  # 0 — прочитать из политики запросов AD
+DEFAULT_MAX_PAGE_SIZE = 1000
+ASYNC_LOOKUP_CONCURRENCY = CONFIG['ad'].get('async_lookup_concurrency', 8)  # запросов в полёте (lookup_users_async)
+SHOW_DELETED_OID = '1.2.840.113556.1.4.417'  # LDAP_SERVER_SHOW_DELETED_OID
+DOMAINS: List[Dict] = CONFIG['ad'].get('domains', [])
+GLOBAL_CATALOG = CONFIG['ad'].get('global_catalog', '')  # например, ldap://dc.domain.com:3268
+GLOBAL_CATALOG_BASE = CONFIG['ad'].get('global_catalog_base', '')
+GLOBAL_CATALOG_USER = CONFIG['ad'].get('global_catalog_user', AD_USER)
+
+PRIMARY = ''
+"""str: Ключ основного домена (ad.domain_controller, ad.domain_dn)."""
+
+GLOBAL_CATALOG_KEY = '*'
+"""str: Ключ глобального каталога."""
+
+# NetBIOS-имя и UPN-суффикс основного домена по умолчанию выводятся из DOMAIN_DN
+_DN_PARTS = [part.split('=', 1)[1] for part in DOMAIN_DN.split(',')
+             if part.strip().upper().startswith('DC=')]
+PRIMARY_NAME = CONFIG['ad'].get('netbios_name') or (_DN_PARTS[0].upper() if _DN_PARTS else '')
+PRIMARY_UPN_SUFFIXES = CONFIG['ad'].get('upn_suffixes') or ['.'.join(_DN_PARTS)]
+
+_DOMAIN_CONFIG: Dict[str, Dict] = {domain['name']: domain for domain in DOMAINS}
+_DOMAINS_BY_NAME: Dict[str, str] = {PRIMARY_NAME.lower(): PRIMARY}
+_DOMAINS_BY_SUFFIX: Dict[str, str] = {suffix.lower(): PRIMARY for suffix in PRIMARY_UPN_SUFFIXES}
+for _domain in DOMAINS:
+    _DOMAINS_BY_NAME[_domain['name'].lower()] = _domain['name']
+    for _suffix in _domain.get('upn_suffixes', []):
+        _DOMAINS_BY_SUFFIX[_suffix.lower()] = _domain['name']
+
+# Пулы подключений к дополнительным доменам и глобальному каталогу
+_pools: Dict[str, queue.LifoQueue] = {}
+_pools_lock = threading.Lock()
+# Состояние подбора размера пакетов по доменам (AdaptiveBatching)
+_batching: Dict[str, 'AdaptiveBatching'] = {}
+_batching_lock = threading.Lock()
+# Подключение к основному домену со стратегией ASYNC (lookup_users_async)
+_async_conn: Optional[Connection] = None
+_async_lock = threading.Lock()
+# Активный фильтр Блума логинов AD (prepare_login_filter)
+_login_filter: Optional[BloomFilter] = None
+# Пароль последнего успешного connect_to_ad: им же подключаемся к другим доменам
+_password: Optional[str] = None
+
+# Загруженные из файлов сведения о сервере, общие для всех подключений процесса
+_server_info: Optional[Tuple[DsaInfo, SchemaInfo]] = None
+_server_info_lock = threading.Lock()
+
+
+def _server_info_fresh() -> bool:
+    """Проверяет, что файлы кэша сведений о сервере есть и не устарели."""
+    try:
+        oldest = min(os.path.getmtime(SERVER_INFO_CACHE), os.path.getmtime(SCHEMA_CACHE))
+    except OSError:
+        return False
+    return time.time() - oldest < SERVER_INFO_TTL_HOURS * 3600
+
+
+def _load_server_info() -> Optional[Tuple[DsaInfo, SchemaInfo]]:
+    """
+    Возвращает сведения о сервере и схему из файлового кэша.
+
+    Returns:
+        Optional[Tuple[DsaInfo, SchemaInfo]]: Сведения и схема или None, если
+            кэш отключён, отсутствует, устарел или повреждён.
+    """
+    global _server_info
+    if not (SERVER_INFO_CACHE and SCHEMA_CACHE):
+        return None
+    with _server_info_lock:
+        if _server_info is not None and not _server_info_fresh():
+            _server_info = None  # долго работающий процесс: кэш устарел, обновим при подключении
+        if _server_info is None and _server_info_fresh():
+            try:
+                _server_info = (DsaInfo.from_file(SERVER_INFO_CACHE),
+                                SchemaInfo.from_file(SCHEMA_CACHE))
+            except Exception as e:
+                logging.getLogger(__name__).warning(
+                    f"Не удалось загрузить кэш схемы AD ({SCHEMA_CACHE}): {e}")
+        return _server_info
+
+
+def _refresh_server_info(conn: Connection):
+    """
+    Загружает сведения о сервере и схему с контроллера домена и сохраняет их в файлы.
+
+    Args:
+        conn (Connection): Установленное подключение к AD.
+    """
+    global _server_info
+    with _server_info_lock:
+        if _server_info is not None:
+            return  # уже обновлено другим потоком
+        with get_active().timer('ad_server_info'):
+            conn.server.get_info = ALL
+            conn.refresh_server_info()
+        info, schema = conn.server.info, conn.server.schema
+        if info is None or schema is None:
+            return
+        try:
+            atomic_write_text(SERVER_INFO_CACHE, info.to_json())
+            atomic_write_text(SCHEMA_CACHE, schema.to_json())
+            _server_info = (info, schema)
+            logging.getLogger(__name__).info(
+                f"Сведения о сервере и схема AD сохранены в {SERVER_INFO_CACHE}, {SCHEMA_CACHE}")
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Не удалось сохранить кэш схемы AD: {e}")
 
 
 def connect_to_ad(password: str) -> Optional[Connection]:
@@ -26,10 +182,26 @@ def connect_to_ad(password: str) -> Optional[Connection]:
     Returns:
         Optional[Connection]: Объект подключения к AD или None в случае ошибки.
     """
-    server = Server(DOMAIN_CONTROLLER, get_info=ALL)
+    global _password
+    metrics = get_active()
+    caching = bool(SERVER_INFO_CACHE and SCHEMA_CACHE)
+    server = Server(DOMAIN_CONTROLLER, get_info=NONE if caching else ALL)
+    cached = _load_server_info()
+    if cached is not None:
+        server.attach_dsa_info(cached[0])
+        server.attach_schema_info(cached[1])
     try:
-        conn = Connection(server, user=AD_USER,
-                          password=password, auto_bind=True)
+        start = time.perf_counter()
+        with metrics.timer('ad_bind'):
+            conn = Connection(server, user=AD_USER,
+                              password=password, auto_bind=True)
+        metrics.count('ad_binds')
+        _password = password
+        logging.getLogger(__name__).debug(
+            f"Подключение к AD за {time.perf_counter() - start:.3f} с "
+            f"(схема {'из кэша' if cached is not None else 'с сервера'})")
+        if caching and cached is None:
+            _refresh_server_info(conn)
         return conn
     except Exception as e:
         logging.getLogger(__name__).error(f"Ошибка подключения к AD: {e}")
@@ -38,36 +210,708 @@ def connect_to_ad(password: str) -> Optional[Connection]:
         return None
 
 
-def get_user_guid(conn: Connection, sAMAccountName: str) -> Optional[str]:
+def route_login(login: str) -> Tuple[str, str, str]:
     """
-    Получает GUID пользователя из Active Directory по логину.
+    Определяет, где искать логин.
+
+    - DOMAIN\\login — в домене DOMAIN по sAMAccountName;
+    - login@suffix — в домене с UPN-суффиксом suffix по userPrincipalName;
+    - login — в основном домене по sAMAccountName.
+
+    Логины неизвестных доменов ищутся в глобальном каталоге (если он
+    настроен), иначе — в основном домене.
 
     Args:
-        conn (Connection): Подключение к Active Directory.
-        sAMAccountName (str): Логин пользователя (sAMAccountName).
+        login (str): Логин из CSV.
 
     Returns:
-        Optional[str]: GUID пользователя или None, если пользователь не найден.
+        Tuple[str, str, str]: Ключ домена (PRIMARY, имя домена из ad.domains
+            или GLOBAL_CATALOG_KEY), атрибут поиска и значение.
+    """
+    if '\\' in login:
+        prefix, sam = login.split('\\', 1)
+        target = _DOMAINS_BY_NAME.get(prefix.lower())
+        if target is None:
+            target = GLOBAL_CATALOG_KEY if GLOBAL_CATALOG else PRIMARY
+        return target, 'sAMAccountName', sam
+    if '@' in login:
+        target = _DOMAINS_BY_SUFFIX.get(login.rsplit('@', 1)[1].lower())
+        if target is None:
+            target = GLOBAL_CATALOG_KEY if GLOBAL_CATALOG else PRIMARY
+        return target, 'userPrincipalName', login
+    return PRIMARY, 'sAMAccountName', login
+
+
+def _acquire_connection(target: str, conn: Optional[Connection]) -> Tuple[Connection, str, bool]:
+    """
+    Возвращает подключение к домену target и базу поиска.
+
+    Для основного домена используется переданное подключение conn (если оно
+    задано), в остальных случаях — подключение из пула домена (создаётся при
+    необходимости с учётными данными последнего connect_to_ad).
+
+    Returns:
+        Tuple[Connection, str, bool]: Подключение, база поиска и признак того,
+            что подключение взято из пула (его нужно вернуть _release_connection).
+
+    Raises:
+        ConnectionError: Если подключиться не удалось.
     """
+    if target == PRIMARY:
+        if conn is not None:
+            return conn, DOMAIN_DN, False
+        url, base, user = DOMAIN_CONTROLLER, DOMAIN_DN, AD_USER
+    elif target == GLOBAL_CATALOG_KEY:
+        url, base, user = GLOBAL_CATALOG, GLOBAL_CATALOG_BASE, GLOBAL_CATALOG_USER
+    else:
+        domain = _DOMAIN_CONFIG[target]
+        url, base, user = domain['domain_controller'], domain['domain_dn'], domain.get('user', AD_USER)
+    with _pools_lock:
+        pool = _pools.setdefault(target, queue.LifoQueue())
     try:
-        conn.search(
-            search_base=DOMAIN_DN,
-            search_filter=f'(sAMAccountName={sAMAccountName})',
-            attributes=['objectGUID']
-        )
-        if conn.entries:
-            guid_bytes = conn.entries[0].objectGUID.raw_values[0]
-            guid = uuid.UUID(bytes_le=guid_bytes)
-            return str(guid).upper()
+        pooled = pool.get_nowait()
+        if pooled.bound:
+            return pooled, base, True
+    except queue.Empty:
+        pass
+    if _password is None:
+        raise ConnectionError(f"нет учётных данных для подключения к {url}")
+    metrics = get_active()
+    with metrics.timer('ad_bind'):
+        pooled = Connection(Server(url, get_info=NONE), user=user,
+                            password=_password, auto_bind=True)
+    metrics.count('ad_binds')
+    return pooled, base, True
+
+
+def _release_connection(target: str, conn: Connection, pooled: bool):
+    """Возвращает подключение из пула обратно в пул."""
+    if pooled and conn.bound:
+        _pools[target].put(conn)
+
+
+def close_domain_connections():
+    """Закрывает подключения к дополнительным доменам, глобальному каталогу и асинхронное подключение."""
+    global _async_conn
+    with _async_lock:
+        if _async_conn is not None:
+            try:
+                _async_conn.unbind()
+            except Exception:
+                pass
+            _async_conn = None
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().unbind()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+
+
+def _lookup_attributes() -> List[str]:
+    """Возвращает атрибуты, запрашиваемые у пользователя."""
+    attributes = ['objectGUID']
+    if ENRICH_BLANKS:
+        attributes += list(dict.fromkeys(ENRICH_ATTRIBUTES + list(ENRICH_FIELDS.values())))
+    return attributes
+
+
+def _entry_result(entry, attributes: List[str]) -> Dict[str, str]:
+    """Преобразует запись AD в результат get_user_attributes."""
+    guid_bytes = entry.objectGUID.raw_values[0]
+    result = {'objectGUID': str(uuid.UUID(bytes_le=guid_bytes)).upper()}
+    for name in attributes[1:]:
+        if name in entry and entry[name].values:
+            value = str(entry[name].values[0]).strip()
+            if value:
+                result[name] = value
+    return result
+
+
+def _search_one(conn: Connection, target: str, attribute: str, value: str,
+                attributes: List[str]) -> Optional[Dict[str, str]]:
+    """Ищет одного пользователя в домене target; None — не найден или неоднозначен."""
+    target_conn, base, pooled = _acquire_connection(target, conn)
+    try:
+        with get_active().ldap_timer():
+            target_conn.search(
+                search_base=base,
+                search_filter=f'({attribute}={escape_filter_chars(value)})',
+                attributes=attributes
+            )
+        entries = list(target_conn.entries)
+    finally:
+        _release_connection(target, target_conn, pooled)
+    if len(entries) > 1:
+        logging.getLogger(__name__).warning(
+            f"Логин {value} неоднозначен: найдено записей {len(entries)}")
+        return None
+    return _entry_result(entries[0], attributes) if entries else None
+
+
+def get_user_attributes(conn: Connection, login: str) -> Optional[Dict[str, str]]:
+    """
+    Получает GUID пользователя и атрибуты для обогащения одним запросом к AD.
+
+    Домен выбирается по логину (route_login). При ad.enrich_blanks вместе
+    с objectGUID запрашиваются mail, mobile, displayName и атрибуты из
+    ad.enrich_fields, поэтому обогащение не требует дополнительных запросов.
+    Логин без домена, не найденный в основном домене, ищется в глобальном
+    каталоге (если он настроен). Логин, которого точно нет в фильтре Блума
+    логинов AD (prepare_login_filter), не запрашивается.
+
+    Args:
+        conn (Connection): Подключение к основному домену.
+        login (str): Логин пользователя (sAMAccountName, DOMAIN\\login или UPN).
+
+    Returns:
+        Optional[Dict[str, str]]: {'objectGUID': GUID в верхнем регистре, атрибут: значение, ...}
+            (пустые атрибуты не включаются) или None, если пользователь не найден.
+    """
+    metrics = get_active()
+    if definitely_absent(login):
+        metrics.count('ad_prefiltered')
+        return None
+    attributes = _lookup_attributes()
+    try:
+        target, attribute, value = route_login(login)
+        result = _search_one(conn, target, attribute, value, attributes)
+        if result is None and target == PRIMARY and GLOBAL_CATALOG:
+            result = _search_one(conn, GLOBAL_CATALOG_KEY, attribute, value, attributes)
+        if result is not None:
+            metrics.count('ad_found')
+            return result
+        metrics.count('ad_not_found')
     except Exception as e:
+        metrics.count('ad_errors')
         logging.getLogger(__name__).warning(
-            f"Ошибка получения GUID для пользователя {sAMAccountName}: {e}")
+            f"Ошибка получения GUID для пользователя {login}: {e}")
         logging.getLogger(__name__).debug(
             f"Детали ошибки: {traceback.format_exc()}")
         pass
     return None
 
 
+class AdaptiveBatching:
+    """
+    Размер пакета и число параллельных запросов поиска для одного домена (AIMD).
+
+    После каждого запроса, уложившегося в ad.lookup_target_latency_ms без
+    ошибок, размер пакета растёт на ad.lookup_batch_step (до MaxPageSize
+    контроллера и ad.lookup_max_batch_size), а когда размер упёрся в предел —
+    растёт на единицу число параллельных запросов (до ad.lookup_max_concurrency).
+    Медленный запрос или ошибка (в том числе sizeLimitExceeded/timeLimitExceeded)
+    вдвое уменьшают и размер, и параллельность. Состояние живёт весь процесс,
+    поэтому следующий файл начинает с уже подобранных значений.
+    """
+
+    def __init__(self, max_page_size: int):
+        """
+        Инициализирует состояние.
+
+        Args:
+            max_page_size (int): MaxPageSize контроллера домена.
+        """
+        self.max_page_size = max_page_size
+        self.max_size = max(1, min(LOOKUP_MAX_BATCH, max_page_size))
+        self.size = max(LOOKUP_MIN_BATCH, min(LOOKUP_BATCH_SIZE, self.max_size))
+        self.concurrency = 1
+        self.batches = 0
+        self.increases = 0
+        self.decreases = 0
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float, ok: bool):
+        """
+        Учитывает результат одного запроса.
+
+        Args:
+            latency (float): Длительность запроса в секундах.
+            ok (bool): Запрос выполнен без ошибок.
+        """
+        with self._lock:
+            self.batches += 1
+            if ok and latency <= LOOKUP_TARGET_LATENCY:
+                if self.size < self.max_size:
+                    self.size = min(self.max_size, self.size + LOOKUP_BATCH_STEP)
+                    self.increases += 1
+                elif self.concurrency < LOOKUP_MAX_CONCURRENCY:
+                    self.concurrency += 1
+                    self.increases += 1
+            else:
+                self.size = max(LOOKUP_MIN_BATCH, self.size // 2)
+                self.concurrency = max(1, self.concurrency // 2)
+                self.decreases += 1
+
+    def to_dict(self) -> Dict[str, int]:
+        """Возвращает текущие параметры для отчёта о метриках."""
+        with self._lock:
+            return {
+                'batch_size': self.size,
+                'concurrency': self.concurrency,
+                'max_page_size': self.max_page_size,
+                'batches': self.batches,
+                'increases': self.increases,
+                'decreases': self.decreases
+            }
+
+
+def _read_max_page_size(conn: Connection) -> int:
+    """
+    Читает MaxPageSize из политики запросов AD (lDAPAdminLimits).
+
+    Returns:
+        int: MaxPageSize или DEFAULT_MAX_PAGE_SIZE, если прочитать не удалось.
+    """
+    if MAX_PAGE_SIZE:
+        return MAX_PAGE_SIZE
+    try:
+        conn.search('', '(objectClass=*)', search_scope=BASE,
+                    attributes=['configurationNamingContext'])
+        if conn.entries and conn.entries[0]['configurationNamingContext'].values:
+            config_nc = conn.entries[0]['configurationNamingContext'].values[0]
+            conn.search(f"CN=Default Query Policy,CN=Query-Policies,CN=Directory Service,"
+                        f"CN=Windows NT,CN=Services,{config_nc}",
+                        '(objectClass=*)', search_scope=BASE, attributes=['lDAPAdminLimits'])
+            if conn.entries:
+                for limit in conn.entries[0]['lDAPAdminLimits'].values:
+                    name, _, value = str(limit).partition('=')
+                    if name.strip().lower() == 'maxpagesize' and value.strip().isdigit():
+                        return int(value)
+    except Exception as e:
+        logging.getLogger(__name__).debug(f"MaxPageSize не прочитан: {e}")
+    return DEFAULT_MAX_PAGE_SIZE
+
+
+def _batching_for(target: str, conn: Connection) -> AdaptiveBatching:
+    """Возвращает состояние AIMD домена, создавая его при первом поиске."""
+    with _batching_lock:
+        state = _batching.get(target)
+    if state is None:
+        state = AdaptiveBatching(_read_max_page_size(conn))
+        with _batching_lock:
+            state = _batching.setdefault(target, state)
+    return state
+
+
+def _search_chunk(target_conn: Connection, base: str, chunk: List[Tuple[str, str, str]],
+                  attributes: List[str]) -> Tuple[float, Optional[List]]:
+    """
+    Выполняет один пакетный запрос (|(атрибут=значение)...).
+
+    Returns:
+        Tuple[float, Optional[List]]: Длительность запроса и найденные записи
+            (None — запрос завершился ошибкой или превысил лимиты сервера).
+    """
+    terms = ''.join(f'({attribute}={escape_filter_chars(value)})' for _, attribute, value in chunk)
+    start = time.perf_counter()
+    try:
+        with get_active().ldap_timer():
+            target_conn.search(
+                search_base=base,
+                search_filter=f'(|{terms})' if len(chunk) > 1 else terms,
+                attributes=attributes
+            )
+        code = (target_conn.result or {}).get('result', 0)
+        entries = list(target_conn.entries) if code == 0 else None
+        if entries is None:
+            logging.getLogger(__name__).warning(
+                f"Пакетный поиск в AD ({len(chunk)} логинов): {target_conn.result.get('description')}")
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Ошибка пакетного поиска в AD ({len(chunk)} логинов): {e}")
+        logging.getLogger(__name__).debug(f"Детали ошибки: {traceback.format_exc()}")
+        entries = None
+    return time.perf_counter() - start, entries
+
+
+def _match_chunk(chunk: List[Tuple[str, str, str]], entries: List, attributes: List[str],
+                 results: Dict[str, Optional[Dict[str, str]]]):
+    """Сопоставляет записи ответа пакетного запроса логинам пакета и добавляет их в results."""
+    # (атрибут, значение в нижнем регистре) -> логины (DOMAIN\login и login дают один ключ)
+    keys: Dict[Tuple[str, str], List[str]] = {}
+    for login, attribute, value in chunk:
+        keys.setdefault((attribute.lower(), value.lower()), []).append(login)
+    found: Dict[str, List] = {}
+    for entry in entries:
+        for attribute in ('sAMAccountName', 'userPrincipalName'):
+            if attribute in entry and entry[attribute].values:
+                for login in keys.get((attribute.lower(), str(entry[attribute].values[0]).lower()), []):
+                    found.setdefault(login, []).append(entry)
+    for login, _, value in chunk:
+        matches = found.get(login, [])
+        if len(matches) > 1:
+            logging.getLogger(__name__).warning(
+                f"Логин {value} неоднозначен: найдено записей {len(matches)}")
+            matches = []
+        results[login.lower()] = _entry_result(matches[0], attributes) if matches else None
+
+
+def _lookup_group(conn: Connection, target: str, items: List[Tuple[str, str, str]],
+                  attributes: List[str]) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Ищет пользователей одного домена пакетами: один запрос с фильтром (|...) на пакет.
+
+    Размер пакетов и число параллельных запросов подбираются AdaptiveBatching.
+    Пакет, завершившийся ошибкой, возвращается в очередь и повторяется уже
+    меньшими пакетами; ошибка запроса по одному логину окончательная.
+
+    Args:
+        conn (Connection): Подключение к основному домену.
+        target (str): Ключ домена.
+        items (List[Tuple[str, str, str]]): Тройки (логин, атрибут поиска, значение).
+        attributes (List[str]): Запрашиваемые атрибуты.
+
+    Returns:
+        Dict[str, Optional[Dict[str, str]]]: Логин (в нижнем регистре) -> результат
+            (None — не найден). Логины, поиск которых завершился ошибкой, отсутствуют.
+    """
+    metrics = get_active()
+    logger = logging.getLogger(__name__)
+    requested = list(dict.fromkeys(attributes + ['sAMAccountName', 'userPrincipalName']))
+    results: Dict[str, Optional[Dict[str, str]]] = {}
+    try:
+        connections = [_acquire_connection(target, conn)]
+    except Exception as e:
+        metrics.count('ad_errors', len(items))
+        logger.warning(f"Ошибка подключения к домену {target or DOMAIN_DN}: {e}")
+        return results
+    state = _batching_for(target, connections[0][0])
+    pending = deque(items)
+    executor = None
+    try:
+        while pending:
+            # Волна: до state.concurrency пакетов по state.size логинов, каждый в своём подключении
+            while len(connections) < state.concurrency:
+                try:
+                    connections.append(_acquire_connection(target, None))
+                except Exception as e:
+                    logger.warning(f"Дополнительное подключение к домену {target or DOMAIN_DN}: {e}")
+                    break
+            chunks = []
+            for _ in range(min(state.concurrency, len(connections))):
+                if not pending:
+                    break
+                chunks.append([pending.popleft() for _ in range(min(state.size, len(pending)))])
+            if len(chunks) == 1:
+                outcomes = [_search_chunk(connections[0][0], connections[0][1], chunks[0], requested)]
+            else:
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=LOOKUP_MAX_CONCURRENCY,
+                                                  thread_name_prefix="ad-batch")
+                outcomes = list(executor.map(
+                    lambda args: _search_chunk(args[0][0], args[0][1], args[1], requested),
+                    zip(connections, chunks)))
+
+            for chunk, (latency, entries) in zip(chunks, outcomes):
+                state.observe(latency, entries is not None)
+                if entries is None:
+                    if len(chunk) > 1:
+                        pending.extendleft(reversed(chunk))  # повтор меньшими пакетами
+                    else:
+                        metrics.count('ad_errors')
+                    continue
+                _match_chunk(chunk, entries, attributes, results)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        for target_conn, _, pooled in connections:
+            _release_connection(target, target_conn, pooled)
+        label = {PRIMARY: 'primary', GLOBAL_CATALOG_KEY: 'global_catalog'}.get(target, target)
+        metrics.set_tuning(f"ad_lookup:{label}", state.to_dict())
+    return results
+
+
+def lookup_users(conn: Connection, logins: Iterable[str]) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Ищет в AD сразу много логинов.
+
+    Логины группируются по доменам (route_login); каждый домен опрашивается
+    в своём потоке пакетами с фильтром (|...), размер и параллельность которых
+    подбираются по задержке ответов (AdaptiveBatching). Логины без
+    домена, не найденные в основном домене, затем ищутся в глобальном каталоге.
+    Логины, которых точно нет в фильтре Блума логинов AD, не запрашиваются.
+
+    Args:
+        conn (Connection): Подключение к основному домену (используется только
+            потоком основного домена).
+        logins (Iterable[str]): Логины.
+
+    Returns:
+        Dict[str, Optional[Dict[str, str]]]: Логин (в нижнем регистре) -> результат
+            get_user_attributes (None — не найден). Логины, поиск которых
+            завершился ошибкой, отсутствуют: их можно запросить по одному.
+    """
+    metrics = get_active()
+    attributes = _lookup_attributes()
+    groups: Dict[str, List[Tuple[str, str, str]]] = {}
+    # Логины, которых точно нет в AD по фильтру Блума, не запрашиваются
+    absent: Dict[str, Optional[Dict[str, str]]] = {}
+    for login in dict.fromkeys(logins):
+        if definitely_absent(login):
+            absent[login.lower()] = None
+            continue
+        target, attribute, value = route_login(login)
+        groups.setdefault(target, []).append((login, attribute, value))
+    if absent:
+        metrics.count('ad_prefiltered', len(absent))
+    if not groups:
+        return absent
+
+    results: Dict[str, Optional[Dict[str, str]]] = {}
+    if len(groups) == 1:
+        (target, items), = groups.items()
+        results.update(_lookup_group(conn, target, items, attributes))
+    else:
+        with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="ad-domain") as executor:
+            futures = [executor.submit(_lookup_group, conn, target, items, attributes)
+                       for target, items in groups.items()]
+            for future in futures:
+                results.update(future.result())
+
+    # Логины без домена, которых нет в основном домене, — в глобальном каталоге
+    if GLOBAL_CATALOG and PRIMARY in groups:
+        missing = [item for item in groups[PRIMARY]
+                   if item[0].lower() in results and results[item[0].lower()] is None]
+        if missing:
+            results.update(_lookup_group(conn, GLOBAL_CATALOG_KEY, missing, attributes))
+
+    for result in results.values():
+        metrics.count('ad_found' if result else 'ad_not_found')
+    results.update(absent)
+    return results
+
+
+def _async_connection() -> Connection:
+    """
+    Возвращает подключение к основному домену со стратегией ASYNC.
+
+    Подключение создаётся при первом вызове с учётными данными последнего
+    connect_to_ad и используется всеми последующими асинхронными поисками.
+
+    Raises:
+        ConnectionError: Если учётных данных нет.
+    """
+    global _async_conn
+    with _async_lock:
+        if _async_conn is None or not _async_conn.bound:
+            if _password is None:
+                raise ConnectionError(f"нет учётных данных для подключения к {DOMAIN_CONTROLLER}")
+            metrics = get_active()
+            with metrics.timer('ad_bind'):
+                _async_conn = Connection(Server(DOMAIN_CONTROLLER, get_info=NONE), user=AD_USER,
+                                         password=_password, client_strategy=ASYNC, auto_bind=True)
+            metrics.count('ad_binds')
+        return _async_conn
+
+
+class _ResponseEntry:
+    """
+    Запись из ответа асинхронного поиска (словарь ldap3) с интерфейсом
+    ldap3.abstract.Entry в объёме, нужном _entry_result и _match_chunk.
+
+    Значения берутся из raw_attributes, поэтому не зависят от наличия схемы.
+    """
+
+    def __init__(self, response: Dict):
+        self._raw = {name.lower(): values for name, values in response.get('raw_attributes', {}).items()}
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._raw
+
+    def __getitem__(self, name: str) -> SimpleNamespace:
+        raw = self._raw.get(name.lower(), [])
+        return SimpleNamespace(
+            raw_values=raw,
+            values=[value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+                    for value in raw])
+
+    @property
+    def objectGUID(self) -> SimpleNamespace:
+        return self['objectGUID']
+
+
+async def _search_chunk_async(target_conn: Connection, base: str, chunk: List[Tuple[str, str, str]],
+                              attributes: List[str], limit: asyncio.Semaphore) -> Tuple[float, Optional[List]]:
+    """
+    Асинхронный вариант _search_chunk: запрос отправляется сразу, ответ
+    ожидается в пуле потоков цикла событий (get_response блокирующий).
+
+    Returns:
+        Tuple[float, Optional[List]]: Длительность запроса и найденные записи
+            (None — запрос завершился ошибкой или превысил лимиты сервера).
+    """
+    terms = ''.join(f'({attribute}={escape_filter_chars(value)})' for _, attribute, value in chunk)
+    loop = asyncio.get_running_loop()
+    async with limit:
+        start = time.perf_counter()
+        try:
+            with get_active().ldap_timer():
+                message_id = target_conn.search(
+                    search_base=base,
+                    search_filter=f'(|{terms})' if len(chunk) > 1 else terms,
+                    attributes=attributes
+                )
+                response, result = await loop.run_in_executor(None, target_conn.get_response, message_id)
+            code = (result or {}).get('result', 0)
+            entries = [_ResponseEntry(item) for item in response or []
+                       if item.get('type') == 'searchResEntry'] if code == 0 else None
+            if entries is None:
+                logging.getLogger(__name__).warning(
+                    f"Пакетный поиск в AD ({len(chunk)} логинов): {result.get('description')}")
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Ошибка пакетного поиска в AD ({len(chunk)} логинов): {e}")
+            logging.getLogger(__name__).debug(f"Детали ошибки: {traceback.format_exc()}")
+            entries = None
+        return time.perf_counter() - start, entries
+
+
+async def _lookup_group_async(target_conn: Connection, items: List[Tuple[str, str, str]],
+                              attributes: List[str]) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Ищет пользователей основного домена пакетами через одно подключение ASYNC.
+
+    Все пакеты отправляются сразу (не более ad.async_lookup_concurrency
+    запросов без ответа), размер пакетов берётся из общего с lookup_users
+    состояния AdaptiveBatching. Пакет, завершившийся ошибкой, повторяется
+    меньшими пакетами.
+
+    Args:
+        target_conn (Connection): Подключение со стратегией ASYNC.
+        items (List[Tuple[str, str, str]]): Тройки (логин, атрибут поиска, значение).
+        attributes (List[str]): Запрашиваемые атрибуты.
+
+    Returns:
+        Dict[str, Optional[Dict[str, str]]]: Как у _lookup_group.
+    """
+    metrics = get_active()
+    requested = list(dict.fromkeys(attributes + ['sAMAccountName', 'userPrincipalName']))
+    with _batching_lock:
+        state = _batching.get(PRIMARY)
+        if state is None:
+            state = _batching[PRIMARY] = AdaptiveBatching(MAX_PAGE_SIZE or DEFAULT_MAX_PAGE_SIZE)
+    limit = asyncio.Semaphore(max(1, ASYNC_LOOKUP_CONCURRENCY))
+    results: Dict[str, Optional[Dict[str, str]]] = {}
+
+    async def search(chunk: List[Tuple[str, str, str]]):
+        latency, entries = await _search_chunk_async(target_conn, DOMAIN_DN, chunk, requested, limit)
+        state.observe(latency, entries is not None)
+        if entries is not None:
+            _match_chunk(chunk, entries, attributes, results)
+        elif len(chunk) == 1:
+            metrics.count('ad_errors')
+        else:
+            size = max(1, min(state.size, len(chunk) // 2))
+            await asyncio.gather(*(search(chunk[i:i + size]) for i in range(0, len(chunk), size)))
+
+    size = state.size
+    try:
+        await asyncio.gather(*(search(items[i:i + size]) for i in range(0, len(items), size)))
+    finally:
+        metrics.set_tuning('ad_lookup:primary', state.to_dict())
+    return results
+
+
+async def lookup_users_async(logins: Iterable[str],
+                             conn: Optional[Connection] = None) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Асинхронный вариант lookup_users для оркестратора asyncio.
+
+    Логины основного домена ищутся через подключение со стратегией ldap3
+    ASYNC: пакетные запросы отправляются без ожидания ответов на
+    предыдущие. Логины других доменов и поиск в глобальном каталоге
+    выполняются обычным lookup_users в пуле потоков цикла событий,
+    одновременно с основным доменом.
+
+    Args:
+        logins (Iterable[str]): Логины.
+        conn (Optional[Connection]): Подключение со стратегией ASYNC; None —
+            общее подключение модуля (создаётся при первом вызове).
+
+    Returns:
+        Dict[str, Optional[Dict[str, str]]]: Как у lookup_users.
+    """
+    metrics = get_active()
+    attributes = _lookup_attributes()
+    primary: List[Tuple[str, str, str]] = []
+    others: List[str] = []
+    absent: Dict[str, Optional[Dict[str, str]]] = {}
+    for login in dict.fromkeys(logins):
+        if definitely_absent(login):
+            absent[login.lower()] = None
+            continue
+        target, attribute, value = route_login(login)
+        if target == PRIMARY:
+            primary.append((login, attribute, value))
+        else:
+            others.append(login)
+    if absent:
+        metrics.count('ad_prefiltered', len(absent))
+
+    loop = asyncio.get_running_loop()
+    other_results = loop.run_in_executor(None, lookup_users, None, others) if others else None
+    results: Dict[str, Optional[Dict[str, str]]] = {}
+    if primary:
+        try:
+            target_conn = conn if conn is not None else _async_connection()
+        except Exception as e:
+            metrics.count('ad_errors', len(primary))
+            logging.getLogger(__name__).warning(f"Ошибка подключения к домену {DOMAIN_DN}: {e}")
+        else:
+            results = await _lookup_group_async(target_conn, primary, attributes)
+        # Логины без домена, которых нет в основном домене, — в глобальном каталоге
+        missing = [item for item in primary
+                   if item[0].lower() in results and results[item[0].lower()] is None]
+        if GLOBAL_CATALOG and missing:
+            results.update(await loop.run_in_executor(
+                None, _lookup_group, None, GLOBAL_CATALOG_KEY, missing, attributes))
+        for result in results.values():
+            metrics.count('ad_found' if result else 'ad_not_found')
+    if other_results is not None:
+        results.update(await other_results)
+    results.update(absent)
+    return results
+
+
+def get_user_guid(conn: Connection, sAMAccountName: str) -> Optional[str]:
+    """
+    Получает GUID пользователя из Active Directory по логину.
+
+    Args:
+        conn (Connection): Подключение к Active Directory.
+        sAMAccountName (str): Логин пользователя (sAMAccountName).
+
+    Returns:
+        Optional[str]: GUID пользователя или None, если пользователь не найден.
+    """
+    attributes = get_user_attributes(conn, sAMAccountName)
+    return attributes['objectGUID'] if attributes else None
+
+
+def enrich_user(user: Dict, attributes: Dict[str, str]) -> int:
+    """
+    Заполняет пустые поля пользователя значениями атрибутов AD (ad.enrich_fields).
+
+    Args:
+        user (Dict): Данные пользователя (результат process_user_row), изменяются на месте.
+        attributes (Dict[str, str]): Атрибуты из get_user_attributes.
+
+    Returns:
+        int: Число заполненных полей.
+    """
+    filled = 0
+    for field, attribute in ENRICH_FIELDS.items():
+        value = attributes.get(attribute)
+        if value and not (user.get(field) or '').strip():
+            user[field] = value
+            filled += 1
+    return filled
+
+
 def get_domain_guid(conn: Connection) -> Optional[str]:
     """
     Получает GUID домена из Active Directory.
@@ -79,11 +923,12 @@ def get_domain_guid(conn: Connection) -> Optional[str]:
         Optional[str]: GUID домена или None в случае ошибки.
     """
     try:
-        conn.search(
-            search_base=DOMAIN_DN,
-            search_filter='(objectClass=domainDNS)',
-            attributes=['objectGUID']
-        )
+        with get_active().ldap_timer():
+            conn.search(
+                search_base=DOMAIN_DN,
+                search_filter='(objectClass=domainDNS)',
+                attributes=['objectGUID']
+            )
         if conn.entries:
             guid_bytes = conn.entries[0].objectGUID.raw_values[0]
             return str(uuid.UUID(bytes_le=guid_bytes)).upper()
@@ -92,3 +937,288 @@ def get_domain_guid(conn: Connection) -> Optional[str]:
         logging.getLogger(__name__).debug(
             f"Детали ошибки: {traceback.format_exc()}")
         return None
+
+
+def _changed_users(conn: Connection, usn: int, show_deleted: bool,
+                   base: str = DOMAIN_DN) -> List[Tuple[str, str, str, bool]]:
+    """
+    Возвращает пользователей, изменённых после usn.
+
+    Args:
+        conn (Connection): Подключение к контроллеру домена (или глобальному каталогу).
+        usn (int): Метка uSNChanged предыдущей синхронизации.
+        show_deleted (bool): Запрашивать удалённые объекты (контрол Show Deleted).
+        base (str): База поиска.
+
+    Returns:
+        List[Tuple[str, str, str, bool]]: (GUID, sAMAccountName, userPrincipalName, удалён).
+
+    Raises:
+        ldap3.core.exceptions.LDAPException: Если поиск завершился ошибкой.
+    """
+    # objectCategory у удалённых объектов очищается, поэтому отбор по objectClass
+    search_filter = f'(&(objectClass=user)(!(objectClass=computer))(uSNChanged>={usn + 1}))'
+    controls = [(SHOW_DELETED_OID, True, None)] if show_deleted else None
+    changed = []
+    with get_active().ldap_timer():
+        for item in conn.extend.standard.paged_search(
+                search_base=base, search_filter=search_filter,
+                attributes=['objectGUID', 'sAMAccountName', 'userPrincipalName', 'isDeleted'],
+                controls=controls, paged_size=MAX_PAGE_SIZE or DEFAULT_MAX_PAGE_SIZE, generator=True):
+            if item.get('type') != 'searchResEntry':
+                continue
+            raw = item['raw_attributes']
+            if not raw.get('objectGUID'):
+                continue
+            guid = str(uuid.UUID(bytes_le=raw['objectGUID'][0])).upper()
+            sam = raw['sAMAccountName'][0].decode('utf-8') if raw.get('sAMAccountName') else ''
+            upn = raw['userPrincipalName'][0].decode('utf-8') if raw.get('userPrincipalName') else ''
+            deleted = bool(raw.get('isDeleted')) and raw['isDeleted'][0].upper() == b'TRUE'
+            changed.append((guid, sam, upn, deleted))
+    code = (conn.result or {}).get('result', 0)
+    if code != 0:
+        raise ldap3.core.exceptions.LDAPException(
+            f"поиск изменений завершился ошибкой: {(conn.result or {}).get('description')}")
+    return changed
+
+
+def _deleted_objects_visible(conn: Connection, base: str = DOMAIN_DN) -> bool:
+    """
+    Проверяет, видит ли учётная запись удалённые объекты домена.
+
+    Контрол Show Deleted без нужных прав не вызывает ошибку: удалённые
+    объекты просто не возвращаются. Поэтому видимость проверяется чтением
+    контейнера CN=Deleted Objects, который доступен только с этими правами.
+
+    Args:
+        conn (Connection): Подключение к контроллеру домена.
+        base (str): DN домена.
+
+    Returns:
+        bool: True, если контейнер удалённых объектов прочитан.
+    """
+    try:
+        with get_active().ldap_timer():
+            conn.search(f'CN=Deleted Objects,{base}', '(objectClass=*)', search_scope=BASE,
+                        attributes=['objectClass'], controls=[(SHOW_DELETED_OID, True, None)])
+        return (conn.result or {}).get('result', 0) == 0 and bool(conn.entries)
+    except Exception as e:
+        logging.getLogger(__name__).debug(f"Контейнер удалённых объектов не прочитан: {e}")
+        return False
+
+
+def sync_guid_cache(conn: Connection, cache: GuidCache) -> Optional[int]:
+    """
+    Инкрементально синхронизирует постоянный кэш GUID с основным доменом.
+
+    Запрашиваются только пользователи с uSNChanged выше метки предыдущей
+    синхронизации (highestCommittedUSN контроллера домена). Записи
+    переименованных и удалённых пользователей удаляются, изменённые
+    пользователи добавляются в кэш по sAMAccountName, а записи основного
+    домена, проверенные не раньше предыдущей синхронизации, считаются
+    проверенными сейчас — поэтому кэш остаётся свежим без полного обновления.
+    Продление выполняется, только если учётная запись видит удалённые
+    объекты (_deleted_objects_visible): иначе удаления не обнаружить, и
+    записи устаревают по cache.ttl_hours.
+
+    Метка действительна только для одного контроллера домена: если
+    синхронизации ещё не было или ответил другой контроллер, сохраняется
+    новая метка, а записи остаются со своим временем проверки (cache.ttl_hours).
+
+    Args:
+        conn (Connection): Подключение к основному домену.
+        cache (GuidCache): Постоянный кэш GUID.
+
+    Returns:
+        Optional[int]: Число изменённых пользователей или None, если
+            синхронизация не выполнялась (нет метки или ошибка).
+    """
+    logger = logging.getLogger(__name__)
+    metrics = get_active()
+    try:
+        with metrics.timer('cache_sync'):
+            server, highest_usn = _read_usn_state(conn)
+            synced_at = time.time()
+            previous = cache.sync
+            if previous.get('server') != server or 'highest_usn' not in previous:
+                cache.set_sync(server, highest_usn, synced_at)
+                logger.info(f"Кэш GUID: метка синхронизации uSNChanged={highest_usn} ({server})")
+                return None
+
+            show_deleted = _deleted_objects_visible(conn)
+            if not show_deleted:
+                logger.info("Кэш GUID: удалённые объекты не видны, записи не продлеваются "
+                            "(устаревают по cache.ttl_hours)")
+            try:
+                changed = _changed_users(conn, previous['highest_usn'], show_deleted)
+            except Exception as e:
+                if not show_deleted:
+                    raise
+                # Без прав на удалённые объекты удаления не видны: записи не продлеваются
+                logger.warning(f"Кэш GUID: удалённые объекты недоступны ({e}), "
+                               f"синхронизация без них")
+                show_deleted = False
+                changed = _changed_users(conn, previous['highest_usn'], show_deleted)
+
+            by_guid: Dict[str, List[str]] = {}
+            for login, (guid, _) in cache.entries.items():
+                by_guid.setdefault(guid, []).append(login)
+            refreshed = set()
+            for guid, sam, upn, deleted in changed:
+                for login in by_guid.get(guid, []):
+                    target, attribute, value = route_login(login)
+                    if target != PRIMARY:
+                        continue
+                    current = upn if attribute == 'userPrincipalName' else sam
+                    if deleted or value.lower() != current.lower():
+                        cache.remove(login)  # пользователь удалён или переименован
+                    else:
+                        refreshed.add(login)
+                if sam and not deleted:
+                    cache.put(sam, guid, synced_at)
+                    refreshed.add(sam.lower())
+            if show_deleted:
+                since = previous.get('synced_at', synced_at)
+                for login, (guid, checked_at) in list(cache.entries.items()):
+                    if checked_at >= since and route_login(login)[0] == PRIMARY:
+                        refreshed.add(login)
+            for login in refreshed:
+                if login in cache.entries:
+                    cache.put(login, cache.entries[login][0], synced_at)
+            cache.set_sync(server, highest_usn, synced_at)
+        metrics.count('cache_sync_changed', len(changed))
+        logger.info(f"Кэш GUID синхронизирован: изменённых пользователей {len(changed)}, "
+                    f"uSNChanged {previous['highest_usn']} → {highest_usn}")
+        return len(changed)
+    except Exception as e:
+        logger.warning(f"Ошибка инкрементальной синхронизации кэша GUID: {e}")
+        logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+        return None
+
+
+def _read_usn_state(conn: Connection) -> Tuple[str, int]:
+    """
+    Читает из rootDSE контроллер домена (dsServiceName) и его highestCommittedUSN.
+
+    Returns:
+        Tuple[str, int]: dsServiceName и highestCommittedUSN.
+    """
+    with get_active().ldap_timer():
+        conn.search('', '(objectClass=*)', search_scope=BASE,
+                    attributes=['highestCommittedUSN', 'dsServiceName'])
+    root = conn.entries[0]
+    return str(root['dsServiceName'].values[0]), int(root['highestCommittedUSN'].values[0])
+
+
+def _all_logins(conn: Connection, base: str) -> List[str]:
+    """
+    Возвращает sAMAccountName всех пользователей под base (постраничный поиск).
+
+    Raises:
+        ldap3.core.exceptions.LDAPException: Если поиск завершился ошибкой.
+    """
+    logins = []
+    with get_active().ldap_timer():
+        for item in conn.extend.standard.paged_search(
+                search_base=base, search_filter='(&(objectClass=user)(!(objectClass=computer)))',
+                attributes=['sAMAccountName'], paged_size=MAX_PAGE_SIZE or DEFAULT_MAX_PAGE_SIZE,
+                generator=True):
+            raw = item.get('raw_attributes') or {}
+            if item.get('type') == 'searchResEntry' and raw.get('sAMAccountName'):
+                logins.append(raw['sAMAccountName'][0].decode('utf-8'))
+    code = (conn.result or {}).get('result', 0)
+    if code != 0:
+        raise ldap3.core.exceptions.LDAPException(
+            f"поиск пользователей завершился ошибкой: {(conn.result or {}).get('description')}")
+    return logins
+
+
+def prepare_login_filter(conn: Connection) -> Optional[BloomFilter]:
+    """
+    Загружает фильтр Блума логинов AD, обновляет его и делает активным.
+
+    Фильтр дополняется инкрементально (пользователи с uSNChanged выше меток
+    предыдущей синхронизации) и строится заново по всем пользователям, если
+    его нет, он старше prefilter.rebuild_hours, переполнен или ответил
+    другой контроллер домена. Источники — основной домен и глобальный
+    каталог (если он настроен, так как в нём ищутся логины, не найденные
+    в основном домене). Если обновить фильтр не удалось, он не используется.
+
+    Args:
+        conn (Connection): Подключение к основному домену.
+
+    Returns:
+        Optional[BloomFilter]: Активный фильтр или None.
+    """
+    global _login_filter
+    logger = logging.getLogger(__name__)
+    metrics = get_active()
+    sources = [PRIMARY] + ([GLOBAL_CATALOG_KEY] if GLOBAL_CATALOG else [])
+    connections = []
+    bloom = None
+    try:
+        with metrics.timer('prefilter_sync'):
+            for source in sources:
+                connections.append((source,) + _acquire_connection(source, conn))
+            states = {source: _read_usn_state(target_conn) for source, target_conn, _, _ in connections}
+
+            bloom = BloomFilter.load(PREFILTER_PATH)
+            rebuild = (bloom is None or bloom.saturated
+                       or time.time() - bloom.built_at > PREFILTER_REBUILD_HOURS * 3600
+                       or any(bloom.marks.get(source, [None])[0] != states[source][0] for source in sources))
+            added = 0
+            if not rebuild:
+                try:
+                    for source, target_conn, base, _ in connections:
+                        for _, sam, _, deleted in _changed_users(
+                                target_conn, bloom.marks[source][1], False, base):
+                            if sam and not deleted:
+                                bloom.add(sam)
+                                added += 1
+                except Exception as e:
+                    logger.warning(f"Инкрементальное обновление фильтра логинов не удалось ({e}), "
+                                   f"фильтр строится заново")
+                    rebuild = True
+            if rebuild:
+                logins = []
+                for source, target_conn, base, _ in connections:
+                    logins.extend(_all_logins(target_conn, base))
+                # Запас ёмкости на пользователей, добавляемых инкрементально до следующего построения
+                bloom = BloomFilter(int(len(logins) * 1.25) + 1000, PREFILTER_FP_RATE)
+                for login in logins:
+                    bloom.add(login)
+                added = len(logins)
+            bloom.marks = {source: list(states[source]) for source in sources}
+            bloom.synced_at = time.time()
+            bloom.save(PREFILTER_PATH)
+        logger.info(f"Фильтр логинов AD {'построен' if rebuild else 'обновлён'}: "
+                    f"добавлено {added}, всего {len(bloom)}, бит {bloom.bits}, хэшей {bloom.hashes}")
+    except Exception as e:
+        logger.warning(f"Фильтр логинов AD не используется: {e}")
+        logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+        bloom = None
+    finally:
+        for source, target_conn, _, pooled in connections:
+            _release_connection(source, target_conn, pooled)
+    _login_filter = bloom
+    return bloom
+
+
+def definitely_absent(login: str) -> bool:
+    """
+    Проверяет по активному фильтру Блума, что логина точно нет в AD.
+
+    Проверяются только логины без домена (основной домен и глобальный
+    каталог); фильтр, синхронизированный раньше prefilter.max_age_minutes,
+    не используется.
+
+    Args:
+        login (str): Логин из CSV.
+
+    Returns:
+        bool: True, если искать логин в AD не нужно.
+    """
+    bloom = _login_filter
+    if bloom is None or '\\' in login or '@' in login or not bloom.is_fresh():
+        return False
+    return login not in bloom
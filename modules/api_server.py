@@ -0,0 +1,386 @@
+# api_server.py
+"""
+Модуль локального HTTP-сервиса для преобразования CSV в XML Access/Energy.
+
+Сервис работает в одном процессе, поэтому конфигурация, пул подключений
+к AD, кэш GUID и модули генерации XML загружаются один раз и остаются
+«тёплыми» между запросами. Число одновременно обрабатываемых запросов
+ограничено: лишние запросы сразу получают 503 с заголовком Retry-After;
+их тело не читается, поэтому память ограничена max_concurrent телами запросов.
+
+Эндпоинты:
+- POST /convert         — тело: CSV; ответ: JSON с обоими XML и отчётами;
+- POST /convert/access  — тело: CSV; ответ: XML Access;
+- POST /convert/energy  — тело: CSV; ответ: XML Energy;
+- GET  /health          — состояние сервиса.
+
+Параметры запроса (query string): name — имя CSV-файла для логов и
+детерминированных GUID (по умолчанию request.csv), domain_guid — GUID домена
+для режима без AD (по умолчанию указанный при запуске сервиса).
+"""
+import json
+import queue
+import logging
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, List, Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .ad_operations import connect_to_ad, close_domain_connections
+from .csv_processing import read_csv_bytes, process_rows
+from .xml_generation import generate_access_xml, generate_energy_xml
+from .duplicate_index import DuplicateIndex, DEDUP_ENABLED
+from .guid_cache import GuidCache
+from .guid_table import GuidTable, TABLE_ENABLED, TABLE_PATH
+from .metrics import get_active
+from .output_writer import sync_directories
+from .validation import validate_rows, VALIDATION_ENABLED
+
+API_HOST = CONFIG.get('api', {}).get('host', '127.0.0.1')
+"""str: Адрес, на котором слушает сервис."""
+
+API_PORT = CONFIG.get('api', {}).get('port', 8080)
+"""int: Порт сервиса."""
+
+API_MAX_CONCURRENT = CONFIG.get('api', {}).get('max_concurrent', 4)
+"""int: Максимальное число одновременно обрабатываемых запросов (и подключений к AD)."""
+
+API_MAX_BODY_MB = CONFIG.get('api', {}).get('max_body_mb', 50)
+"""float: Максимальный размер тела запроса в мегабайтах."""
+
+AD_ENABLED = CONFIG['ad']['enabled']
+"""bool: Флаг включения/выключения работы с Active Directory."""
+
+RETRY_AFTER_SEC = 1
+"""int: Значение заголовка Retry-After для ответов 503."""
+
+
+class ApiError(Exception):
+    """Ошибка обработки запроса с HTTP-статусом."""
+
+    def __init__(self, status: int, message: str, details: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}
+
+
+class ConverterService:
+    """
+    Состояние сервиса, общее для всех запросов.
+
+    Подключения к AD берутся из пула и возвращаются в него после запроса;
+    пул создаётся лениво и не превышает max_concurrent подключений.
+    Найденные в AD GUID накапливаются в кэше и предзагружаются в индекс
+    дубликатов каждого следующего запроса. Записи кэша на момент запуска
+    сервиса читаются из общей таблицы GuidTable, в индекс запроса копируются
+    только записи, добавленные после её построения.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        ad_guid: str,
+        password: Optional[str] = None,
+        guid_cache: Optional[GuidCache] = None,
+        max_concurrent: int = API_MAX_CONCURRENT
+    ):
+        """
+        Инициализирует сервис.
+
+        Args:
+            mode (str): Режим работы ('y' - с AD, 'n' - без AD).
+            ad_guid (str): GUID домена (из AD или указанный вручную).
+            password (Optional[str]): Пароль AD для подключений пула.
+            guid_cache (Optional[GuidCache]): Кэш GUID (по умолчанию — только в памяти).
+            max_concurrent (int): Максимальное число одновременных запросов.
+        """
+        self.mode = mode
+        # Как и при обработке файлов: режим 'y' без ad.enabled работает без AD
+        self.use_ad = mode == 'y' and AD_ENABLED
+        self.ad_guid = ad_guid
+        self.password = password
+        self.guid_cache = guid_cache if guid_cache is not None else GuidCache('')
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.requests_total = 0
+        self.requests_rejected = 0
+        self.guid_table: Optional[GuidTable] = None
+        if TABLE_ENABLED and self.use_ad:
+            try:
+                self.guid_table = GuidTable.from_cache(
+                    self.guid_cache, TABLE_PATH if self.guid_cache.path else '')
+            except Exception as e:
+                self.logger.warning(f"Не удалось построить таблицу GUID {TABLE_PATH}: {e}")
+
+    def add_connection(self, conn):
+        """
+        Добавляет готовое подключение к AD в пул.
+
+        Args:
+            conn: Подключение ldap3.
+        """
+        self._pool.put(conn)
+
+    def _acquire_connection(self):
+        """Берёт подключение к AD из пула или создаёт новое."""
+        try:
+            conn = self._pool.get_nowait()
+            if conn.bound:
+                return conn
+        except queue.Empty:
+            pass
+        conn = connect_to_ad(self.password)
+        if conn is None:
+            raise ApiError(502, "Не удалось подключиться к AD")
+        return conn
+
+    def _release_connection(self, conn):
+        """Возвращает подключение в пул."""
+        if conn is not None and conn.bound:
+            self._pool.put(conn)
+
+    def try_acquire_slot(self) -> bool:
+        """Занимает слот обработки; False, если все слоты заняты."""
+        acquired = self._slots.acquire(blocking=False)
+        with self._lock:
+            if acquired:
+                self.requests_total += 1
+            else:
+                self.requests_rejected += 1
+        return acquired
+
+    def release_slot(self):
+        """Освобождает слот обработки."""
+        self._slots.release()
+
+    def convert(self, data: bytes, name: str = 'request.csv',
+                domain_guid: Optional[str] = None) -> Dict:
+        """
+        Преобразует CSV в XML Access и Energy.
+
+        Args:
+            data (bytes): Содержимое CSV.
+            name (str): Имя CSV-файла (для логов и детерминированных GUID).
+            domain_guid (Optional[str]): GUID домена для режима без AD.
+
+        Returns:
+            Dict: access_xml, energy_xml, число пользователей, списки
+                ненайденных в AD и дубликатов; при ошибках проверки
+                (validation.on_error = "report") — также отчёт validation.
+
+        Raises:
+            ApiError: Если CSV не удалось прочитать, он не прошёл проверку
+                (422, отчёт в поле validation) или AD недоступен.
+        """
+        use_ad = self.use_ad
+        ad_guid = self.ad_guid if use_ad else (domain_guid or self.ad_guid)
+        if not ad_guid:
+            raise ApiError(400, "Не задан GUID домена (параметр domain_guid)")
+        ad_guid = ad_guid.strip().upper()
+
+        try:
+            rows = read_csv_bytes(data)
+        except Exception as e:
+            raise ApiError(400, f"Не удалось прочитать CSV: {e}")
+        metrics = get_active()
+        metrics.count('rows_read', len(rows))
+
+        # Проверка структуры до поиска в AD и генерации XML
+        validator = None
+        if VALIDATION_ENABLED and rows:
+            with metrics.timer('validation'):
+                validator = validate_rows(rows, name)
+            if validator.error_count:
+                metrics.count('validation_errors', validator.error_count)
+                if validator.failed:
+                    self.logger.error(f"❌ Файл {name} не прошёл проверку "
+                                      f"(ошибок: {validator.error_count}), обработка остановлена")
+                    raise ApiError(422, f"Файл не прошёл проверку (ошибок: {validator.error_count})",
+                                   {'validation': validator.to_dict()})
+                self.logger.warning(f"⚠️ Ошибок проверки {name}: {validator.error_count}")
+
+        dup_index = DuplicateIndex() if DEDUP_ENABLED else None
+        if dup_index is not None and use_ad:
+            with self._lock:
+                if self.guid_table is not None:
+                    dup_index.attach_guid_table(self.guid_table)
+                    dup_index.preload_ad_guids(self.guid_cache.fresh_items(since=self.guid_table.built_at))
+                else:
+                    dup_index.preload_ad_guids(self.guid_cache.fresh_items())
+
+        not_found_in_ad: List[Dict] = []
+        conn = self._acquire_connection() if use_ad else None
+        try:
+            with metrics.timer('row_processing'):
+                _, users_data = process_rows(
+                    rows, name, self.mode, conn, ad_guid, not_found_in_ad, self.logger,
+                    dup_index)
+        finally:
+            self._release_connection(conn)
+        metrics.count('users_processed', len(users_data))
+
+        if dup_index is not None and use_ad:
+            with self._lock:
+                for login, guid in dup_index.resolved_ad_guids().items():
+                    self.guid_cache.put(login, guid)
+
+        result = {
+            'access_xml': generate_access_xml(ad_guid, users_data),
+            'energy_xml': generate_energy_xml(users_data),
+            'users': len(users_data),
+            'not_found_in_ad': not_found_in_ad,
+            'duplicates': dup_index.records if dup_index is not None else []
+        }
+        if validator is not None and validator.error_count:
+            result['validation'] = validator.to_dict()
+        return result
+
+    def save_cache(self):
+        """Сохраняет кэш GUID (если он постоянный)."""
+        with self._lock:
+            try:
+                self.guid_cache.save()
+                sync_directories()
+            except Exception as e:
+                self.logger.warning(f"Не удалось сохранить кэш GUID {self.guid_cache.path}: {e}")
+
+    def close(self):
+        """Закрывает подключения пула и сохраняет кэш GUID."""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.unbind()
+            except Exception:
+                pass
+        close_domain_connections()
+        self.save_cache()
+        if self.guid_table is not None:
+            self.guid_table.close()
+            self.guid_table = None
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов сервиса."""
+
+    server_version = "UserCreatorAPI/1.0"
+
+    @property
+    def service(self) -> ConverterService:
+        return self.server.service
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict] = None):
+        """Отправляет ответ."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict, headers: Optional[Dict] = None):
+        """Отправляет JSON-ответ."""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._send(status, body, 'application/json; charset=utf-8', headers)
+
+    def _reject(self, status: int, message: str, headers: Optional[Dict] = None):
+        """Отвечает ошибкой, не читая тело запроса, и закрывает соединение."""
+        self.close_connection = True
+        self._send_json(status, {'error': message}, {**(headers or {}), 'Connection': 'close'})
+
+    def do_GET(self):
+        """Отдаёт состояние сервиса."""
+        if urlsplit(self.path).path != '/health':
+            self._send_json(404, {'error': 'Не найдено'})
+            return
+        service = self.service
+        self._send_json(200, {
+            'status': 'ok',
+            'mode': service.mode,
+            'max_concurrent': service.max_concurrent,
+            'requests_total': service.requests_total,
+            'requests_rejected': service.requests_rejected,
+            'guid_cache_entries': len(service.guid_cache)
+        })
+
+    def do_POST(self):
+        """Преобразует CSV из тела запроса."""
+        url = urlsplit(self.path)
+        if url.path not in ('/convert', '/convert/access', '/convert/energy'):
+            self._send_json(404, {'error': 'Не найдено'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self._reject(400, 'Некорректный заголовок Content-Length')
+            return
+        if length <= 0:
+            self._reject(411, 'Требуется непустое тело с Content-Length')
+            return
+        if length > API_MAX_BODY_MB * 1024 * 1024:
+            self._reject(413, f'Тело запроса больше {API_MAX_BODY_MB} МБ')
+            return
+
+        # Слот занимается до чтения тела: отклонённый запрос не загружается в память
+        service = self.service
+        if not service.try_acquire_slot():
+            self._reject(503, 'Сервис занят, повторите запрос позже',
+                         {'Retry-After': str(RETRY_AFTER_SEC)})
+            return
+        try:
+            data = self.rfile.read(length)
+            params = parse_qs(url.query)
+            result = service.convert(
+                data,
+                name=params.get('name', ['request.csv'])[0],
+                domain_guid=params.get('domain_guid', [None])[0])
+        except ApiError as e:
+            self._send_json(e.status, {'error': str(e), **e.details})
+            return
+        except Exception as e:
+            service.logger.error(f"❌ Ошибка обработки запроса {self.path}: {e}")
+            service.logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+            self._send_json(500, {'error': str(e)})
+            return
+        finally:
+            service.release_slot()
+
+        if url.path == '/convert/access':
+            self._send(200, result['access_xml'].encode('utf-8'), 'application/xml; charset=utf-8')
+        elif url.path == '/convert/energy':
+            self._send(200, result['energy_xml'].encode('utf-8'), 'application/xml; charset=utf-8')
+        else:
+            self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        """Перенаправляет журнал запросов в logging."""
+        logging.getLogger(__name__).info(format % args)
+
+
+def create_server(service: ConverterService, host: str = API_HOST,
+                  port: int = API_PORT) -> ThreadingHTTPServer:
+    """
+    Создаёт HTTP-сервер сервиса (без запуска).
+
+    Args:
+        service (ConverterService): Состояние сервиса.
+        host (str): Адрес для прослушивания.
+        port (int): Порт.
+
+    Returns:
+        ThreadingHTTPServer: Сервер; запускается вызовом serve_forever().
+    """
+    server = ThreadingHTTPServer((host, port), _ApiHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
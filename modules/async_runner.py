@@ -0,0 +1,124 @@
+# async_runner.py
+"""
+Модуль асинхронной (asyncio) обработки файлов.
+
+Альтернатива конвейеру потоков (modules.pipeline) для запусков, в которых
+основное время уходит на ожидание диска и контроллера домена. Каждый файл —
+отдельная задача цикла событий:
+
+- чтение и запись выполняются в пуле потоков (run_in_executor), не блокируя
+  цикл событий;
+- поиск — сопрограмма, например пакетный поиск логинов через подключение
+  ldap3 со стратегией ASYNC (ad_operations.lookup_users_async);
+- семафор ограничивает число файлов, обрабатываемых одновременно
+  (async.concurrency), а значит и число файлов в памяти.
+
+Запись выполняется строго в исходном порядке файлов, поэтому индекс
+дубликатов, not_in_AD.csv и остальные результаты совпадают с
+последовательной обработкой.
+"""
+import asyncio
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+
+ASYNC_ENABLED = CONFIG.get('async', {}).get('enabled', False)
+"""bool: Обрабатывать файлы оркестратором asyncio."""
+
+ASYNC_CONCURRENCY = CONFIG.get('async', {}).get('concurrency', 4)
+"""int: Число файлов, обрабатываемых одновременно."""
+
+ASYNC_IO_THREADS = CONFIG.get('async', {}).get('io_threads', 4)
+"""int: Число потоков для чтения и записи файлов."""
+
+
+async def _run(
+    items: List,
+    read: Callable,
+    resolve: Callable[..., Awaitable],
+    write: Callable,
+    concurrency: int,
+    io_threads: int,
+    on_result: Optional[Callable]
+) -> Dict:
+    """Выполняет run_async внутри цикла событий."""
+    logger = logging.getLogger(__name__)
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max(1, concurrency))
+    # turns[i] устанавливается, когда записаны все файлы до i-го
+    turns = [asyncio.Event() for _ in items]
+    results: Dict = {}
+
+    async def process(index: int, item, executor: ThreadPoolExecutor):
+        # Семафор захватывается в порядке items, поэтому файл, ждущий своей
+        # очереди записи, не мешает предыдущим файлам: взаимоблокировки нет
+        async with limit:
+            try:
+                job = await loop.run_in_executor(executor, read, item)
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения {item}: {e}")
+                logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+                job = None
+            if job is not None:
+                try:
+                    job = await resolve(job)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка поиска для {item}: {e}")
+                    logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+                    job = None
+            if index:
+                await turns[index - 1].wait()
+            success = False
+            try:
+                if job is not None:
+                    try:
+                        success = bool(await loop.run_in_executor(executor, write, job))
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка записи результатов {item}: {e}")
+                        logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+                results[item] = success
+                if on_result is not None:
+                    try:
+                        on_result(item, success)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка обработки результата {item}: {e}")
+            finally:
+                turns[index].set()
+
+    with ThreadPoolExecutor(max_workers=max(1, io_threads), thread_name_prefix="async-io") as executor:
+        await asyncio.gather(*(process(index, item, executor) for index, item in enumerate(items)))
+    return results
+
+
+def run_async(
+    items,
+    read: Callable,
+    resolve: Callable[..., Awaitable],
+    write: Callable,
+    concurrency: int = ASYNC_CONCURRENCY,
+    io_threads: int = ASYNC_IO_THREADS,
+    on_result: Optional[Callable] = None
+) -> Dict:
+    """
+    Обрабатывает элементы в цикле событий asyncio: «чтение → поиск → запись».
+
+    Args:
+        items (Iterable): Элементы (например, имена файлов).
+        read (Callable): read(item) -> задание или None (ошибка, запись не выполняется);
+            выполняется в пуле потоков.
+        resolve (Callable): Сопрограмма resolve(задание) -> задание.
+        write (Callable): write(задание) -> bool; выполняется в пуле потоков
+            строго в порядке items.
+        concurrency (int): Число элементов, обрабатываемых одновременно.
+        io_threads (int): Число потоков для read и write.
+        on_result (Optional[Callable]): on_result(item, success) после записи
+            каждого элемента (в потоке цикла событий).
+
+    Returns:
+        Dict: Элемент -> результат (True — успешно).
+    """
+    return asyncio.run(_run(list(items), read, resolve, write, concurrency, io_threads, on_result))
@@ -0,0 +1,163 @@
+# bloom_filter.py
+"""
+Модуль фильтра Блума для логинов AD.
+
+Фильтр хранит все sAMAccountName домена (в нижнем регистре) и отвечает на
+вопрос «может ли логин быть в AD». Ответ «нет» точный, поэтому строки
+с такими логинами (например, подрядчики, которых никогда не будет в AD)
+попадают в not_in_AD.csv без запроса к контроллеру домена. Ответ «да»
+ложен с вероятностью prefilter.fp_rate — тогда выполняется обычный поиск.
+
+Фильтр сохраняется в файл вместе с метками uSNChanged источников, по
+которым он дополняется инкрементально (см. ad_operations.prepare_login_filter).
+"""
+import os
+import json
+import math
+import time
+import struct
+import hashlib
+from typing import Dict, Iterable, Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .output_writer import atomic_open
+
+PREFILTER_ENABLED = CONFIG.get('prefilter', {}).get('enabled', False)
+"""bool: Проверять логины по фильтру Блума перед поиском в AD."""
+
+PREFILTER_PATH = CONFIG.get('prefilter', {}).get('path', 'ad_logins.bloom')
+"""str: Путь к файлу фильтра."""
+
+PREFILTER_FP_RATE = CONFIG.get('prefilter', {}).get('fp_rate', 0.001)
+"""float: Допустимая доля ложноположительных ответов."""
+
+PREFILTER_REBUILD_HOURS = CONFIG.get('prefilter', {}).get('rebuild_hours', 24)
+"""float: Через сколько часов фильтр строится заново по всем пользователям."""
+
+PREFILTER_MAX_AGE_MINUTES = CONFIG.get('prefilter', {}).get('max_age_minutes', 60)
+"""float: Сколько минут после синхронизации фильтру можно доверять."""
+
+_MAGIC = b'UCBF'
+_VERSION = 1
+# Заголовок: сигнатура, версия, число хэшей, размер в битах, элементов, ёмкость,
+# время построения, время синхронизации, длина метаданных (JSON)
+_HEADER = struct.Struct('<4sHHQQQddI')
+
+
+class BloomFilter:
+    """
+    Фильтр Блума с двойным хэшированием (BLAKE2b, две 64-битные половины).
+
+    Размер и число хэш-функций рассчитываются по ёмкости и допустимой доле
+    ложноположительных ответов. Удаление не поддерживается: удалённые из AD
+    логины остаются в фильтре до следующего полного построения (это даёт
+    лишь лишний запрос к AD, а не неверный результат).
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = PREFILTER_FP_RATE):
+        """
+        Создаёт пустой фильтр.
+
+        Args:
+            capacity (int): Ожидаемое число элементов.
+            fp_rate (float): Допустимая доля ложноположительных ответов.
+        """
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self.built_at = time.time()
+        self.synced_at = self.built_at
+        # Источник (домен или глобальный каталог) -> [dsServiceName, highestCommittedUSN]
+        self.marks: Dict[str, list] = {}
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, login: str) -> Iterable[int]:
+        """Возвращает номера битов логина."""
+        digest = hashlib.blake2b(login.lower().encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, login: str):
+        """
+        Добавляет логин в фильтр.
+
+        Args:
+            login (str): Логин (sAMAccountName).
+        """
+        array = self._array
+        for position in self._positions(login):
+            array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, login: str) -> bool:
+        array = self._array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(login))
+
+    @property
+    def saturated(self) -> bool:
+        """bool: Элементов больше ёмкости (доля ложноположительных ответов выше заданной)."""
+        return self.count > self.capacity
+
+    def is_fresh(self, max_age_minutes: float = PREFILTER_MAX_AGE_MINUTES) -> bool:
+        """
+        Проверяет, синхронизирован ли фильтр недавно.
+
+        Args:
+            max_age_minutes (float): Допустимый возраст синхронизации в минутах.
+
+        Returns:
+            bool: True, если фильтру можно доверять.
+        """
+        return time.time() - self.synced_at <= max_age_minutes * 60
+
+    def save(self, path: str = PREFILTER_PATH):
+        """
+        Атомарно сохраняет фильтр в файл.
+
+        Args:
+            path (str): Путь к файлу фильтра.
+        """
+        meta = json.dumps({'marks': self.marks}).encode('utf-8')
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with atomic_open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.hashes, self.bits, self.count,
+                                 self.capacity, self.built_at, self.synced_at, len(meta)))
+            f.write(meta)
+            f.write(self._array)
+
+    @classmethod
+    def load(cls, path: str = PREFILTER_PATH) -> Optional['BloomFilter']:
+        """
+        Загружает фильтр из файла.
+
+        Args:
+            path (str): Путь к файлу фильтра.
+
+        Returns:
+            Optional[BloomFilter]: Фильтр или None, если файла нет или он повреждён.
+        """
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            return None
+        magic, version, hashes, bits, count, capacity, built_at, synced_at, meta_len = \
+            _HEADER.unpack_from(data, 0)
+        body = _HEADER.size + meta_len
+        if magic != _MAGIC or version != _VERSION or len(data) != body + (bits + 7) // 8:
+            return None
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.bits, bloom.hashes, bloom.count = capacity, bits, hashes, count
+        bloom.built_at, bloom.synced_at = built_at, synced_at
+        bloom.marks = json.loads(data[_HEADER.size:body].decode('utf-8')).get('marks', {})
+        bloom._array = bytearray(data[body:])
+        return bloom
+
+    def __len__(self) -> int:
+        return self.count
@@ -2,18 +2,59 @@
 Модуль для работы с CSV-файлами.
 """
 import csv
+import io
 import os
-import uuid
-from typing import List, Dict, Optional
+import fnmatch
+import time
+from typing import List, Dict, Iterator, Optional, Tuple
 import traceback
 import logging
 
 # Импортируем конфигурацию
 from .config_loader import CONFIG
+from .guid_generation import person_guid_for, person_guids_for
+from .duplicate_index import SKIP_DUPLICATES
+from .metrics import get_active
+from .output_writer import atomic_open
 
 INPUT_ENCODING = CONFIG['input']['encoding']  # должно быть "windows-1251"
 DELIMITER = CONFIG['input']['delimiter']
 NOT_IN_AD_CSV = CONFIG['output']['not_in_ad_csv']
+DUPLICATES_CSV = CONFIG['output'].get('duplicates_csv', 'duplicates.csv')
+INPUT_RECURSIVE = CONFIG['input'].get('recursive', False)
+INCLUDE_GLOBS = CONFIG['input'].get('include', ['*.csv'])
+EXCLUDE_GLOBS = CONFIG['input'].get('exclude', [])
+USER_FIELDS = [
+    'person_guid', 'name', 'login', 'email', 'mobilePhone', 'position',
+    'OperationalAuthorities', 'electrical_safety_level', 'roles', 'groups',
+    'department', 'organisation', 'parent_energy', 'parent_access'
+]
+"""List[str]: Колонки пользователя (схема Sample.csv и результата process_user_row)."""
+CSV_WRITEBACK = CONFIG['output'].get('csv_writeback', 'changed')  # always, changed или sidecar
+SIDECAR_SUFFIX = CONFIG['output'].get('sidecar_suffix', '_enriched.csv')
+BATCH_NORMALIZE_MIN_ROWS = CONFIG['input'].get('batch_normalize_min_rows', 10000)  # 0 — отключено
+
+
+def detect_encoding(raw: bytes) -> str:
+    """
+    Определяет кодировку по первым байтам данных (BOM).
+
+    Args:
+        raw (bytes): Начало данных (достаточно 4 байт).
+
+    Returns:
+        str: Определенная кодировка.
+    """
+    if raw.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    elif raw.startswith(b'\xff\xfe\x00\x00'):
+        return 'utf-32'
+    elif raw.startswith(b'\xff\xfe'):
+        return 'utf-16'
+    elif raw.startswith(b'\xfe\xff'):
+        return 'big-endian-unicode'
+    else:
+        return INPUT_ENCODING
 
 
 def get_file_encoding(file_path: str) -> str:
@@ -29,16 +70,7 @@ def get_file_encoding(file_path: str) -> str:
     try:
         with open(file_path, 'rb') as f:
             raw = f.read(4)
-        if raw.startswith(b'\xef\xbb\xbf'):
-            return 'utf-8-sig'
-        elif raw.startswith(b'\xff\xfe\x00\x00'):
-            return 'utf-32'
-        elif raw.startswith(b'\xff\xfe'):
-            return 'utf-16'
-        elif raw.startswith(b'\xfe\xff'):
-            return 'big-endian-unicode'
-        else:
-            return INPUT_ENCODING
+        return detect_encoding(raw)
     except Exception as e:
         logging.getLogger(__name__).error(
             f"Ошибка определения кодировки файла {file_path}: {e}")
@@ -46,24 +78,69 @@ def get_file_encoding(file_path: str) -> str:
         return INPUT_ENCODING
 
 
-def find_csv_files(exclude_files: List[str] = ['Sample.csv', NOT_IN_AD_CSV]) -> List[str]:
+def _matches(rel_path: str, patterns: List[str]) -> bool:
+    """
+    Проверяет относительный путь на совпадение с glob-шаблонами (без учёта регистра).
+
+    Шаблон без '/' сравнивается с именем файла, шаблон с '/' — с путём целиком.
+    """
+    rel_path = rel_path.replace(os.sep, '/').lower()
+    name = rel_path.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        pattern = pattern.lower()
+        if fnmatch.fnmatchcase(rel_path if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def find_csv_files(
+    exclude_files: List[str] = ['Sample.csv', NOT_IN_AD_CSV, DUPLICATES_CSV],
+    directory: str = '.',
+    recursive: bool = INPUT_RECURSIVE,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None
+) -> List[str]:
     """
-    Находит все CSV-файлы в текущей директории, исключая указанные.
+    Находит CSV-файлы во входной директории, исключая указанные.
+
+    Файлы возвращаются от большего к меньшему: при параллельной обработке
+    крупные файлы стартуют первыми, и потоки загружаются равномернее.
 
     Args:
         exclude_files (List[str]): Список имен файлов для исключения.
+        directory (str): Входная директория (по умолчанию текущая).
+        recursive (bool): Искать файлы во вложенных директориях.
+        include (Optional[List[str]]): Glob-шаблоны включаемых файлов
+            (по умолчанию input.include из конфигурации).
+        exclude (Optional[List[str]]): Glob-шаблоны исключаемых файлов
+            (по умолчанию input.exclude из конфигурации).
 
     Returns:
-        List[str]: Список имен найденных CSV-файлов.
+        List[str]: Пути найденных файлов относительно directory.
     """
+    include = INCLUDE_GLOBS if include is None else include
+    exclude = EXCLUDE_GLOBS if exclude is None else exclude
+    excluded_names = set(exclude_files)
+    found = []
     try:
-        return [
-            f for f in os.listdir('.')
-            if f.lower().endswith('.csv') and f not in exclude_files
-        ]
+        for root, dirs, files in os.walk(directory):
+            if recursive:
+                dirs.sort()
+            else:
+                dirs.clear()
+            for f in files:
+                # Файлы обогащения (output.csv_writeback = sidecar) входными не считаются
+                if f in excluded_names or f.lower().endswith(SIDECAR_SUFFIX.lower()):
+                    continue
+                path = os.path.join(root, f)
+                rel_path = os.path.relpath(path, directory)
+                if _matches(rel_path, include) and not _matches(rel_path, exclude):
+                    found.append((os.path.getsize(path), rel_path))
     except Exception as e:
         logging.getLogger(__name__).error(f"Ошибка поиска CSV-файлов: {e}")
         return []
+    found.sort(key=lambda item: (-item[0], item[1]))
+    return [rel_path for _, rel_path in found]
 
 
 def read_csv_file(file_path: str, encoding: str) -> List[Dict]:
@@ -82,12 +159,7 @@ def read_csv_file(file_path: str, encoding: str) -> List[Dict]:
     """
     try:
         with open(file_path, 'r', encoding=encoding) as f:
-            first_line = f.readline()
-            f.seek(0)
-            delimiter = DELIMITER if DELIMITER in first_line else (
-                ',' if ',' in first_line else ';')
-            reader = csv.DictReader(f, delimiter=delimiter)
-            return list(reader)
+            return _read_csv_stream(f)
     except Exception as e:
         logging.getLogger(__name__).error(
             f"Ошибка чтения CSV-файла {file_path}: {e}")
@@ -96,9 +168,47 @@ def read_csv_file(file_path: str, encoding: str) -> List[Dict]:
         raise  # Передаем исключение дальше
 
 
+def _read_csv_stream(f) -> List[Dict]:
+    """
+    Читает CSV из текстового потока, определяя разделитель по первой строке.
+
+    Args:
+        f: Текстовый поток с поддержкой seek.
+
+    Returns:
+        List[Dict]: Список словарей с данными из CSV.
+    """
+    first_line = f.readline()
+    f.seek(0)
+    delimiter = DELIMITER if DELIMITER in first_line else (
+        ',' if ',' in first_line else ';')
+    reader = csv.DictReader(f, delimiter=delimiter)
+    return list(reader)
+
+
+def read_csv_bytes(data: bytes) -> List[Dict]:
+    """
+    Читает CSV из байтов (например, из тела HTTP-запроса).
+
+    Кодировка определяется так же, как для файлов: по BOM, иначе input.encoding.
+
+    Args:
+        data (bytes): Содержимое CSV.
+
+    Returns:
+        List[Dict]: Список словарей с данными из CSV.
+
+    Raises:
+        UnicodeDecodeError: Если данные не декодируются.
+        csv.Error: В случае ошибок разбора CSV.
+    """
+    text = data.decode(detect_encoding(data[:4]))
+    return _read_csv_stream(io.StringIO(text, newline=''))
+
+
 def write_csv_file(file_path: str, rows: List[Dict], delimiter: str = DELIMITER):
     """
-    Записывает данные в CSV-файл.
+    Атомарно записывает данные в CSV-файл (через временный файл и переименование).
 
     Args:
         file_path (str): Путь к CSV-файлу для записи.
@@ -112,7 +222,7 @@ def write_csv_file(file_path: str, rows: List[Dict], delimiter: str = DELIMITER)
         return
 
     try:
-        with open(file_path, 'w', newline='', encoding=INPUT_ENCODING) as f:
+        with atomic_open(file_path, newline='', encoding=INPUT_ENCODING) as f:
             writer = csv.DictWriter(
                 f, fieldnames=rows[0].keys(), delimiter=delimiter)
             writer.writeheader()
@@ -125,7 +235,86 @@ def write_csv_file(file_path: str, rows: List[Dict], delimiter: str = DELIMITER)
         raise  # Передаем исключение дальше
 
 
-def process_user_row(row: Dict, row_index: int, csv_file: str, mode: str, ad_conn, ad_guid: str, not_found_in_ad: List[Dict], logger: logging.Logger) -> Optional[Dict]:
+def rows_changed(rows: List[Dict], updated_rows: List[Dict]) -> bool:
+    """
+    Проверяет, отличаются ли обработанные строки от исходных.
+
+    Сравнение дешёвое и прекращается на первом отличии: сначала заголовок
+    и число строк, затем значения по строкам.
+
+    Args:
+        rows (List[Dict]): Исходные строки CSV.
+        updated_rows (List[Dict]): Обработанные строки (результат process_rows).
+
+    Returns:
+        bool: True, если перезапись CSV изменит его содержимое.
+    """
+    if len(rows) != len(updated_rows):
+        return True
+    if not rows:
+        return False
+    if list(rows[0].keys()) != list(updated_rows[0].keys()):
+        return True
+    return any(row != updated for row, updated in zip(rows, updated_rows))
+
+
+def write_back_csv(
+    file_path: str,
+    rows: List[Dict],
+    updated_rows: List[Dict],
+    sidecar_base: str,
+    mode: str = CSV_WRITEBACK
+) -> Optional[str]:
+    """
+    Сохраняет обогащённые строки CSV согласно output.csv_writeback.
+
+    Режимы:
+    - always  — всегда перезаписывать исходный CSV;
+    - changed — перезаписывать исходный CSV, только если строки изменились;
+    - sidecar — не трогать исходный CSV, а при изменениях писать
+      файл {sidecar_base}{SIDECAR_SUFFIX}.
+
+    Args:
+        file_path (str): Путь к исходному CSV-файлу.
+        rows (List[Dict]): Исходные строки.
+        updated_rows (List[Dict]): Обработанные строки.
+        sidecar_base (str): Путь к файлу обогащения без суффикса.
+        mode (str): Режим записи.
+
+    Returns:
+        Optional[str]: Путь к записанному файлу или None, если запись не понадобилась.
+    """
+    if not updated_rows:
+        return None
+    if mode != 'always' and not rows_changed(rows, updated_rows):
+        return None
+    target = f"{sidecar_base}{SIDECAR_SUFFIX}" if mode == 'sidecar' else file_path
+    write_csv_file(target, updated_rows)
+    return target
+
+
+def _user_record(row: Dict, person_guid: str, name: str, login: str) -> Dict:
+    """
+    Собирает данные пользователя (колонки USER_FIELDS) из строки CSV.
+
+    Общий для process_user_row и normalize_rows_batch, чтобы оба пути
+    выдавали одинаковый набор полей.
+
+    Args:
+        row (Dict): Строка CSV.
+        person_guid (str): GUID пользователя.
+        name (str): Обрезанное имя.
+        login (str): Обрезанный логин.
+
+    Returns:
+        Dict: Данные пользователя.
+    """
+    user = {field: row.get(field, '') for field in USER_FIELDS}
+    user.update(person_guid=person_guid, name=name, login=login)
+    return user
+
+
+def process_user_row(row: Dict, row_index: int, csv_file: str, mode: str, ad_conn, ad_guid: str, not_found_in_ad: List[Dict], logger: logging.Logger, dup_index=None, prefetched: Optional[Dict] = None) -> Optional[Dict]:
     """
     Обрабатывает одну строку данных пользователя из CSV.
 
@@ -138,6 +327,10 @@ def process_user_row(row: Dict, row_index: int, csv_file: str, mode: str, ad_con
         ad_guid (str): GUID домена AD.
         not_found_in_ad (List[Dict]): Список для накопления пользователей, не найденных в AD.
         logger (logging.Logger): Логгер для текущего файла.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов запуска. Кэширует поиск в AD
+            и позволяет повторно использовать GUID уже встречавшегося логина.
+        prefetched (Optional[Dict]): Результаты пакетного поиска в AD (lookup_users):
+            логин в нижнем регистре -> атрибуты или None.
 
     Returns:
         Optional[Dict]: Словарь с обработанными данными пользователя или None, если строку нужно пропустить.
@@ -156,20 +349,36 @@ def process_user_row(row: Dict, row_index: int, csv_file: str, mode: str, ad_con
 
         mark_not_found = False
 
+        # GUID первого вхождения логина (если логин уже встречался в этом запуске)
+        known_guid = dup_index.first_guid_for_login(login) if dup_index else None
+
+        ad_attributes = None
         if mode == 'y' and ad_conn:
             ad_person_guid = None
             if login:
-                # Импортируем функцию из ad_operations
-                from ad_operations import get_user_guid
-                ad_person_guid = get_user_guid(ad_conn, login)
+                cached = False
+                if dup_index is not None:
+                    cached, ad_person_guid = dup_index.get_cached_ad_guid(login)
+                if not cached:
+                    if prefetched is not None and login.lower() in prefetched:
+                        ad_attributes = prefetched[login.lower()]
+                    else:
+                        # Импортируем функцию из ad_operations
+                        from .ad_operations import get_user_attributes
+                        ad_attributes = get_user_attributes(ad_conn, login)
+                    ad_person_guid = ad_attributes['objectGUID'] if ad_attributes else None
+                    if dup_index is not None:
+                        dup_index.store_ad_guid(login, ad_person_guid)
             if ad_person_guid:
                 person_guid = ad_person_guid
             elif person_guid:
                 mark_not_found = True
             else:
-                person_guid = str(uuid.uuid4()).upper()
+                person_guid = known_guid or person_guid_for(
+                    login, name, csv_file, row_index)
                 mark_not_found = True
-            if mark_not_found:
+            # Повторный логин уже попал в список ненайденных при первом вхождении
+            if mark_not_found and known_guid is None:
                 not_found_in_ad.append({
                     'login': login,
                     'name': name,
@@ -177,26 +386,202 @@ def process_user_row(row: Dict, row_index: int, csv_file: str, mode: str, ad_con
                 })
         else:
             if not person_guid:
-                person_guid = str(uuid.uuid4()).upper()
-
-        return {
-            'person_guid': person_guid,
-            'name': name,
-            'login': login,
-            'email': row.get('email', ''),
-            'mobilePhone': row.get('mobilePhone', ''),
-            'position': row.get('position', ''),
-            'OperationalAuthorities': row.get('OperationalAuthorities', ''),
-            'electrical_safety_level': row.get('electrical_safety_level', ''),
-            'roles': row.get('roles', ''),
-            'groups': row.get('groups', ''),
-            'department': row.get('department', ''),
-            'organisation': row.get('organisation', ''),
-            'parent_energy': row.get('parent_energy', ''),
-            'parent_access': row.get('parent_access', '')
-        }
+                person_guid = known_guid or person_guid_for(
+                    login, name, csv_file, row_index)
+
+        user = _user_record(row, person_guid, name, login)
+        # Заполнение пустых полей атрибутами из того же запроса к AD
+        if ad_attributes:
+            from .ad_operations import enrich_user, ENRICH_BLANKS
+            if ENRICH_BLANKS:
+                filled = enrich_user(user, ad_attributes)
+                if filled:
+                    get_active().count('ad_enriched_fields', filled)
+        return user
     except Exception as e:
         logger.error(
             f"❌ Ошибка обработки строки {row_index + 1} в файле {csv_file}: {e}")
         logger.debug(f"Детали ошибки: {traceback.format_exc()}")
         return None
+
+
+def normalize_rows_batch(rows: List[Dict], csv_file: str, logger: logging.Logger,
+                         dup_index=None) -> Iterator[Tuple[int, Dict]]:
+    """
+    Пакетная обработка строк без AD (эквивалент process_user_row в режиме 'n').
+
+    Обрезка name, login и person_guid, отбор пустых имён, поиск строк без GUID
+    и генерация GUID выполняются по колонкам для всего блока сразу. GUID
+    первого вхождения логина (dup_index) подставляется при выдаче строки,
+    поэтому генератор нужно потреблять по порядку, регистрируя каждую строку
+    в dup_index до запроса следующей (как это делает process_rows).
+
+    Args:
+        rows (List[Dict]): Строки CSV.
+        csv_file (str): Имя CSV-файла (для GUID).
+        logger (logging.Logger): Логгер для текущего файла.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов запуска.
+
+    Yields:
+        Tuple[int, Dict]: Индекс строки в CSV и данные пользователя.
+    """
+    names = [(row.get('name') or '').strip() for row in rows]
+    kept = [i for i, name in enumerate(names) if name]
+    skipped = len(rows) - len(kept)
+    if skipped:
+        logger.debug(f"Файл: {csv_file}: пропущено строк с пустым именем: {skipped}")
+
+    # Колонки ниже выровнены по kept; person_guid пустой у строк без GUID
+    users = [_user_record(row, (row.get('person_guid') or '').strip(), names[i],
+                          (row.get('login') or '').strip())
+             for i, row in enumerate(rows) if names[i]]
+    missing = [k for k, user in enumerate(users) if not user['person_guid']]
+    generated = dict(zip(missing, person_guids_for(
+        [(users[k]['login'], users[k]['name'], kept[k]) for k in missing], csv_file)))
+    first_guid_for_login = dup_index.first_guid_for_login if dup_index is not None else None
+
+    for k, (i, user) in enumerate(zip(kept, users)):
+        if k in generated:
+            known_guid = first_guid_for_login(user['login']) if first_guid_for_login else None
+            user['person_guid'] = known_guid or generated[k]
+        yield i, user
+
+
+def _prefetch_logins(rows: List[Dict], dup_index=None) -> List[str]:
+    """Возвращает логины строк файла, которые нужно искать в AD."""
+    logins = []
+    for row in rows:
+        if not (row.get('name') or '').strip():
+            continue
+        login = (row.get('login') or '').strip()
+        if login and (dup_index is None or not dup_index.has_ad_lookup(login)):
+            logins.append(login)
+    return logins
+
+
+def prefetch_ad_lookups(rows: List[Dict], ad_conn, logger: logging.Logger,
+                        dup_index=None) -> Optional[Dict]:
+    """
+    Ищет в AD логины всех строк файла пакетными запросами (по доменам параллельно).
+
+    Логины, уже известные индексу дубликатов (в том числе из кэша GUID),
+    не запрашиваются.
+
+    Args:
+        rows (List[Dict]): Строки CSV.
+        ad_conn: Подключение к AD.
+        logger (logging.Logger): Логгер для текущего файла.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов запуска.
+
+    Returns:
+        Optional[Dict]: Результат lookup_users или None, если пакетный поиск отключён.
+    """
+    from .ad_operations import lookup_users, LOOKUP_BATCH_SIZE
+    if LOOKUP_BATCH_SIZE < 2:
+        return None
+    logins = _prefetch_logins(rows, dup_index)
+    if not logins:
+        return None
+    with get_active().timer('ad_prefetch'):
+        prefetched = lookup_users(ad_conn, logins)
+    logger.info(f"Пакетный поиск в AD: логинов {len(prefetched)}, "
+                f"найдено {sum(1 for result in prefetched.values() if result)}")
+    return prefetched
+
+
+async def prefetch_ad_lookups_async(rows: List[Dict], logger: logging.Logger,
+                                    dup_index=None) -> Optional[Dict]:
+    """
+    Асинхронный вариант prefetch_ad_lookups (lookup_users_async, стратегия ldap3 ASYNC).
+
+    Args:
+        rows (List[Dict]): Строки CSV.
+        logger (logging.Logger): Логгер для текущего файла.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов запуска.
+
+    Returns:
+        Optional[Dict]: Результат lookup_users_async или None, если пакетный поиск отключён.
+    """
+    from .ad_operations import lookup_users_async, LOOKUP_BATCH_SIZE
+    if LOOKUP_BATCH_SIZE < 2:
+        return None
+    logins = _prefetch_logins(rows, dup_index)
+    if not logins:
+        return None
+    start = time.perf_counter()
+    prefetched = await lookup_users_async(logins)
+    get_active().add_time('ad_prefetch', time.perf_counter() - start)
+    logger.info(f"Пакетный поиск в AD: логинов {len(prefetched)}, "
+                f"найдено {sum(1 for result in prefetched.values() if result)}")
+    return prefetched
+
+
+def process_rows(
+    rows: List[Dict],
+    csv_file: str,
+    mode: str,
+    ad_conn,
+    ad_guid: str,
+    not_found_in_ad: List[Dict],
+    logger: logging.Logger,
+    dup_index=None,
+    batch: Optional[bool] = None,
+    prefetched: Optional[Dict] = None
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Обрабатывает все строки CSV и отбирает пользователей для XML.
+
+    Args:
+        rows (List[Dict]): Строки CSV.
+        csv_file (str): Имя CSV-файла (для логирования и GUID).
+        mode (str): Режим работы ('y' - с AD, 'n' - без AD).
+        ad_conn: Подключение к AD (если используется).
+        ad_guid (str): GUID домена AD.
+        not_found_in_ad (List[Dict]): Список для накопления пользователей, не найденных в AD.
+        logger (logging.Logger): Логгер для текущего файла.
+        dup_index (Optional[DuplicateIndex]): Индекс дубликатов запуска.
+        batch (Optional[bool]): Пакетная обработка строк без AD. None — по порогу
+            input.batch_normalize_min_rows.
+        prefetched (Optional[Dict]): Результат prefetch_ad_lookups, если пакетный
+            поиск уже выполнен (например, этапом поиска конвейера).
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: Строки для перезаписи CSV и пользователи для XML.
+    """
+    metrics = get_active()
+    updated_rows = []
+    users_data = []
+
+    without_ad = not (mode == 'y' and ad_conn)
+    if batch is None:
+        batch = bool(BATCH_NORMALIZE_MIN_ROWS) and len(rows) >= BATCH_NORMALIZE_MIN_ROWS
+    if batch and without_ad:
+        metrics.count('rows_batch_normalized', len(rows))
+        processed = normalize_rows_batch(rows, csv_file, logger, dup_index)
+    else:
+        if prefetched is None and not without_ad:
+            prefetched = prefetch_ad_lookups(rows, ad_conn, logger, dup_index)
+        processed = (
+            (row_idx, process_user_row(
+                row, row_idx, csv_file, mode, ad_conn, ad_guid, not_found_in_ad, logger,
+                dup_index, prefetched))
+            for row_idx, row in enumerate(rows))
+
+    for row_idx, processed_row in processed:
+        try:
+            if processed_row:
+                updated_rows.append(processed_row)
+                if dup_index is not None and not dup_index.register(processed_row, csv_file, row_idx):
+                    metrics.count('duplicates')
+                    logger.warning(
+                        f"🟡 Строка {row_idx + 1}: повторный пользователь "
+                        f"(логин '{processed_row['login']}', GUID {processed_row['person_guid']})")
+                    if SKIP_DUPLICATES:
+                        continue
+                users_data.append(processed_row)
+        except Exception as e:
+            logger.error(
+                f"❌ Неожиданная ошибка при обработке строки {row_idx + 1} в файле {csv_file}: {e}")
+            logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+            continue
+    return updated_rows, users_data
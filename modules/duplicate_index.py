@@ -0,0 +1,240 @@
+# duplicate_index.py
+"""
+Модуль для обнаружения дубликатов пользователей между CSV-файлами.
+"""
+import csv
+import threading
+from typing import List, Dict, Optional, Tuple, Iterable
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .metrics import get_active
+from .output_writer import atomic_open
+
+DEDUP_ENABLED = CONFIG.get('dedup', {}).get('enabled', True)
+"""bool: Флаг включения индекса дубликатов."""
+
+SKIP_DUPLICATES = CONFIG.get('dedup', {}).get('skip_duplicates', True)
+"""bool: Исключать ли повторные вхождения пользователей из XML."""
+
+DUPLICATES_CSV = CONFIG['output'].get('duplicates_csv', 'duplicates.csv')
+"""str: Имя файла отчёта о дубликатах и конфликтах."""
+
+REPORT_FIELDS = [
+    'kind', 'key',
+    'first_file', 'first_row', 'first_login', 'first_person_guid',
+    'file', 'row', 'login', 'person_guid'
+]
+"""List[str]: Колонки отчёта о дубликатах."""
+
+
+class DuplicateIndex:
+    """
+    Индекс логинов и GUID пользователей в пределах одного запуска.
+
+    Для каждого логина и каждого person_guid хранится только первое вхождение
+    в виде компактного кортежа (номер файла, номер строки, парное значение),
+    поэтому индекс остаётся дешёвым и на миллионах строк. Дополнительно
+    индекс кэширует результаты поиска в AD, чтобы один и тот же логин
+    не запрашивался повторно; GUID из постоянного кэша могут браться из
+    общей таблицы GuidTable (attach_guid_table) без копирования в словарь.
+    """
+
+    def __init__(self):
+        """Инициализирует пустой индекс."""
+        self._files: List[str] = []
+        self._file_ids: Dict[str, int] = {}
+        # login (в нижнем регистре) -> (file_id, row_index, person_guid)
+        self._logins: Dict[str, Tuple[int, int, str]] = {}
+        # person_guid (в верхнем регистре) -> (file_id, row_index, login)
+        self._guids: Dict[str, Tuple[int, int, str]] = {}
+        # login (в нижнем регистре) -> GUID из AD или None (не найден)
+        self._ad_lookups: Dict[str, Optional[str]] = {}
+        # GUID, действительно найденные в AD в этом запуске (без предзагруженных)
+        self._resolved: Dict[str, str] = {}
+        # Таблица GUID постоянного кэша (только чтение), если подключена
+        self._table = None
+        self.records: List[Dict] = []
+        self.lookup_hits = 0
+        self.lookup_misses = 0
+        self._lock = threading.Lock()
+
+    def _file_id(self, csv_file: str) -> int:
+        """Возвращает числовой идентификатор файла, регистрируя его при необходимости."""
+        file_id = self._file_ids.get(csv_file)
+        if file_id is None:
+            file_id = len(self._files)
+            self._files.append(csv_file)
+            self._file_ids[csv_file] = file_id
+        return file_id
+
+    def get_cached_ad_guid(self, login: str) -> Tuple[bool, Optional[str]]:
+        """
+        Возвращает закэшированный результат поиска логина в AD.
+
+        Args:
+            login (str): Логин пользователя.
+
+        Returns:
+            Tuple[bool, Optional[str]]: Флаг наличия в кэше и GUID (None — не найден в AD).
+        """
+        key = login.lower()
+        with self._lock:
+            hit = key in self._ad_lookups
+            guid = self._ad_lookups.get(key)
+            if not hit and self._table is not None:
+                guid = self._table.get(key)
+                hit = guid is not None
+            if hit:
+                self.lookup_hits += 1
+            else:
+                self.lookup_misses += 1
+        get_active().count('lookup_cache_hits' if hit else 'lookup_cache_misses')
+        return hit, guid
+
+    def has_ad_lookup(self, login: str) -> bool:
+        """
+        Проверяет, есть ли результат поиска логина в кэше (без учёта в статистике).
+
+        Args:
+            login (str): Логин пользователя.
+
+        Returns:
+            bool: True, если логин уже искали в AD или он предзагружен.
+        """
+        with self._lock:
+            if login.lower() in self._ad_lookups:
+                return True
+        return self._table is not None and login in self._table
+
+    def store_ad_guid(self, login: str, guid: Optional[str]):
+        """
+        Сохраняет результат поиска логина в AD.
+
+        Args:
+            login (str): Логин пользователя.
+            guid (Optional[str]): GUID пользователя или None, если он не найден.
+        """
+        with self._lock:
+            self._ad_lookups[login.lower()] = guid
+            if guid:
+                self._resolved[login.lower()] = guid
+
+    def preload_ad_guids(self, items: Iterable[Tuple[str, str]]):
+        """
+        Предзагружает известные GUID (например, из постоянного кэша).
+
+        Args:
+            items (Iterable[Tuple[str, str]]): Пары (логин, GUID).
+        """
+        with self._lock:
+            for login, guid in items:
+                self._ad_lookups[login.lower()] = guid
+
+    def attach_guid_table(self, table):
+        """
+        Подключает таблицу GUID постоянного кэша вместо предзагрузки в словарь.
+
+        Args:
+            table (GuidTable): Открытая таблица; индекс её только читает.
+        """
+        self._table = table
+
+    def resolved_ad_guids(self) -> Dict[str, str]:
+        """
+        Возвращает GUID, найденные в AD в этом запуске (без предзагруженных).
+
+        Returns:
+            Dict[str, str]: Логин (в нижнем регистре) -> GUID.
+        """
+        with self._lock:
+            return dict(self._resolved)
+
+    def first_guid_for_login(self, login: str) -> Optional[str]:
+        """
+        Возвращает person_guid первого вхождения логина.
+
+        Args:
+            login (str): Логин пользователя.
+
+        Returns:
+            Optional[str]: GUID первого вхождения или None, если логин ещё не встречался.
+        """
+        if not login:
+            return None
+        with self._lock:
+            first = self._logins.get(login.lower())
+        return first[2] if first else None
+
+    def register(self, user: Dict, csv_file: str, row_index: int) -> bool:
+        """
+        Регистрирует обработанную строку и проверяет её на дубликаты.
+
+        Args:
+            user (Dict): Обработанные данные пользователя (результат process_user_row).
+            csv_file (str): Имя CSV-файла.
+            row_index (int): Индекс строки в CSV.
+
+        Returns:
+            bool: True, если это первое вхождение пользователя, иначе False.
+        """
+        login = user.get('login', '') or ''
+        person_guid = (user.get('person_guid', '') or '').upper()
+        login_key = login.lower()
+
+        with self._lock:
+            file_id = self._file_id(csv_file)
+            first_by_login = self._logins.get(login_key) if login_key else None
+            first_by_guid = self._guids.get(person_guid) if person_guid else None
+
+            if first_by_login is None and first_by_guid is None:
+                if login_key:
+                    self._logins[login_key] = (file_id, row_index, person_guid)
+                if person_guid:
+                    self._guids[person_guid] = (file_id, row_index, login)
+                return True
+
+            if first_by_login is not None:
+                first_file, first_row, first_guid = first_by_login
+                kind = 'duplicate' if first_guid == person_guid else 'login_conflict'
+                first_login = login
+                key = login
+            else:
+                first_file, first_row, first_login = first_by_guid
+                kind = 'guid_conflict' if first_login.lower() != login_key else 'duplicate'
+                first_guid = person_guid
+                key = person_guid
+
+            self.records.append({
+                'kind': kind,
+                'key': key,
+                'first_file': self._files[first_file],
+                'first_row': first_row + 1,
+                'first_login': first_login,
+                'first_person_guid': first_guid,
+                'file': csv_file,
+                'row': row_index + 1,
+                'login': login,
+                'person_guid': person_guid
+            })
+            return False
+
+    @property
+    def conflicts(self) -> List[Dict]:
+        """List[Dict]: Записи отчёта, у которых логин и GUID не совпадают с первым вхождением."""
+        return [r for r in self.records if r['kind'] != 'duplicate']
+
+    def write_report(self, file_path: str = DUPLICATES_CSV):
+        """
+        Сохраняет отчёт о дубликатах и конфликтах в CSV-файл.
+
+        Args:
+            file_path (str): Путь к файлу отчёта.
+
+        Raises:
+            Exception: В случае ошибок при записи файла.
+        """
+        with atomic_open(file_path, newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, delimiter=';')
+            writer.writeheader()
+            writer.writerows(self.records)
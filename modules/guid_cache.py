@@ -0,0 +1,167 @@
+# guid_cache.py
+"""
+Модуль для постоянного кэша GUID пользователей из AD.
+
+Кэш хранит соответствие логин → GUID, найденное в AD в предыдущих запусках,
+вместе со временем проверки. Свежие записи (не старше ttl_hours) позволяют
+не обращаться к AD повторно. Кэшируются только найденные пользователи.
+
+Кроме записей в файле хранятся метаданные инкрементальной синхронизации
+(sync): контроллер домена, его highestCommittedUSN на момент последней
+синхронизации и время синхронизации (см. ad_operations.sync_guid_cache).
+"""
+import os
+import json
+import time
+import logging
+import traceback
+from typing import Dict, Optional, Tuple, Iterable
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .output_writer import atomic_open
+
+CACHE_ENABLED = CONFIG.get('cache', {}).get('enabled', False)
+"""bool: Флаг использования постоянного кэша GUID."""
+
+CACHE_PATH = CONFIG.get('cache', {}).get('path', 'guid_cache.json')
+"""str: Путь к файлу кэша GUID."""
+
+CACHE_TTL_HOURS = CONFIG.get('cache', {}).get('ttl_hours', 24)
+"""float: Время жизни записи кэша в часах."""
+
+CACHE_SYNC = CONFIG.get('cache', {}).get('incremental_sync', True)
+"""bool: Синхронизировать кэш с AD по uSNChanged при запуске."""
+
+
+class GuidCache:
+    """
+    Постоянный кэш логин → GUID пользователя в AD.
+
+    Логины хранятся в нижнем регистре (sAMAccountName не чувствителен к регистру).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl_hours: float = CACHE_TTL_HOURS):
+        """
+        Инициализирует кэш (без загрузки с диска).
+
+        Args:
+            path (str): Путь к файлу кэша (пустой — кэш только в памяти).
+            ttl_hours (float): Время жизни записи в часах.
+        """
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        # login (в нижнем регистре) -> (GUID, время проверки в Unix time)
+        self.entries: Dict[str, Tuple[str, float]] = {}
+        # Метаданные синхронизации: server, highest_usn, synced_at
+        self.sync: Dict = {}
+        self.dirty = False
+
+    def load(self) -> 'GuidCache':
+        """
+        Загружает кэш из файла. Отсутствующий или повреждённый файл даёт пустой кэш.
+
+        Returns:
+            GuidCache: Этот же кэш.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = {
+                login: (guid, checked_at)
+                for login, (guid, checked_at) in data.get('logins', {}).items()
+            }
+            self.sync = data.get('sync', {})
+        except Exception as e:
+            logging.getLogger(__name__).warning(
+                f"Не удалось загрузить кэш GUID из {self.path}: {e}. Используется пустой кэш.")
+            logging.getLogger(__name__).debug(
+                f"Детали ошибки: {traceback.format_exc()}")
+            self.entries = {}
+            self.sync = {}
+        return self
+
+    def save(self):
+        """
+        Атомарно сохраняет кэш в файл, если он изменился.
+
+        Кэш с пустым путём хранится только в памяти и не сохраняется.
+
+        Raises:
+            Exception: В случае ошибок при записи файла.
+        """
+        if not self.dirty or not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with atomic_open(self.path, encoding='utf-8') as f:
+            json.dump({'logins': self.entries, 'sync': self.sync}, f, ensure_ascii=False)
+        self.dirty = False
+
+    def get(self, login: str) -> Optional[str]:
+        """
+        Возвращает GUID из кэша, если запись свежая.
+
+        Args:
+            login (str): Логин пользователя.
+
+        Returns:
+            Optional[str]: GUID или None, если записи нет или она устарела.
+        """
+        entry = self.entries.get(login.lower())
+        if entry and time.time() - entry[1] <= self.ttl:
+            return entry[0]
+        return None
+
+    def fresh_items(self, since: Optional[float] = None) -> Iterable[Tuple[str, str]]:
+        """
+        Возвращает свежие записи кэша.
+
+        Args:
+            since (Optional[float]): Только записи, проверенные позже этого времени.
+
+        Returns:
+            Iterable[Tuple[str, str]]: Пары (логин, GUID).
+        """
+        now = time.time()
+        return [(login, guid) for login, (guid, checked_at) in self.entries.items()
+                if now - checked_at <= self.ttl and (since is None or checked_at > since)]
+
+    def put(self, login: str, guid: str, checked_at: Optional[float] = None):
+        """
+        Сохраняет GUID пользователя в кэше.
+
+        Args:
+            login (str): Логин пользователя.
+            guid (str): GUID пользователя.
+            checked_at (Optional[float]): Время проверки (по умолчанию текущее).
+        """
+        self.entries[login.lower()] = (guid, checked_at if checked_at is not None else time.time())
+        self.dirty = True
+
+    def remove(self, login: str):
+        """
+        Удаляет запись из кэша.
+
+        Args:
+            login (str): Логин пользователя.
+        """
+        if self.entries.pop(login.lower(), None) is not None:
+            self.dirty = True
+
+    def set_sync(self, server: str, highest_usn: int, synced_at: float):
+        """
+        Сохраняет метку инкрементальной синхронизации.
+
+        Args:
+            server (str): Контроллер домена (dsServiceName), к которому относится метка.
+            highest_usn (int): highestCommittedUSN контроллера на момент синхронизации.
+            synced_at (float): Время синхронизации (Unix time).
+        """
+        self.sync = {'server': server, 'highest_usn': highest_usn, 'synced_at': synced_at}
+        self.dirty = True
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,110 @@
+# guid_generation.py
+"""
+Модуль для генерации GUID объектов.
+
+В обычном режиме GUID генерируются случайно (uuid4). В детерминированном
+режиме (xml.deterministic_guids) используется uuid5 от пространства имён
+из конфигурации, поэтому одинаковые входные данные дают одинаковые GUID
+и побайтно одинаковые XML-файлы.
+"""
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+
+DETERMINISTIC_GUIDS = CONFIG['xml'].get('deterministic_guids', False)
+"""bool: Флаг детерминированной генерации GUID."""
+
+GUID_NAMESPACE = uuid.UUID(CONFIG['xml'].get(
+    'guid_namespace', '6f1c3d2e-8a4b-5c6d-9e0f-1a2b3c4d5e6f'))
+"""uuid.UUID: Пространство имён для uuid5 в детерминированном режиме."""
+
+
+def generate_guid(*parts: str) -> str:
+    """
+    Генерирует GUID объекта в верхнем регистре.
+
+    Args:
+        *parts (str): Составные части ключа объекта. Используются только
+            в детерминированном режиме.
+
+    Returns:
+        str: GUID в верхнем регистре.
+    """
+    if DETERMINISTIC_GUIDS:
+        return str(uuid.uuid5(GUID_NAMESPACE, ':'.join(parts))).upper()
+    return str(uuid.uuid4()).upper()
+
+
+def person_guid_for(login: str, name: str, csv_file: str, row_index: int) -> str:
+    """
+    Генерирует GUID пользователя, для которого GUID не указан и не найден в AD.
+
+    Args:
+        login (str): Логин пользователя.
+        name (str): ФИО пользователя.
+        csv_file (str): Путь к CSV-файлу относительно входной директории
+            (одноимённые файлы из разных подпапок дают разные GUID).
+        row_index (int): Индекс строки в CSV.
+
+    Returns:
+        str: GUID пользователя в верхнем регистре.
+    """
+    if login:
+        return generate_guid('person', login.lower())
+    return generate_guid('person', os.path.normpath(csv_file).replace(os.sep, '/'), str(row_index), name)
+
+
+def person_guids_for(keys: List[Tuple[str, str, int]], csv_file: str) -> List[str]:
+    """
+    Генерирует GUID пользователей для целого блока строк.
+
+    Результат совпадает с вызовом person_guid_for для каждой строки; в обычном
+    режиме случайные байты для всех uuid4 берутся одним вызовом os.urandom.
+
+    Args:
+        keys (List[Tuple[str, str, int]]): Тройки (логин, ФИО, индекс строки).
+        csv_file (str): Путь к CSV-файлу относительно входной директории.
+
+    Returns:
+        List[str]: GUID пользователей в верхнем регистре (в порядке keys).
+    """
+    if DETERMINISTIC_GUIDS:
+        return [person_guid_for(login, name, csv_file, row_index)
+                for login, name, row_index in keys]
+    # Форматирование как у uuid.UUID(bytes=..., version=4): версия 4, вариант RFC 4122
+    digits = os.urandom(16 * len(keys)).hex().upper()
+    return [f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{'89AB'[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}"
+            for h in (digits[i:i + 32] for i in range(0, len(digits), 32))]
+
+
+def name_guid_for(person_guid: str) -> str:
+    """
+    Генерирует GUID объекта cim:Name (сокращённое ФИО) для пользователя.
+
+    Args:
+        person_guid (str): GUID пользователя.
+
+    Returns:
+        str: GUID объекта cim:Name в верхнем регистре.
+    """
+    return generate_guid('name', person_guid.upper())
+
+
+def model_created() -> datetime:
+    """
+    Возвращает время создания модели для заголовка md:FullModel.
+
+    В детерминированном режиме используется SOURCE_DATE_EPOCH (или 0),
+    чтобы повторная генерация давала тот же результат.
+
+    Returns:
+        datetime: Время создания модели в UTC.
+    """
+    if DETERMINISTIC_GUIDS:
+        epoch = int(os.environ.get('SOURCE_DATE_EPOCH', '0') or 0)
+        return datetime.fromtimestamp(epoch, timezone.utc)
+    return datetime.now(timezone.utc)
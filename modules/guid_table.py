@@ -0,0 +1,178 @@
+# guid_table.py
+"""
+Модуль компактной таблицы логин → GUID только для чтения.
+
+Таблица строится один раз за запуск из постоянного кэша GUID и хранится
+в файле, который открывается через mmap: вместо словаря строк Python на
+каждый логин в памяти лежат три плоских массива, отсортированных по хэшу
+логина:
+
+- 8 байт — хэш логина в нижнем регистре (BLAKE2b, 64 бита);
+- 16 байт — двоичный GUID;
+- 4 байта — время проверки записи (Unix time), чтобы учитывать cache.ttl_hours.
+
+Поиск — двоичный по массиву хэшей (bisect по memoryview, без копирования).
+Любое число потоков или процессов может открыть один и тот же файл
+(GuidTable.open): страницы файла разделяются через кэш ОС.
+"""
+import os
+import mmap
+import time
+import uuid
+import struct
+import hashlib
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .guid_cache import GuidCache
+from .output_writer import atomic_open
+
+TABLE_ENABLED = CONFIG.get('cache', {}).get('shared_table', True)
+"""bool: Использовать таблицу GUID вместо предзагрузки кэша в словарь."""
+
+TABLE_PATH = CONFIG.get('cache', {}).get('table_path', 'guid_cache.tbl')
+"""str: Путь к файлу таблицы GUID (пусто — таблица только в памяти)."""
+
+_MAGIC = b'UCGT'
+_VERSION = 1
+# Заголовок: сигнатура, версия, число записей, время построения; массивы — в порядке байтов хоста
+_HEADER = struct.Struct('=4sHxxQd')
+
+
+def login_hash(login: str) -> int:
+    """
+    Возвращает 64-битный хэш логина (без учёта регистра).
+
+    Args:
+        login (str): Логин пользователя.
+
+    Returns:
+        int: Хэш логина.
+    """
+    digest = hashlib.blake2b(login.lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class GuidTable:
+    """
+    Отсортированная таблица хэш логина → GUID в отображённом в память буфере.
+
+    Экземпляр только читает буфер, поэтому его можно использовать из
+    нескольких потоков без блокировок.
+    """
+
+    def __init__(self, buffer, ttl_hours: float, path: str = ''):
+        """
+        Подключает таблицу к буферу.
+
+        Args:
+            buffer: mmap или bytes с содержимым таблицы.
+            ttl_hours (float): Время жизни записи в часах.
+            path (str): Путь к файлу таблицы (для журнала).
+        """
+        magic, version, count, built_at = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path or 'буфер'} не является таблицей GUID версии {_VERSION}")
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.built_at = built_at
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        keys_end = _HEADER.size + 8 * count
+        values_end = keys_end + 16 * count
+        self._keys = self._view[_HEADER.size:keys_end].cast('Q')
+        self._values = self._view[keys_end:values_end]
+        self._stamps = self._view[values_end:values_end + 4 * count].cast('I')
+        self._count = count
+
+    @classmethod
+    def from_cache(cls, cache: GuidCache, path: str = TABLE_PATH) -> 'GuidTable':
+        """
+        Строит таблицу из свежих записей кэша GUID и открывает её.
+
+        Args:
+            cache (GuidCache): Постоянный кэш GUID.
+            path (str): Путь к файлу таблицы (пусто — таблица только в памяти).
+
+        Returns:
+            GuidTable: Открытая таблица.
+        """
+        now = time.time()
+        records = {}
+        for login, (guid, checked_at) in cache.entries.items():
+            if now - checked_at > cache.ttl:
+                continue
+            try:
+                value = bytes.fromhex(guid.replace('-', ''))
+            except ValueError:
+                value = b''
+            if len(value) != 16:
+                logging.getLogger(__name__).debug(f"Некорректный GUID в кэше для {login}: {guid}")
+                continue
+            records[login_hash(login)] = (value, int(checked_at))
+        keys = array('Q', sorted(records))
+        values = b''.join(records[key][0] for key in keys)
+        stamps = array('I', (records[key][1] for key in keys))
+        header = _HEADER.pack(_MAGIC, _VERSION, len(keys), now)
+
+        if not path:
+            return cls(header + keys.tobytes() + values + stamps.tobytes(), cache.ttl / 3600)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with atomic_open(path, 'wb') as f:
+            f.write(header)
+            keys.tofile(f)
+            f.write(values)
+            stamps.tofile(f)
+        return cls.open(path, cache.ttl / 3600)
+
+    @classmethod
+    def open(cls, path: str = TABLE_PATH, ttl_hours: float = 24) -> 'GuidTable':
+        """
+        Открывает готовый файл таблицы через mmap (только чтение).
+
+        Args:
+            path (str): Путь к файлу таблицы.
+            ttl_hours (float): Время жизни записи в часах.
+
+        Returns:
+            GuidTable: Открытая таблица.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, ttl_hours, path)
+
+    def get(self, login: str) -> Optional[str]:
+        """
+        Возвращает GUID пользователя, если запись есть и не устарела.
+
+        Args:
+            login (str): Логин пользователя.
+
+        Returns:
+            Optional[str]: GUID в верхнем регистре или None.
+        """
+        key = login_hash(login)
+        index = bisect_left(self._keys, key)
+        if index == self._count or self._keys[index] != key:
+            return None
+        if time.time() - self._stamps[index] > self.ttl:
+            return None
+        return str(uuid.UUID(bytes=bytes(self._values[16 * index:16 * index + 16]))).upper()
+
+    def __contains__(self, login: str) -> bool:
+        return self.get(login) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        """Освобождает буфер таблицы."""
+        for view in (self._keys, self._values, self._stamps, self._view):
+            view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
@@ -180,6 +180,24 @@ def setup_logging():
 # Инициализируем логгирование при импорте модуля
 setup_logging()
 
+def file_log_name(csv_filename: str) -> str:
+    """
+    Возвращает имя логгера и лог-файла для CSV-файла.
+
+    Используется путь относительно входной директории без расширения
+    (разделители каталогов заменяются на '__'), чтобы одноимённые файлы
+    из разных подпапок (--recursive) не делили один логгер.
+
+    Args:
+        csv_filename (str): Путь к CSV-файлу относительно входной директории.
+
+    Returns:
+        str: Имя логгера (для файла в корне — имя файла без расширения).
+    """
+    base = os.path.splitext(os.path.normpath(csv_filename))[0]
+    return base.replace(os.sep, '__').replace('/', '__')
+
+
 class LogManager:
     """
     Менеджер логирования, использующий log_dir из config.json.
@@ -212,7 +230,7 @@ class LogManager:
             str: Путь к созданному лог-файлу.
         """
         # Определение имени файла лога
-        base = os.path.splitext(os.path.basename(self.csv_filename))[0]
+        base = file_log_name(self.csv_filename)
         date = datetime.now().strftime("%Y-%m-%d")
         log_file = os.path.join(log_dir, f"{base}_{date}.log") # Используем log_dir из config
 
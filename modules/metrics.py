@@ -0,0 +1,321 @@
+# metrics.py
+"""
+Модуль для сбора метрик производительности запуска.
+
+Предоставляет лёгкие таймеры и счётчики (контекстные менеджеры и
+декоратор), которые модули проекта вызывают через активный сборщик
+get_active(). Если сборщик не активирован, вызовы ничего не делают.
+По завершении запуска формируется JSON-отчёт с метриками по каждому
+файлу и по запуску в целом.
+"""
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+
+METRICS_ENABLED = CONFIG.get('metrics', {}).get('enabled', True)
+"""bool: Флаг включения сбора метрик."""
+
+LDAP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+"""tuple: Верхние границы (в секундах) корзин гистограммы задержек LDAP."""
+
+
+class RunMetrics:
+    """
+    Сборщик метрик одного запуска.
+
+    Длительности этапов накапливаются по имени этапа, счётчики — по имени
+    счётчика. Всё, что измерено внутри file_scope(), дополнительно
+    учитывается в метриках соответствующего файла.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Инициализирует сборщик.
+
+        Args:
+            enabled (bool): Если False, все таймеры и счётчики ничего не делают.
+        """
+        self.enabled = enabled
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._finished: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.files: Dict[str, Dict] = {}
+        # Подобранные во время запуска параметры (например, размер пакета поиска в AD)
+        self.tuning: Dict[str, Dict] = {}
+        self.ldap_buckets: List[int] = [0] * (len(LDAP_BUCKETS) + 1)
+        self.ldap_sum = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # --- Текущий файл ---
+    def _current_file(self) -> Optional[Dict]:
+        """Возвращает метрики файла, обрабатываемого в текущем потоке."""
+        return getattr(self._local, 'file', None)
+
+    @contextmanager
+    def file_scope(self, csv_file: str):
+        """
+        Контекст обработки одного файла: всё измеренное внутри попадает в его метрики.
+
+        Args:
+            csv_file (str): Имя обрабатываемого файла.
+        """
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            file_metrics = self.files.setdefault(
+                csv_file, {'stages': {}, 'counters': {}, 'duration': 0.0})
+        previous = self._current_file()
+        self._local.file = file_metrics
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                file_metrics['duration'] += elapsed
+            self._local.file = previous
+
+    # --- Таймеры и счётчики ---
+    def add_time(self, stage: str, seconds: float):
+        """
+        Добавляет длительность к этапу.
+
+        Args:
+            stage (str): Имя этапа.
+            seconds (float): Длительность в секундах.
+        """
+        if not self.enabled:
+            return
+        file_metrics = self._current_file()
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            if file_metrics is not None:
+                stages = file_metrics['stages']
+                stages[stage] = stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Измеряет длительность блока кода и добавляет её к этапу.
+
+        Args:
+            stage (str): Имя этапа.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count(self, name: str, value: int = 1):
+        """
+        Увеличивает счётчик.
+
+        Args:
+            name (str): Имя счётчика.
+            value (int): Величина приращения.
+        """
+        if not self.enabled:
+            return
+        file_metrics = self._current_file()
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if file_metrics is not None:
+                counters = file_metrics['counters']
+                counters[name] = counters.get(name, 0) + value
+
+    def set_tuning(self, name: str, params: Dict):
+        """
+        Сохраняет текущие значения подбираемых параметров.
+
+        Args:
+            name (str): Имя набора параметров (например, ad_lookup:primary).
+            params (Dict): Параметры и их значения.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.tuning[name] = dict(params)
+
+    def observe_ldap(self, seconds: float):
+        """
+        Учитывает один LDAP-запрос в счётчике и гистограмме задержек.
+
+        Args:
+            seconds (float): Задержка запроса в секундах.
+        """
+        if not self.enabled:
+            return
+        bucket = len(LDAP_BUCKETS)
+        for i, bound in enumerate(LDAP_BUCKETS):
+            if seconds <= bound:
+                bucket = i
+                break
+        with self._lock:
+            self.ldap_buckets[bucket] += 1
+            self.ldap_sum += seconds
+        self.count('ldap_queries')
+        self.add_time('ldap', seconds)
+
+    @contextmanager
+    def ldap_timer(self):
+        """Измеряет один LDAP-запрос (см. observe_ldap)."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_ldap(time.perf_counter() - start)
+
+    # --- Отчёт ---
+    def finish(self):
+        """Фиксирует время окончания запуска."""
+        if self._finished is None:
+            self._finished = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        """float: Длительность запуска в секундах."""
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return end - self._start
+
+    def to_dict(self) -> Dict:
+        """
+        Формирует отчёт о метриках.
+
+        Returns:
+            Dict: Метрики запуска и каждого файла.
+        """
+        with self._lock:
+            duration = self.duration
+            rows = self.counters.get('rows_read', 0)
+            files = {}
+            for name, data in self.files.items():
+                file_rows = data['counters'].get('rows_read', 0)
+                files[name] = {
+                    'duration': round(data['duration'], 6),
+                    'rows_per_sec': round(file_rows / data['duration'], 2) if data['duration'] else 0.0,
+                    'stages': {k: round(v, 6) for k, v in data['stages'].items()},
+                    'counters': dict(data['counters'])
+                }
+            # Гистограмма накопительная, как в Prometheus: le_X — запросы не дольше X секунд
+            histogram = {}
+            cumulative = 0
+            for bound, value in zip(LDAP_BUCKETS, self.ldap_buckets):
+                cumulative += value
+                histogram[f"le_{bound}"] = cumulative
+            histogram['le_inf'] = cumulative + self.ldap_buckets[-1]
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'duration': round(duration, 6),
+                'rows_per_sec': round(rows / duration, 2) if duration else 0.0,
+                'stages': {k: round(v, 6) for k, v in self.stages.items()},
+                'counters': dict(self.counters),
+                'ldap': {
+                    'queries': sum(self.ldap_buckets),
+                    'latency_sum': round(self.ldap_sum, 6),
+                    'latency_histogram': histogram
+                },
+                'tuning': {k: dict(v) for k, v in self.tuning.items()},
+                'files': files
+            }
+
+    def write_report(self, directory: str) -> str:
+        """
+        Сохраняет JSON-отчёт о метриках в указанную директорию.
+
+        Args:
+            directory (str): Директория для отчёта (обычно директория логов).
+
+        Returns:
+            str: Путь к созданному файлу отчёта.
+        """
+        self.finish()
+        os.makedirs(directory, exist_ok=True)
+        stamp = self.started_at.strftime("%Y-%m-%d_%H%M%S")
+        path = os.path.join(directory, f"metrics_{stamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+# --- Активный сборщик ---
+_NULL_METRICS = RunMetrics(enabled=False)
+_active_metrics: RunMetrics = _NULL_METRICS
+
+
+def start_run() -> RunMetrics:
+    """
+    Создаёт сборщик для нового запуска и делает его активным.
+
+    Returns:
+        RunMetrics: Активный сборщик (отключённый, если metrics.enabled = false).
+    """
+    global _active_metrics
+    _active_metrics = RunMetrics(enabled=METRICS_ENABLED)
+    return _active_metrics
+
+
+def get_active() -> RunMetrics:
+    """
+    Возвращает активный сборщик метрик.
+
+    Returns:
+        RunMetrics: Активный сборщик или отключённый сборщик-заглушка.
+    """
+    return _active_metrics
+
+
+def timed(stage: str):
+    """
+    Декоратор: измеряет длительность вызова функции как этап stage.
+
+    Args:
+        stage (str): Имя этапа.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_active().timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_logger(logger):
+    """
+    Оборачивает обработчики логгера, чтобы время логирования попадало в этап 'logging'.
+
+    Время логирования частично пересекается с другими этапами, внутри которых пишутся логи.
+
+    Args:
+        logger (logging.Logger): Логгер файла.
+    """
+    for handler in logger.handlers:
+        if getattr(handler, '_metrics_wrapped', False):
+            continue
+        original = handler.handle
+
+        def handle(record, _original=original):
+            with get_active().timer('logging'):
+                return _original(record)
+
+        handler.handle = handle
+        handler._metrics_wrapped = True
@@ -0,0 +1,205 @@
+# metrics_exporter.py
+"""
+Модуль для экспорта метрик запуска в формате Prometheus.
+
+Поддерживаются два способа:
+- textfile для node-exporter (textfile collector): файл перезаписывается
+  атомарно после каждого обработанного файла и в конце запуска;
+- локальный HTTP-эндпоинт /metrics, который работает во время запуска.
+"""
+import os
+import threading
+import logging
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .metrics import RunMetrics, LDAP_BUCKETS, get_active
+
+METRICS_TEXTFILE = CONFIG.get('metrics', {}).get('textfile', '')
+"""str: Путь к .prom-файлу для node-exporter (пусто — не писать)."""
+
+METRICS_HTTP_PORT = CONFIG.get('metrics', {}).get('http_port', 0)
+"""int: Порт HTTP-эндпоинта /metrics (0 — не запускать)."""
+
+METRICS_HTTP_HOST = CONFIG.get('metrics', {}).get('http_host', '127.0.0.1')
+"""str: Адрес, на котором слушает HTTP-эндпоинт /metrics."""
+
+PREFIX = 'user_creator'
+"""str: Префикс имён метрик."""
+
+
+def _line(lines: List[str], name: str, metric_type: str, help_text: str, samples: List[tuple]):
+    """
+    Добавляет описание метрики и её значения в формате Prometheus.
+
+    Args:
+        lines (List[str]): Список строк вывода.
+        name (str): Имя метрики без префикса.
+        metric_type (str): Тип метрики (counter, gauge, histogram).
+        help_text (str): Описание метрики.
+        samples (List[tuple]): Пары (метки, значение); метки — строка вида 'a="b"' или ''.
+    """
+    full_name = f"{PREFIX}_{name}"
+    lines.append(f"# HELP {full_name} {help_text}")
+    lines.append(f"# TYPE {full_name} {metric_type}")
+    for labels, value in samples:
+        suffix = f"{{{labels}}}" if labels else ''
+        lines.append(f"{full_name}{suffix} {value}")
+
+
+def render_prometheus(metrics: RunMetrics) -> str:
+    """
+    Формирует метрики запуска в текстовом формате Prometheus.
+
+    Args:
+        metrics (RunMetrics): Сборщик метрик запуска.
+
+    Returns:
+        str: Текст в формате exposition format.
+    """
+    data = metrics.to_dict()
+    counters = data['counters']
+    lines: List[str] = []
+
+    _line(lines, 'files_processed_total', 'counter', 'Успешно обработанные файлы.',
+          [('', counters.get('files_processed', 0))])
+    _line(lines, 'files_failed_total', 'counter', 'Файлы, обработанные с ошибками.',
+          [('', counters.get('files_failed', 0))])
+    _line(lines, 'rows_processed_total', 'counter', 'Прочитанные строки CSV.',
+          [('', counters.get('rows_read', 0))])
+    _line(lines, 'users_processed_total', 'counter', 'Пользователи, попавшие в XML.',
+          [('', counters.get('users_processed', 0))])
+    _line(lines, 'duplicates_total', 'counter', 'Повторные вхождения пользователей.',
+          [('', counters.get('duplicates', 0))])
+    _line(lines, 'bytes_written_total', 'counter', 'Записанные байты (XML и CSV).',
+          [('', counters.get('bytes_written', 0))])
+    _line(lines, 'ad_lookups_total', 'counter', 'Поиски пользователей в AD по результату.',
+          [('result="found"', counters.get('ad_found', 0)),
+           ('result="not_found"', counters.get('ad_not_found', 0)),
+           ('result="error"', counters.get('ad_errors', 0)),
+           ('result="prefiltered"', counters.get('ad_prefiltered', 0))])
+
+    hits = counters.get('lookup_cache_hits', 0)
+    misses = counters.get('lookup_cache_misses', 0)
+    _line(lines, 'lookup_cache_requests_total', 'counter', 'Обращения к кэшу поиска в AD.',
+          [('result="hit"', hits), ('result="miss"', misses)])
+    _line(lines, 'lookup_cache_hit_ratio', 'gauge', 'Доля попаданий в кэш поиска в AD.',
+          [('', round(hits / (hits + misses), 6) if hits + misses else 0)])
+
+    _line(lines, 'stage_duration_seconds', 'gauge', 'Суммарная длительность этапов обработки.',
+          [(f'stage="{stage}"', value) for stage, value in sorted(data['stages'].items())])
+    _line(lines, 'run_duration_seconds', 'gauge', 'Длительность запуска.',
+          [('', data['duration'])])
+    _line(lines, 'rows_per_second', 'gauge', 'Пропускная способность запуска (строк в секунду).',
+          [('', data['rows_per_sec'])])
+    _line(lines, 'last_run_timestamp_seconds', 'gauge', 'Время начала запуска (Unix time).',
+          [('', int(metrics.started_at.timestamp()))])
+
+    _line(lines, 'ad_lookup_tuning', 'gauge', 'Подобранные параметры пакетного поиска в AD.',
+          [(f'domain="{name.split(":", 1)[1]}",param="{param}"', value)
+           for name, params in sorted(data['tuning'].items()) if name.startswith('ad_lookup:')
+           for param, value in sorted(params.items())])
+
+    ldap = data['ldap']
+    histogram = ldap['latency_histogram']
+    samples = [(f'le="{bound}"', histogram[f"le_{bound}"]) for bound in LDAP_BUCKETS]
+    samples.append(('le="+Inf"', histogram['le_inf']))
+    full_name = f"{PREFIX}_ldap_query_duration_seconds"
+    lines.append(f"# HELP {full_name} Задержка LDAP-запросов.")
+    lines.append(f"# TYPE {full_name} histogram")
+    for labels, value in samples:
+        lines.append(f"{full_name}_bucket{{{labels}}} {value}")
+    lines.append(f"{full_name}_sum {ldap['latency_sum']}")
+    lines.append(f"{full_name}_count {ldap['queries']}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(metrics: RunMetrics, file_path: str = METRICS_TEXTFILE):
+    """
+    Атомарно записывает метрики в .prom-файл для node-exporter.
+
+    Файл сначала пишется во временный файл в той же директории и затем
+    переименовывается, чтобы node-exporter не прочитал его частично.
+
+    Args:
+        metrics (RunMetrics): Сборщик метрик запуска.
+        file_path (str): Путь к .prom-файлу.
+    """
+    if not file_path or not metrics.enabled:
+        return
+    try:
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(render_prometheus(metrics))
+        os.replace(tmp_path, file_path)
+    except Exception as e:
+        logging.getLogger(__name__).warning(
+            f"Ошибка записи метрик в {file_path}: {e}")
+        logging.getLogger(__name__).debug(
+            f"Детали ошибки: {traceback.format_exc()}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов к /metrics."""
+
+    def do_GET(self):
+        """Отдаёт метрики активного запуска."""
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus(get_active()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Перенаправляет журнал запросов в logging."""
+        logging.getLogger(__name__).debug(format % args)
+
+
+def start_http_server(port: int = METRICS_HTTP_PORT,
+                      host: str = METRICS_HTTP_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    Запускает HTTP-эндпоинт /metrics в фоновом потоке.
+
+    Args:
+        port (int): Порт (0 — не запускать).
+        host (str): Адрес для прослушивания.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: Запущенный сервер или None.
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        thread = threading.Thread(
+            target=server.serve_forever, name="MetricsHTTPServer", daemon=True)
+        thread.start()
+        logging.getLogger(__name__).info(
+            f"Метрики доступны по адресу http://{host}:{port}/metrics")
+        return server
+    except Exception as e:
+        logging.getLogger(__name__).warning(
+            f"Не удалось запустить HTTP-эндпоинт метрик на {host}:{port}: {e}")
+        return None
+
+
+def stop_http_server(server: Optional[ThreadingHTTPServer]):
+    """
+    Останавливает HTTP-эндпоинт /metrics.
+
+    Args:
+        server (Optional[ThreadingHTTPServer]): Сервер, возвращённый start_http_server.
+    """
+    if server is not None:
+        server.shutdown()
+        server.server_close()
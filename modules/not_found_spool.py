@@ -0,0 +1,172 @@
+# not_found_spool.py
+"""
+Модуль накопления пользователей, не найденных в AD (not_in_AD.csv).
+
+Вместо списка в памяти на весь запуск записи копятся в буфере ограниченного
+размера (output.not_in_ad_buffer_rows); заполненный буфер сортируется по
+логину и сбрасывается во временный файл-серию. В конце запуска серии
+сливаются (внешняя сортировка слиянием, heapq.merge) прямо в
+not_in_AD.csv, повторные (непустые) логины при этом отбрасываются. В памяти
+одновременно находится не больше одного буфера и по одной строке
+каждой серии.
+"""
+import os
+import csv
+import heapq
+import shutil
+import tempfile
+import threading
+import weakref
+from contextlib import ExitStack
+from typing import Dict, Iterator, List, Tuple
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .output_writer import atomic_open
+
+SPOOL_BUFFER_ROWS = CONFIG.get('output', {}).get('not_in_ad_buffer_rows', 50000)
+"""int: Число записей в памяти, после которого они сбрасываются во временный файл."""
+
+SPOOL_DIR = CONFIG.get('output', {}).get('spill_dir', '')
+"""str: Директория временных файлов (пусто — системная временная директория)."""
+
+MERGE_FAN_IN = 64
+"""int: Сколько серий сливается за один проход (ограничивает число открытых файлов)."""
+
+FIELDNAMES = ['login', 'name', 'person_guid']
+"""List[str]: Столбцы not_in_AD.csv."""
+
+# Запись серии: логин, порядковый номер (для устойчивой сортировки), имя, GUID
+_Record = Tuple[str, int, str, str]
+
+
+def _read_run(f) -> Iterator[_Record]:
+    """Читает записи серии из открытого файла."""
+    for login, seq, name, person_guid in csv.reader(f, delimiter=';'):
+        yield login, int(seq), name, person_guid
+
+
+def _write_run(path: str, records):
+    """Записывает отсортированные записи в файл серии."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, delimiter=';').writerows(records)
+
+
+class NotFoundSpool:
+    """
+    Накопитель пользователей, не найденных в AD, с внешней сортировкой.
+
+    Заменяет список not_found_in_ad: поддерживает append(dict) и len().
+    Методы безопасны для вызова из нескольких потоков.
+    """
+
+    def __init__(self, buffer_rows: int = SPOOL_BUFFER_ROWS, directory: str = SPOOL_DIR):
+        """
+        Создаёт пустой накопитель.
+
+        Args:
+            buffer_rows (int): Размер буфера в записях.
+            directory (str): Директория временных файлов (пусто — системная).
+        """
+        self.buffer_rows = max(1, buffer_rows)
+        self.directory = directory
+        self.runs: List[str] = []
+        self._buffer: List[_Record] = []
+        self._count = 0
+        self._spill_dir = None
+        self._finalizer = None
+        self._run_number = 0
+        self._lock = threading.Lock()
+
+    def append(self, user: Dict):
+        """
+        Добавляет пользователя.
+
+        Args:
+            user (Dict): Словарь с ключами login, name, person_guid.
+        """
+        with self._lock:
+            self._buffer.append((user.get('login') or '', self._count,
+                                 user.get('name') or '', user.get('person_guid') or ''))
+            self._count += 1
+            if len(self._buffer) >= self.buffer_rows:
+                self._spill()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _new_run_path(self) -> str:
+        """Возвращает путь к новому файлу серии, создавая временную директорию."""
+        if self._spill_dir is None:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix='not_in_ad_', dir=self.directory or None)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        self._run_number += 1
+        return os.path.join(self._spill_dir, f"run{self._run_number:06d}.csv")
+
+    def _spill(self):
+        """Сортирует буфер и сбрасывает его в новую серию (вызывается под блокировкой)."""
+        self._buffer.sort()
+        path = self._new_run_path()
+        _write_run(path, self._buffer)
+        self.runs.append(path)
+        self._buffer = []
+
+    def _merge(self, runs: List[str]) -> str:
+        """Сливает несколько серий в одну новую и удаляет исходные."""
+        path = self._new_run_path()
+        with ExitStack() as stack:
+            sources = [_read_run(stack.enter_context(open(run, newline='', encoding='utf-8')))
+                       for run in runs]
+            _write_run(path, heapq.merge(*sources))
+        for run in runs:
+            os.remove(run)
+        return path
+
+    def write(self, file_path: str) -> int:
+        """
+        Сливает все записи в отсортированный по логину CSV без повторов.
+
+        Из записей с одинаковым непустым логином остаётся первая добавленная;
+        записи без логина сохраняются все.
+
+        Args:
+            file_path (str): Путь к not_in_AD.csv.
+
+        Returns:
+            int: Число записанных пользователей.
+        """
+        with self._lock:
+            self._buffer.sort()
+            # Многопроходное слияние, если серий больше MERGE_FAN_IN
+            while len(self.runs) >= MERGE_FAN_IN:
+                self.runs = [self._merge(self.runs[i:i + MERGE_FAN_IN])
+                             for i in range(0, len(self.runs), MERGE_FAN_IN)]
+            written = 0
+            previous = None
+            with ExitStack() as stack:
+                sources = [_read_run(stack.enter_context(open(run, newline='', encoding='utf-8')))
+                           for run in self.runs]
+                f = stack.enter_context(atomic_open(file_path, newline='', encoding='utf-8'))
+                writer = csv.writer(f, delimiter=';')
+                writer.writerow(FIELDNAMES)
+                for login, _, name, person_guid in heapq.merge(*sources, self._buffer):
+                    # Строки без логина не считаются повторами друг друга
+                    if login and login == previous:
+                        continue
+                    previous = login
+                    writer.writerow([login, name, person_guid])
+                    written += 1
+            return written
+
+    def close(self):
+        """Удаляет временные файлы и очищает накопитель."""
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._finalizer = None
+            self._spill_dir = None
+            self.runs = []
+            self._buffer = []
+            self._count = 0
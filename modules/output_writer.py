@@ -0,0 +1,134 @@
+# output_writer.py
+"""
+Модуль атомарной записи выходных файлов.
+
+Каждый файл пишется во временный файл в той же директории с большим
+буфером (мало крупных операций записи вместо множества мелких — это
+важно для SMB/NFS) и затем переименовывается на место целевого файла.
+Читатель видит либо старую, либо полностью записанную новую версию файла.
+
+Политика fsync (output.fsync):
+- "none"   — без fsync (по умолчанию, как до появления политики): файл не
+             обрезается при падении процесса, но может потеряться при
+             отключении питания;
+- "batch"  — fsync каждого файла перед переименованием, а директории
+             синхронизируются один раз в конце пакета (sync_directories);
+- "always" — fsync файла и его директории сразу после каждой записи.
+
+"batch" и "always" синхронно сбрасывают на диск каждый файл, что заметно
+замедляет запись на SMB/NFS; их стоит включать, только если результаты
+должны пережить отключение питания.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional, Set
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+
+WRITE_BUFFER_SIZE = CONFIG['output'].get('write_buffer_kb', 1024) * 1024
+"""int: Размер буфера записи в байтах."""
+
+FSYNC_POLICY = CONFIG['output'].get('fsync', 'none')
+"""str: Политика fsync: none, batch или always."""
+
+_pending_dirs: Set[str] = set()
+_pending_lock = threading.Lock()
+
+
+def _fsync_directory(directory: str):
+    """
+    Синхронизирует директорию, чтобы переименование пережило сбой питания.
+
+    На Windows директорию нельзя открыть для fsync, там вызов ничего не делает.
+    """
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(file_path: str, mode: str = 'w', encoding: Optional[str] = 'utf-8',
+                newline: Optional[str] = None, fsync: str = FSYNC_POLICY):
+    """
+    Открывает файл для атомарной записи.
+
+    Данные пишутся во временный файл рядом с целевым; при успешном выходе из
+    блока временный файл переименовывается в file_path, при исключении — удаляется.
+
+    Args:
+        file_path (str): Путь к целевому файлу.
+        mode (str): Режим открытия ('w' или 'wb').
+        encoding (Optional[str]): Кодировка (для текстового режима).
+        newline (Optional[str]): Параметр newline для текстового режима.
+        fsync (str): Политика fsync (см. описание модуля).
+
+    Yields:
+        Файловый объект временного файла.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    tmp_path = os.path.join(
+        directory, f".{os.path.basename(file_path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if 'b' in mode:
+        f = open(tmp_path, mode, buffering=WRITE_BUFFER_SIZE)
+    else:
+        f = open(tmp_path, mode, buffering=WRITE_BUFFER_SIZE, encoding=encoding, newline=newline)
+    try:
+        with f:
+            yield f
+            f.flush()
+            if fsync in ('batch', 'always'):
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync == 'always':
+        _fsync_directory(directory)
+    elif fsync == 'batch':
+        with _pending_lock:
+            _pending_dirs.add(directory)
+
+
+def atomic_write_text(file_path: str, content: str, encoding: str = 'utf-8',
+                      fsync: str = FSYNC_POLICY) -> int:
+    """
+    Атомарно записывает текст в файл.
+
+    Args:
+        file_path (str): Путь к файлу.
+        content (str): Содержимое.
+        encoding (str): Кодировка.
+        fsync (str): Политика fsync.
+
+    Returns:
+        int: Размер записанного файла в байтах.
+    """
+    with atomic_open(file_path, 'w', encoding=encoding, fsync=fsync) as f:
+        f.write(content)
+    return os.path.getsize(file_path)
+
+
+def sync_directories():
+    """
+    Синхронизирует директории, в которые были записаны файлы при политике batch.
+
+    Вызывается один раз в конце пакета файлов.
+    """
+    with _pending_lock:
+        directories = list(_pending_dirs)
+        _pending_dirs.clear()
+    for directory in directories:
+        try:
+            _fsync_directory(directory)
+        except OSError:
+            pass
@@ -0,0 +1,144 @@
+# pipeline.py
+"""
+Модуль конвейерной обработки файлов.
+
+Обработка файла делится на три этапа, которые выполняются разными потоками
+и связаны очередями ограниченного размера:
+
+- чтение (один поток): чтение и проверка файла;
+- поиск (пул потоков): сетевые запросы, например пакетный поиск логинов в AD;
+- запись (один поток): обработка строк, генерация и запись XML/CSV.
+
+Пока один файл записывается, следующие ищутся в AD и читаются с диска,
+поэтому диск, сеть и процессор работают одновременно. Число файлов,
+находящихся в памяти одновременно, ограничено (resolvers + 2 × queue_size):
+чтение следующего файла ждёт, пока не будет записан один из предыдущих.
+Этап записи получает файлы строго в исходном порядке (индекс дубликатов
+и отчёты не зависят от того, какой поиск завершился раньше).
+"""
+import queue
+import logging
+import threading
+import traceback
+from typing import Callable, Dict, Iterable, Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+
+PIPELINE_ENABLED = CONFIG.get('pipeline', {}).get('enabled', False)
+"""bool: Обрабатывать файлы конвейером (чтение, поиск и запись параллельно)."""
+
+PIPELINE_RESOLVERS = CONFIG.get('pipeline', {}).get('resolvers', 2)
+"""int: Число потоков этапа поиска."""
+
+PIPELINE_QUEUE_SIZE = CONFIG.get('pipeline', {}).get('queue_size', 2)
+"""int: Размер каждой очереди между этапами (файлов)."""
+
+_DONE = object()
+"""Маркер конца очереди."""
+
+
+def run_pipeline(
+    items: Iterable,
+    read: Callable,
+    resolve: Callable,
+    write: Callable,
+    resolvers: int = PIPELINE_RESOLVERS,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    on_result: Optional[Callable] = None
+) -> Dict:
+    """
+    Обрабатывает элементы конвейером «чтение → поиск → запись».
+
+    Args:
+        items (Iterable): Элементы (например, имена файлов).
+        read (Callable): read(item) -> задание или None (ошибка, запись не выполняется).
+        resolve (Callable): resolve(задание) -> задание; выполняется в пуле потоков.
+        write (Callable): write(задание) -> bool; вызывается в порядке items.
+        resolvers (int): Число потоков этапа поиска.
+        queue_size (int): Размер очередей между этапами.
+        on_result (Optional[Callable]): on_result(item, success) после записи
+            каждого элемента (в потоке записи).
+
+    Returns:
+        Dict: Элемент -> результат (True — успешно).
+    """
+    logger = logging.getLogger(__name__)
+    resolvers = max(1, resolvers)
+    read_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    resolved_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    results: Dict = {}
+    # Файлы между началом чтения и концом записи (включая ждущие своей очереди записи)
+    in_flight = threading.Semaphore(resolvers + 2 * max(1, queue_size))
+
+    def reader():
+        try:
+            for index, item in enumerate(items):
+                in_flight.acquire()
+                try:
+                    job = read(item)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка чтения {item}: {e}")
+                    logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+                    job = None
+                read_queue.put((index, item, job))
+        finally:
+            for _ in range(resolvers):
+                read_queue.put(_DONE)
+
+    def resolver():
+        try:
+            while True:
+                entry = read_queue.get()
+                if entry is _DONE:
+                    break
+                index, item, job = entry
+                if job is not None:
+                    try:
+                        job = resolve(job)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка поиска для {item}: {e}")
+                        logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+                        job = None
+                resolved_queue.put((index, item, job))
+        finally:
+            resolved_queue.put(_DONE)
+
+    def writer():
+        pending = {}
+        next_index = 0
+        finished = 0
+        while finished < resolvers:
+            entry = resolved_queue.get()
+            if entry is _DONE:
+                finished += 1
+                continue
+            pending[entry[0]] = entry
+            # Запись строго по порядку: более поздние файлы ждут в буфере
+            while next_index in pending:
+                _, item, job = pending.pop(next_index)
+                next_index += 1
+                success = False
+                if job is not None:
+                    try:
+                        success = bool(write(job))
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка записи результатов {item}: {e}")
+                        logger.debug(f"Детали ошибки: {traceback.format_exc()}")
+                results[item] = success
+                in_flight.release()
+                if on_result is not None:
+                    try:
+                        on_result(item, success)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка обработки результата {item}: {e}")
+
+    threads = [threading.Thread(target=reader, name="pipeline-reader", daemon=True)]
+    threads += [threading.Thread(target=resolver, name=f"pipeline-resolver-{i}", daemon=True)
+                for i in range(resolvers)]
+    threads.append(threading.Thread(target=writer, name="pipeline-writer", daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,201 @@
+# profiling.py
+"""
+Модуль для профилирования запуска.
+
+Запускает функцию под cProfile и одновременно под простым семплирующим
+профилировщиком. Профилируются все потоки процесса: семплер снимает стеки
+каждого потока, а рабочие потоки, созданные во время профилирования (пулы
+поиска в AD ad-batch/ad-domain, конвейер, --jobs, asyncio), получают свой
+cProfile, который при сохранении объединяется с профилем вызывающего потока.
+Результаты сохраняются в директорию логов:
+- profile_{имя}_{дата}.prof   — статистика cProfile (snakeviz, pstats);
+- profile_{имя}_{дата}.folded — свёрнутые стеки для flamegraph.pl/speedscope;
+- profile_{имя}_{дата}.txt    — текстовая сводка, включая время в ldap3 и logging.
+"""
+import os
+import sys
+import io
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Any, List
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+
+SAMPLE_INTERVAL = CONFIG.get('profiling', {}).get('sample_interval_ms', 5) / 1000.0
+"""float: Интервал семплирования стека (в секундах)."""
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик всех потоков процесса.
+
+    Фоновый поток с заданным интервалом снимает стеки всех потоков
+    через sys._current_frames() и считает одинаковые стеки. Первый элемент
+    стека — имя потока, поэтому в flamegraph потоки видны отдельными ветвями.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        """
+        Инициализирует профилировщик.
+
+        Args:
+            interval (float): Интервал семплирования в секундах.
+        """
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._sample_loop, name="SamplingProfiler", daemon=True)
+
+    def _sample_loop(self):
+        """Снимает стеки всех потоков (кроме собственного) до остановки профилировщика."""
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        """Запускает семплирование."""
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает семплирование."""
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, file_path: str):
+        """
+        Сохраняет свёрнутые стеки в формате flamegraph.pl ("стек количество").
+
+        Args:
+            file_path (str): Путь к файлу.
+        """
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ThreadProfiles:
+    """
+    Профили cProfile рабочих потоков.
+
+    cProfile.Profile.enable() действует только на вызывающий поток, поэтому
+    через threading.setprofile в каждый поток, запущенный после start(),
+    устанавливается хук: при первом событии он создаёт для потока свой
+    Profile и включает его (это заменяет хук, так что он срабатывает один раз).
+    """
+
+    def __init__(self):
+        """Инициализирует пустой набор профилей."""
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _hook(self, frame, event, arg):
+        """Включает cProfile в новом потоке."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        """Начинает профилировать потоки, запускаемые с этого момента."""
+        threading.setprofile(self._hook)
+
+    def stop(self):
+        """Перестаёт устанавливать профилировщик в новые потоки."""
+        threading.setprofile(None)
+
+
+def _write_summary(stats: pstats.Stats, file_path: str, elapsed: float):
+    """
+    Сохраняет текстовую сводку cProfile.
+
+    Args:
+        stats (pstats.Stats): Статистика всех профилированных потоков.
+        file_path (str): Путь к файлу сводки.
+        elapsed (float): Полное время выполнения в секундах.
+    """
+    buffer = io.StringIO()
+    buffer.write(f"Полное время выполнения: {elapsed:.3f} с\n\n")
+    stats.stream = buffer
+    stats.sort_stats('cumulative')
+    buffer.write("=== Топ-50 функций по суммарному времени ===\n")
+    stats.print_stats(50)
+    buffer.write("\n=== Вызовы ldap3 (запросы к AD) ===\n")
+    stats.print_stats('ldap3', 20)
+    buffer.write("\n=== Вызовы logging ===\n")
+    stats.print_stats(r'logging[\\/]', 20)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(buffer.getvalue())
+
+
+def profile_call(func: Callable, out_dir: str, name: str, *args, **kwargs) -> Any:
+    """
+    Выполняет функцию под cProfile и семплирующим профилировщиком.
+
+    Семплер снимает стеки всех потоков; cProfile включается в текущем
+    потоке и во всех потоках, запущенных во время выполнения функции.
+    Потоки, созданные до вызова, в статистику cProfile не попадают.
+
+    Args:
+        func (Callable): Профилируемая функция.
+        out_dir (str): Директория для результатов (обычно директория логов).
+        name (str): Имя профиля, попадает в имена файлов.
+        *args: Позиционные аргументы функции.
+        **kwargs: Именованные аргументы функции.
+
+    Returns:
+        Any: Результат функции.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    base_path = os.path.join(out_dir, f"profile_{name}_{stamp}")
+
+    sampler = SamplingProfiler()
+    thread_profiles = ThreadProfiles()
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    sampler.start()
+    thread_profiles.start()
+    profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        thread_profiles.stop()
+        sampler.stop()
+        elapsed = time.perf_counter() - start
+        # Профили рабочих потоков объединяются с профилем текущего потока
+        stats = pstats.Stats(profile)
+        for thread_profile in thread_profiles.profiles:
+            stats.add(thread_profile)
+        stats.dump_stats(f"{base_path}.prof")
+        sampler.write_folded(f"{base_path}.folded")
+        _write_summary(stats, f"{base_path}.txt", elapsed)
+        print(f"🔬 Профиль сохранён: {base_path}.prof, {base_path}.folded, {base_path}.txt")
+
+
+def profiling_requested() -> bool:
+    """
+    Проверяет, включено ли профилирование через переменную окружения USER_CREATOR_PROFILE.
+
+    Returns:
+        bool: True, если профилирование включено.
+    """
+    return os.environ.get('USER_CREATOR_PROFILE', '').strip().lower() in ('1', 'true', 'yes', 'y')
@@ -0,0 +1,203 @@
+# table_readers.py
+"""
+Модуль для чтения табличных выгрузок (Parquet, Arrow/Feather, XLSX).
+
+Файлы читаются пакетами записей (record batches), колонки переименовываются
+в колонки Sample.csv по input.column_map, после чего строки поступают в тот
+же обработчик, что и строки CSV (process_rows). Для Parquet и Arrow
+обрезка пробелов в name/login/person_guid и отбор строк с пустым именем
+выполняются по колонкам средствами pyarrow.compute.
+
+Пакеты ограничивают только промежуточную память Arrow/openpyxl (таблица
+целиком в формате Arrow не строится). Строки файла, как и строки CSV,
+нужны обработчику все сразу (перезапись, дубликаты, XML), поэтому
+read_table_file загружает в память весь файл в виде списка словарей;
+iter_table_rows отдаёт строки пакетами для потоковой обработки.
+
+Зависимости необязательные (requirements-optional.txt): pyarrow — для
+Parquet и Arrow, openpyxl — для XLSX.
+"""
+import os
+import logging
+from typing import Dict, Iterator, List
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .csv_processing import USER_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow не установлен: Parquet и Arrow недоступны
+    pa = pc = pq = None
+
+try:
+    import openpyxl
+except ImportError:  # openpyxl не установлен: XLSX недоступен
+    openpyxl = None
+
+BATCH_ROWS = CONFIG['input'].get('batch_rows', 65536)
+"""int: Размер пакета записей при чтении."""
+
+COLUMN_MAP: Dict[str, str] = CONFIG['input'].get('column_map', {})
+"""Dict[str, str]: Соответствие колонок выгрузки колонкам Sample.csv (исходная -> Sample.csv)."""
+
+PARQUET_EXTENSIONS = ('.parquet',)
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+XLSX_EXTENSIONS = ('.xlsx',)
+TABLE_EXTENSIONS = PARQUET_EXTENSIONS + ARROW_EXTENSIONS + XLSX_EXTENSIONS
+"""tuple: Расширения файлов, которые читаются этим модулем."""
+
+_TRIMMED_FIELDS = ('name', 'login', 'person_guid')
+
+
+def is_table_file(file_path: str) -> bool:
+    """
+    Проверяет, читается ли файл этим модулем (по расширению).
+
+    Args:
+        file_path (str): Путь к файлу.
+
+    Returns:
+        bool: True для Parquet, Arrow/Feather и XLSX.
+    """
+    return os.path.splitext(file_path)[1].lower() in TABLE_EXTENSIONS
+
+
+def _target_column(column: str) -> str:
+    """Возвращает колонку Sample.csv для колонки выгрузки."""
+    return COLUMN_MAP.get(column, column)
+
+
+def _normalize_arrow_batch(batch) -> List[Dict]:
+    """
+    Приводит пакет Arrow к строкам в схеме Sample.csv.
+
+    Колонки переименовываются, приводятся к строкам, пустые значения
+    заменяются на ''; name, login и person_guid обрезаются, строки с пустым
+    name отбрасываются — всё по колонкам, без цикла по строкам.
+
+    Args:
+        batch (pyarrow.RecordBatch): Пакет записей.
+
+    Returns:
+        List[Dict]: Строки с колонками USER_FIELDS.
+    """
+    columns = {}
+    for name, column in zip(batch.schema.names, batch.columns):
+        target = _target_column(name)
+        if target in USER_FIELDS and target not in columns:
+            columns[target] = column
+    length = batch.num_rows
+    arrays = []
+    for field in USER_FIELDS:
+        column = columns.get(field)
+        if column is None:
+            arrays.append(pa.nulls(length, pa.string()).fill_null(''))
+            continue
+        column = pc.cast(column, pa.string()).fill_null('')
+        if field in _TRIMMED_FIELDS:
+            column = pc.utf8_trim_whitespace(column)
+        arrays.append(column)
+    table = pa.Table.from_arrays(arrays, names=USER_FIELDS)
+    table = table.filter(pc.not_equal(table.column('name'), ''))
+    return table.to_pylist()
+
+
+def _iter_arrow_batches(file_path: str) -> Iterator:
+    """Читает пакеты из Parquet или Arrow IPC (файл или поток)."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in PARQUET_EXTENSIONS:
+        parquet_file = pq.ParquetFile(file_path)
+        yield from parquet_file.iter_batches(batch_size=BATCH_ROWS)
+        return
+    with pa.memory_map(file_path, 'r') as source:
+        try:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            yield from pa.ipc.open_stream(source)
+
+
+def _iter_xlsx_batches(file_path: str) -> Iterator[List[Dict]]:
+    """Читает первый лист XLSX пакетами строк (первая строка — заголовок)."""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        targets = [_target_column(str(cell).strip()) if cell is not None else '' for cell in header]
+        batch: List[Dict] = []
+        for values in rows:
+            row = dict.fromkeys(USER_FIELDS, '')
+            for target, value in zip(targets, values):
+                if target in row and value is not None:
+                    row[target] = str(value)
+            for field in _TRIMMED_FIELDS:
+                row[field] = row[field].strip()
+            if not row['name']:
+                continue
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        workbook.close()
+
+
+def iter_table_rows(file_path: str) -> Iterator[List[Dict]]:
+    """
+    Читает табличный файл пакетами строк в схеме Sample.csv.
+
+    Args:
+        file_path (str): Путь к файлу Parquet, Arrow/Feather или XLSX.
+
+    Yields:
+        List[Dict]: Пакет строк (строки с пустым name уже отброшены).
+
+    Raises:
+        ImportError: Если нужная библиотека не установлена.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in XLSX_EXTENSIONS:
+        if openpyxl is None:
+            raise ImportError("Для чтения XLSX установите openpyxl (pip install openpyxl)")
+        yield from _iter_xlsx_batches(file_path)
+        return
+    if pa is None:
+        raise ImportError("Для чтения Parquet и Arrow установите pyarrow (pip install pyarrow)")
+    for batch in _iter_arrow_batches(file_path):
+        yield _normalize_arrow_batch(batch)
+
+
+def read_table_file(file_path: str) -> List[Dict]:
+    """
+    Читает табличный файл целиком в строки схемы Sample.csv.
+
+    Все строки файла загружаются в память (пакеты чтения только уменьшают
+    промежуточную память); для потоковой обработки используйте iter_table_rows.
+
+    Args:
+        file_path (str): Путь к файлу.
+
+    Returns:
+        List[Dict]: Строки с колонками USER_FIELDS (строки с пустым name отброшены).
+
+    Raises:
+        ImportError: Если нужная библиотека не установлена.
+        Exception: В случае ошибок чтения файла.
+    """
+    rows: List[Dict] = []
+    try:
+        for batch in iter_table_rows(file_path):
+            rows.extend(batch)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Ошибка чтения файла {file_path}: {e}")
+        raise
+    return rows
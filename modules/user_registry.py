@@ -0,0 +1,167 @@
+# user_registry.py
+"""
+Модуль встроенного реестра пользователей (SQLite).
+
+После обработки каждого CSV-файла пользователи, попавшие в XML,
+записываются в реестр (upsert по person_guid). Реестр помнит результаты
+предыдущих запусков, поэтому XML для любого подмножества пользователей
+(подразделение, организация, изменённые после момента T) можно получить
+индексированным запросом, не перечитывая исходные CSV.
+"""
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Iterable
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .csv_processing import USER_FIELDS
+
+REGISTRY_ENABLED = CONFIG.get('registry', {}).get('enabled', False)
+"""bool: Флаг записи пользователей в реестр."""
+
+REGISTRY_PATH = CONFIG.get('registry', {}).get('path', 'users.sqlite')
+"""str: Путь к файлу реестра SQLite."""
+
+_DATA_FIELDS = USER_FIELDS[1:]
+_COLUMNS = ', '.join(f'"{field}"' for field in USER_FIELDS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    person_guid TEXT PRIMARY KEY,
+    {', '.join(f'"{field}" TEXT' for field in _DATA_FIELDS)},
+    source_file TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_login ON users (login COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS users_department ON users (department);
+CREATE INDEX IF NOT EXISTS users_organisation ON users (organisation);
+CREATE INDEX IF NOT EXISTS users_updated_at ON users (updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# updated_at меняется только при реальном изменении данных пользователя,
+# поэтому выборка «изменённые после T» не захватывает просто перечитанные строки.
+_UPSERT = f"""
+INSERT INTO users ({_COLUMNS}, source_file, updated_at)
+VALUES ({', '.join('?' for _ in USER_FIELDS)}, ?, ?)
+ON CONFLICT (person_guid) DO UPDATE SET
+    {', '.join(f'"{f}" = excluded."{f}"' for f in _DATA_FIELDS)},
+    source_file = excluded.source_file,
+    updated_at = excluded.updated_at
+WHERE {' OR '.join(f'users."{f}" IS NOT excluded."{f}"' for f in _DATA_FIELDS)}
+"""
+
+
+class UserRegistry:
+    """
+    Реестр пользователей в SQLite.
+
+    Подключение одно на реестр; запись из нескольких потоков обработки
+    сериализуется блокировкой.
+    """
+
+    def __init__(self, path: str = REGISTRY_PATH):
+        """
+        Открывает (и при необходимости создаёт) реестр.
+
+        Args:
+            path (str): Путь к файлу SQLite.
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def upsert_users(self, users: Iterable[Dict], source_file: str,
+                     ad_guid: Optional[str] = None) -> int:
+        """
+        Записывает пользователей одного файла в реестр одной транзакцией.
+
+        Args:
+            users (Iterable[Dict]): Пользователи (результат process_user_row).
+            source_file (str): Исходный CSV-файл.
+            ad_guid (Optional[str]): GUID домена, запоминается для регенерации XML.
+
+        Returns:
+            int: Число добавленных или изменённых записей.
+        """
+        now = time.time()
+        params = [
+            [user.get(field, '') or '' for field in USER_FIELDS] + [source_file, now]
+            for user in users if user.get('person_guid')
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(_UPSERT, params)
+            changed = self._conn.total_changes - before
+            if ad_guid:
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('ad_guid', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (ad_guid,))
+        return changed
+
+    def get_ad_guid(self) -> Optional[str]:
+        """
+        Возвращает GUID домена из последнего запуска, записавшего реестр.
+
+        Returns:
+            Optional[str]: GUID домена или None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'ad_guid'").fetchone()
+        return row['value'] if row else None
+
+    def query(
+        self,
+        department: Optional[str] = None,
+        organisation: Optional[str] = None,
+        changed_since: Optional[float] = None,
+        login: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Выбирает пользователей по индексированным условиям.
+
+        Args:
+            department (Optional[str]): Подразделение.
+            organisation (Optional[str]): Организация.
+            changed_since (Optional[float]): Только изменённые не раньше этого момента (Unix time).
+            login (Optional[str]): Логин (без учёта регистра).
+
+        Returns:
+            List[Dict]: Пользователи в формате process_user_row, упорядоченные по логину.
+        """
+        conditions = []
+        params: List = []
+        if department is not None:
+            conditions.append("department = ?")
+            params.append(department)
+        if organisation is not None:
+            conditions.append("organisation = ?")
+            params.append(organisation)
+        if changed_since is not None:
+            conditions.append("updated_at >= ?")
+            params.append(changed_since)
+        if login is not None:
+            conditions.append("login = ? COLLATE NOCASE")
+            params.append(login)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = f"SELECT {_COLUMNS} FROM users {where} ORDER BY login, person_guid"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        """Закрывает подключение к реестру."""
+        with self._lock:
+            self._conn.close()
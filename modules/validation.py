@@ -0,0 +1,260 @@
+# validation.py
+"""
+Модуль проверки структуры входных файлов перед обработкой.
+
+Проверка выполняется одним проходом по строкам до поиска в AD и генерации
+XML: отсутствующие обязательные колонки, неверный разделитель, пустые
+обязательные значения, некорректные GUID (в том числе в списках roles,
+groups и OperationalAuthorities через «!»). Все регулярные выражения
+компилируются один раз при импорте модуля.
+
+Результат сохраняется в машиночитаемый JSON-отчёт <имя>_validation.json.
+Ошибки заголовка (нет обязательных колонок, файл прочитан одной колонкой)
+всегда останавливают обработку файла; ошибки строк — при
+validation.on_error = "abort".
+"""
+import os
+import csv
+import json
+import re
+import logging
+from typing import Dict, Iterable, List, Optional
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .csv_processing import DELIMITER
+from .output_writer import atomic_open
+from .metrics import get_active
+
+VALIDATION_ENABLED = CONFIG.get('validation', {}).get('enabled', True)
+"""bool: Флаг проверки файлов перед обработкой."""
+
+ON_ERROR = CONFIG.get('validation', {}).get('on_error', 'report')
+"""str: Реакция на ошибки в строках: report (только отчёт) или abort (файл не обрабатывается)."""
+
+MAX_ERRORS = CONFIG.get('validation', {}).get('max_errors', 1000)
+"""int: Сколько ошибок одного файла попадает в отчёт."""
+
+REPORT_SUFFIX = CONFIG.get('validation', {}).get('report_suffix', '_validation.json')
+"""str: Суффикс файла отчёта о проверке."""
+
+REQUIRED_COLUMNS = CONFIG.get('validation', {}).get('required_columns', ['name', 'login', 'parent_energy'])
+"""List[str]: Колонки, которые должны быть в заголовке."""
+
+REQUIRED_VALUES = CONFIG.get('validation', {}).get('required_values', ['login', 'parent_energy'])
+"""List[str]: Колонки, которые не должны быть пустыми (в строках с непустым name)."""
+
+_GUID = r'[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}'
+_GUID_RE = re.compile(rf'\s*{_GUID}\s*')
+# Список GUID через «!»; пустые элементы допустимы (при генерации XML они пропускаются)
+_GUID_LIST_RE = re.compile(rf'\s*(?:{_GUID}\s*)?(?:!\s*(?:{_GUID}\s*)?)*')
+
+GUID_FIELDS = ('person_guid', 'position', 'electrical_safety_level', 'department',
+               'organisation', 'parent_energy', 'parent_access', 'parent_sysconfig')
+"""tuple: Колонки с одним GUID (пустое значение допустимо, если колонка не обязательна)."""
+
+GUID_LIST_FIELDS = ('roles', 'groups', 'OperationalAuthorities')
+"""tuple: Колонки со списком GUID через «!»."""
+
+
+class SchemaValidator:
+    """
+    Потоковая проверка строк одного файла.
+
+    Строки передаются по одной (check_row), поэтому проверку можно вести
+    как по уже прочитанным строкам, так и прямо при чтении файла. В отчёт
+    попадает не больше max_errors ошибок, остальные только считаются.
+    """
+
+    def __init__(self, file_name: str, max_errors: int = MAX_ERRORS):
+        """
+        Инициализирует проверку файла.
+
+        Args:
+            file_name (str): Имя файла (для отчёта).
+            max_errors (int): Максимальное число ошибок в отчёте.
+        """
+        self.file_name = file_name
+        self.max_errors = max_errors
+        self.errors: List[Dict] = []
+        self.error_count = 0
+        self.rows_checked = 0
+        self.fatal = False
+        self._guid_fields: List[str] = []
+        self._list_fields: List[str] = []
+        self._required: List[str] = []
+
+    def _add(self, row: int, column: Optional[str], code: str, value: str, message: str):
+        """Регистрирует ошибку."""
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({
+                'row': row, 'column': column, 'code': code,
+                'value': value, 'message': message
+            })
+
+    def check_header(self, fieldnames: List[str]) -> bool:
+        """
+        Проверяет заголовок файла.
+
+        Args:
+            fieldnames (List[str]): Колонки файла.
+
+        Returns:
+            bool: False, если файл нельзя обрабатывать (fatal).
+        """
+        columns = [name for name in fieldnames if name is not None]
+        if len(columns) == 1 and any(sep in columns[0] for sep in (';', ',', '\t')):
+            self.fatal = True
+            self._add(0, None, 'delimiter', columns[0][:200],
+                      f"Заголовок прочитан одной колонкой: неверный разделитель (ожидается '{DELIMITER}')")
+            return False
+        present = set(columns)
+        for column in REQUIRED_COLUMNS:
+            if column not in present:
+                self.fatal = True
+                self._add(0, column, 'missing_column', '', f"Нет обязательной колонки {column}")
+        self._guid_fields = [name for name in GUID_FIELDS if name in present]
+        self._list_fields = [name for name in GUID_LIST_FIELDS if name in present]
+        self._required = [name for name in REQUIRED_VALUES if name in present]
+        return not self.fatal
+
+    def check_row(self, row_index: int, row: Dict):
+        """
+        Проверяет одну строку.
+
+        Args:
+            row_index (int): Индекс строки данных (с нуля).
+            row (Dict): Строка (как её возвращает csv.DictReader).
+        """
+        self.rows_checked += 1
+        number = row_index + 1
+        if not (row.get('name') or '').strip():
+            return  # такие строки пропускаются при обработке
+        if None in row:
+            self._add(number, None, 'extra_fields', str(row[None])[:200],
+                      "В строке больше полей, чем в заголовке (разделитель внутри значения?)")
+        for column in self._required:
+            if not (row.get(column) or '').strip():
+                self._add(number, column, 'missing_value', '', f"Пустое обязательное значение {column}")
+        for column in self._guid_fields:
+            value = row.get(column)
+            if value and not _GUID_RE.fullmatch(value):
+                self._add(number, column, 'invalid_guid', value, f"Некорректный GUID в колонке {column}")
+        for column in self._list_fields:
+            value = row.get(column)
+            if value and not _GUID_LIST_RE.fullmatch(value):
+                self._add(number, column, 'invalid_guid_list', value,
+                          f"Некорректный список GUID в колонке {column} (разделитель «!»)")
+
+    @property
+    def failed(self) -> bool:
+        """bool: Нужно ли остановить обработку файла с учётом validation.on_error."""
+        return self.fatal or (ON_ERROR == 'abort' and self.error_count > 0)
+
+    def to_dict(self) -> Dict:
+        """Возвращает отчёт о проверке в виде словаря."""
+        return {
+            'file': self.file_name,
+            'rows_checked': self.rows_checked,
+            'error_count': self.error_count,
+            'fatal': self.fatal,
+            'truncated': self.error_count > len(self.errors),
+            'errors': self.errors
+        }
+
+    def write_report(self, file_path: str):
+        """
+        Сохраняет отчёт о проверке в JSON-файл.
+
+        Args:
+            file_path (str): Путь к файлу отчёта.
+        """
+        with atomic_open(file_path, encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+def validate_rows(rows: Iterable[Dict], file_name: str,
+                  fieldnames: Optional[List[str]] = None) -> SchemaValidator:
+    """
+    Проверяет строки файла (одним проходом).
+
+    Args:
+        rows (Iterable[Dict]): Строки файла.
+        file_name (str): Имя файла (для отчёта).
+        fieldnames (Optional[List[str]]): Колонки файла. Если не заданы,
+            берутся из первой строки.
+
+    Returns:
+        SchemaValidator: Результат проверки.
+    """
+    validator = SchemaValidator(file_name)
+    header_checked = False
+    if fieldnames is not None:
+        header_checked = True
+        if not validator.check_header(fieldnames):
+            return validator
+    for row_index, row in enumerate(rows):
+        if not header_checked:
+            header_checked = True
+            if not validator.check_header(list(row)):
+                return validator
+        validator.check_row(row_index, row)
+    return validator
+
+
+def validate_csv_file(file_path: str, encoding: str, file_name: Optional[str] = None) -> SchemaValidator:
+    """
+    Проверяет CSV-файл потоково, не загружая его в память.
+
+    Разделитель определяется так же, как при обработке (read_csv_file).
+
+    Args:
+        file_path (str): Путь к CSV-файлу.
+        encoding (str): Кодировка файла.
+        file_name (Optional[str]): Имя файла для отчёта (по умолчанию file_path).
+
+    Returns:
+        SchemaValidator: Результат проверки.
+    """
+    with open(file_path, 'r', encoding=encoding, newline='') as f:
+        first_line = f.readline()
+        f.seek(0)
+        delimiter = DELIMITER if DELIMITER in first_line else (
+            ',' if ',' in first_line else ';')
+        reader = csv.DictReader(f, delimiter=delimiter)
+        validator = validate_rows(reader, file_name or file_path, reader.fieldnames or [])
+    logging.getLogger(__name__).debug(
+        f"Проверка {file_path}: строк {validator.rows_checked}, ошибок {validator.error_count}")
+    return validator
+
+
+def report_validation(validator: SchemaValidator, base_name: str, logger: logging.Logger) -> bool:
+    """
+    Сохраняет отчёт о проверке файла и решает, можно ли его обрабатывать.
+
+    Отчёт <base_name>_validation.json пишется только при наличии ошибок;
+    отчёт предыдущего запуска для исправленного файла удаляется.
+
+    Args:
+        validator (SchemaValidator): Результат проверки.
+        base_name (str): Путь к выходным файлам без расширения.
+        logger (logging.Logger): Логгер файла.
+
+    Returns:
+        bool: True, если файл можно обрабатывать.
+    """
+    report_path = f"{base_name}{REPORT_SUFFIX}"
+    if not validator.error_count:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return True
+    get_active().count('validation_errors', validator.error_count)
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    validator.write_report(report_path)
+    if validator.failed:
+        logger.error(f"❌ Файл не прошёл проверку (ошибок: {validator.error_count}), "
+                     f"обработка остановлена до обращений к AD. Отчёт: {report_path}")
+        return False
+    logger.warning(f"⚠️ Ошибок проверки: {validator.error_count}. Отчёт: {report_path}")
+    return True
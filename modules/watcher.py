@@ -0,0 +1,228 @@
+# watcher.py
+"""
+Модуль для наблюдения за входной директорией в режиме службы.
+
+На Linux изменения директории отслеживаются через inotify (ctypes, без
+сторонних зависимостей), на остальных системах и при ошибке inotify —
+периодическим опросом. В обоих случаях файл считается готовым к обработке,
+только когда его размер и время изменения не меняются в течение
+debounce_sec секунд: так не обрабатываются частично скопированные файлы.
+"""
+import os
+import sys
+import time
+import select
+import struct
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Импортируем конфигурацию
+from .config_loader import CONFIG
+from .csv_processing import find_csv_files, INPUT_RECURSIVE
+
+POLL_INTERVAL = CONFIG.get('watch', {}).get('poll_interval_sec', 2)
+"""float: Интервал опроса директории (и максимальное ожидание событий inotify) в секундах."""
+
+DEBOUNCE_SEC = CONFIG.get('watch', {}).get('debounce_sec', 5)
+"""float: Сколько секунд файл не должен меняться, чтобы считаться записанным."""
+
+# Маски событий inotify (см. <sys/inotify.h>)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Минимальная обёртка над inotify для одной директории."""
+
+    def __init__(self, directory: str):
+        """
+        Создаёт наблюдение за директорией.
+
+        Args:
+            directory (str): Директория для наблюдения.
+
+        Raises:
+            OSError: Если inotify недоступен.
+        """
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno))
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Ждёт событий не дольше timeout секунд и вычитывает их.
+
+        Args:
+            timeout (float): Максимальное время ожидания.
+
+        Returns:
+            bool: True, если были события.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 64 * _EVENT_HEADER.size + 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        """Закрывает дескриптор inotify."""
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Наблюдатель за CSV-файлами во входной директории.
+
+    Для каждого файла хранится подпись (размер, mtime_ns). Новый или
+    изменившийся файл становится кандидатом; кандидат выдаётся на обработку,
+    когда его подпись стабильна debounce_sec секунд. После обработки нужно
+    вызвать mark_processed(): обработка перезаписывает CSV, и без этого
+    изменённый самой программой файл был бы обработан снова.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        exclude_files: List[str],
+        poll_interval: float = POLL_INTERVAL,
+        debounce: float = DEBOUNCE_SEC,
+        recursive: bool = INPUT_RECURSIVE,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None
+    ):
+        """
+        Инициализирует наблюдатель.
+
+        Args:
+            directory (str): Входная директория.
+            exclude_files (List[str]): Имена файлов, которые не нужно обрабатывать.
+            poll_interval (float): Интервал опроса в секундах.
+            debounce (float): Время стабильности файла в секундах.
+            recursive (bool): Искать файлы во вложенных директориях.
+            include (Optional[List[str]]): Glob-шаблоны включаемых файлов.
+            exclude (Optional[List[str]]): Glob-шаблоны исключаемых файлов.
+        """
+        self.directory = directory
+        self.exclude_files = list(exclude_files)
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.stop_event = threading.Event()
+        # Подписи уже обработанных файлов
+        self._processed: Dict[str, Tuple[int, int]] = {}
+        # Кандидаты: имя -> (подпись, время последнего изменения подписи)
+        self._pending: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        self._inotify: Optional[_Inotify] = None
+        self.logger = logging.getLogger(__name__)
+        if sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify(directory)
+                self.logger.info(f"Наблюдение за {directory} через inotify"
+                                 + (" (вложенные директории — опросом)" if recursive else ""))
+            except Exception as e:
+                self.logger.warning(
+                    f"inotify недоступен ({e}), используется опрос каждые {poll_interval} с")
+        if self._inotify is None:
+            self.logger.info(f"Наблюдение за {directory} опросом каждые {poll_interval} с")
+
+    def _signature(self, name: str) -> Optional[Tuple[int, int]]:
+        """Возвращает подпись файла или None, если он недоступен."""
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _scan(self):
+        """Обновляет список кандидатов по содержимому директории."""
+        now = time.monotonic()
+        names = find_csv_files(self.exclude_files, self.directory,
+                               self.recursive, self.include, self.exclude)
+        present = set(names)
+        for name in list(self._pending):
+            if name not in present:
+                del self._pending[name]
+        for name in names:
+            signature = self._signature(name)
+            if signature is None or self._processed.get(name) == signature:
+                self._pending.pop(name, None)
+                continue
+            pending = self._pending.get(name)
+            if pending is None or pending[0] != signature:
+                self._pending[name] = (signature, now)
+
+    def _ready(self) -> List[str]:
+        """Возвращает кандидатов, подпись которых стабильна debounce секунд (крупные первыми)."""
+        now = time.monotonic()
+        ready = [(signature[0], name) for name, (signature, changed_at) in self._pending.items()
+                 if now - changed_at >= self.debounce]
+        return [name for _, name in sorted(ready, key=lambda item: (-item[0], item[1]))]
+
+    def wait_for_files(self) -> List[str]:
+        """
+        Блокирует выполнение до появления готовых файлов или остановки.
+
+        Returns:
+            List[str]: Имена готовых файлов (пустой список после stop()).
+        """
+        while not self.stop_event.is_set():
+            self._scan()
+            ready = self._ready()
+            if ready:
+                return ready
+            # Пока есть кандидаты, просыпаемся не позже окончания их debounce
+            timeout = self.poll_interval
+            if self._pending:
+                now = time.monotonic()
+                timeout = min(timeout, max(0.1, min(
+                    self.debounce - (now - changed_at)
+                    for _, changed_at in self._pending.values())))
+            if self._inotify is not None:
+                self._inotify.wait(timeout)
+            else:
+                self.stop_event.wait(timeout)
+        return []
+
+    def mark_processed(self, name: str):
+        """
+        Запоминает подпись файла после обработки (включая перезапись CSV).
+
+        Args:
+            name (str): Имя файла.
+        """
+        self._pending.pop(name, None)
+        signature = self._signature(name)
+        if signature is not None:
+            self._processed[name] = signature
+
+    def stop(self):
+        """Останавливает ожидание (можно вызывать из обработчика сигнала)."""
+        self.stop_event.set()
+
+    def close(self):
+        """Освобождает ресурсы наблюдателя."""
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
@@ -2,14 +2,14 @@
 """
 Модуль для генерации XML-файлов.
 """
-import uuid
-from datetime import datetime, timezone
 from typing import List, Dict
 import traceback
 import logging
 
 # Импортируем конфигурацию
 from .config_loader import CONFIG
+from .guid_generation import name_guid_for, model_created
+from .metrics import timed
 
 # Разделяем версии для разных моделей
 # Например: "2025-03-04(11.7.1.7)"
@@ -18,6 +18,7 @@ print(MODEL_VERSION_SYS)
 MODEL_VERSION_ENERGY = CONFIG['xml']['model_version_energy']  # Например: "1.0"
 
 
+@timed('xml_render')
 def generate_access_xml(ad_guid: str, users: List[Dict]) -> str:
     """
     Генерирует XML-файл для Access.
@@ -30,7 +31,7 @@ def generate_access_xml(ad_guid: str, users: List[Dict]) -> str:
         str: Сгенерированный XML-документ в виде строки.
     """
     try:
-        created = datetime.now(timezone.utc).strftime(
+        created = model_created().strftime(
             "%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
         # Используем фиксированный GUID для FullModel, как в примере
         full_model_guid = "a1aa400b-15b3-473a-b9c0-64d1c86d321f"
@@ -86,6 +87,7 @@ def generate_access_xml(ad_guid: str, users: List[Dict]) -> str:
         raise
 
 
+@timed('xml_render')
 def generate_energy_xml(users: List[Dict]) -> str:
     """
     Генерирует XML-файл для Energy.
@@ -97,7 +99,7 @@ def generate_energy_xml(users: List[Dict]) -> str:
         str: Сгенерированный XML-документ в виде строки.
     """
     try:
-        created = datetime.now(timezone.utc).strftime(
+        created = model_created().strftime(
             "%Y-%m-%dT%H:%M:%S") + "Z"
         xml = f'''<?xml version="1.0" encoding="utf-8"?>
 <rdf:RDF xmlns:md="http://iec.ch/TC57/61970-552/ModelDescription/1#" xmlns:cim="http://iec.ch/TC57/2014/CIM-schema-cim16#" xmlns:cim17="http://iec.ch/TC57/2014/CIM-schema-cim17#" xmlns:me="http://monitel.com/2014/schema-cim16#" xmlns:rh="http://rushydro.ru/2015/schema-cim16#" xmlns:so="http://so-ups.ru/2015/schema-cim16#" xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
@@ -145,7 +147,7 @@ def generate_energy_xml(users: List[Dict]) -> str:
                 abbreviation += ' ' + fio_first[0] + '.'
             if fio_middle:
                 abbreviation += fio_middle[0] + '.'
-            name_abbreviation_guid = str(uuid.uuid4()).upper()
+            name_abbreviation_guid = name_guid_for(person_guid)
             xml += f'''
   <cim:Person rdf:about="#_{person_guid}">
       <cim:IdentifiedObject.name>{name}</cim:IdentifiedObject.name>
@@ -4,27 +4,43 @@ GUI для приложения User Creator на основе PyQt5 с совр
 """
 import sys
 import os
+import time
 from typing import List, Dict, Optional
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout,
     QLabel, QRadioButton, QLineEdit, QPushButton, QFileDialog, QTextEdit,
     QProgressBar, QGroupBox, QMessageBox, QCheckBox, QScrollArea, QFrame,
-    QSizePolicy, QStackedWidget, QToolBar, QAction, QStatusBar
+    QSizePolicy, QStackedWidget, QToolBar, QAction, QStatusBar, QShortcut
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSettings, QSize
-from PyQt5.QtGui import QTextCursor, QFont, QIcon, QPixmap, QPalette, QColor
+from PyQt5.QtGui import QTextCursor, QFont, QIcon, QPixmap, QPalette, QColor, QKeySequence
 import logging
 import traceback
 
 # Импорты модулей приложения (остаются без изменений)
 try:
     from modules.config_loader import CONFIG
-    from modules.ad_operations import connect_to_ad, get_domain_guid
-    from modules.csv_processing import find_csv_files, process_user_row
+    from modules.ad_operations import connect_to_ad, get_domain_guid, sync_guid_cache, prepare_login_filter
+    from modules.csv_processing import find_csv_files, process_rows
     from modules.xml_generation import generate_access_xml, generate_energy_xml
-    from modules.logging_config import LogManager
-    from modules.csv_processing import get_file_encoding, read_csv_file, write_csv_file
+    from modules.logging_config import LogManager, log_dir
+    from modules.metrics import start_run, instrument_logger
+    from modules.profiling import profile_call, profiling_requested
+    from modules.metrics_exporter import write_textfile, start_http_server, stop_http_server
+    from modules.csv_processing import get_file_encoding, read_csv_file, write_back_csv, CSV_WRITEBACK
+    from modules.csv_processing import prefetch_ad_lookups_async
+    from modules.table_readers import is_table_file, read_table_file
+    from modules.validation import validate_rows, report_validation, VALIDATION_ENABLED
     from modules.ad_operations import get_user_guid
+    from modules.duplicate_index import (
+        DuplicateIndex, DEDUP_ENABLED, DUPLICATES_CSV)
+    from modules.guid_cache import GuidCache, CACHE_ENABLED, CACHE_PATH, CACHE_SYNC
+    from modules.guid_table import GuidTable, TABLE_ENABLED, TABLE_PATH
+    from modules.bloom_filter import PREFILTER_ENABLED
+    from modules.async_runner import run_async, ASYNC_ENABLED
+    from modules.not_found_spool import NotFoundSpool
+    from modules.output_writer import atomic_write_text, sync_directories
+    from modules.user_registry import UserRegistry, REGISTRY_ENABLED, REGISTRY_PATH
 except ImportError as e:
     print(f"Ошибка импорта: {e}")
     QMessageBox.critical(
@@ -49,36 +65,49 @@ class Worker(QThread):
     finished_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
 
-    def __init__(self, mode, ad_password, manual_guid, input_dir):
+    def __init__(self, mode, ad_password, manual_guid, input_dir, profile=False):
         super().__init__()
         self.mode = mode
         self.ad_password = ad_password
         self.manual_guid = manual_guid
         self.input_dir = input_dir
+        self.profile = profile
         self.logger = logging.getLogger("UserCreatorUI.Worker")
 
     def run(self):
-        """Выполняет обработку в отдельном потоке."""
+        """Выполняет обработку в отдельном потоке (под профилировщиком, если он включён)."""
+        if self.profile:
+            profile_dir = os.path.abspath(log_dir)
+            self.log_signal.emit(f"🔬 Профилирование включено, результаты: {profile_dir}")
+            profile_call(self._process, profile_dir, 'ui')
+        else:
+            self._process()
+
+    def _process(self):
+        """Выполняет обработку файлов."""
         try:
             self.logger.info("Начало выполнения рабочего потока")
             self.log_signal.emit("🚀 Начало выполнения рабочего потока")
+            metrics = start_run()
 
-            # Меняем директорию
-            original_dir = os.getcwd()
-            self.logger.debug(f"Исходная директория: {original_dir}")
-            if self.input_dir and os.path.exists(self.input_dir):
-                os.chdir(self.input_dir)
-                self.logger.info(
-                    f"Рабочая директория изменена на: {os.getcwd()}")
+            # Входная директория (рабочая директория процесса не меняется)
+            if self.input_dir and os.path.isdir(self.input_dir):
+                input_dir = os.path.abspath(self.input_dir)
             else:
+                input_dir = os.getcwd()
                 self.logger.warning(
                     f"Указанная директория не существует: {self.input_dir}. Используется текущая.")
-            self.log_signal.emit(f"📂 Рабочая директория: {os.getcwd()}")
+            self.logger.info(f"Входная директория: {input_dir}")
+            self.log_signal.emit(f"📂 Директория с CSV: {input_dir}")
 
             # Инициализация AD (если нужно)
             ad_conn = None
             ad_guid = None
-            not_found_in_ad = []
+            not_found_in_ad = NotFoundSpool()
+            dup_index = DuplicateIndex() if DEDUP_ENABLED else None
+            guid_cache = None
+            guid_table = None
+            registry = UserRegistry(REGISTRY_PATH) if REGISTRY_ENABLED else None
 
             if self.mode == 'y' and AD_ENABLED:
                 self.logger.info("Выбран режим работы с Active Directory")
@@ -108,6 +137,23 @@ class Worker(QThread):
                     return
                 self.logger.info(f"✅ GUID домена успешно получен: {ad_guid}")
                 self.log_signal.emit(f"✅ GUID домена: {ad_guid}")
+                if CACHE_ENABLED and dup_index is not None:
+                    guid_cache = GuidCache(CACHE_PATH).load()
+                    if CACHE_SYNC and sync_guid_cache(ad_conn, guid_cache) is not None:
+                        self.log_signal.emit("🔄 Кэш GUID синхронизирован с AD")
+                    if TABLE_ENABLED:
+                        try:
+                            guid_table = GuidTable.from_cache(guid_cache, TABLE_PATH)
+                            dup_index.attach_guid_table(guid_table)
+                        except Exception as e:
+                            self.logger.warning(
+                                f"Не удалось построить таблицу GUID {TABLE_PATH}: {e}")
+                    if guid_table is None:
+                        dup_index.preload_ad_guids(guid_cache.fresh_items())
+                    self.logger.info(
+                        f"Кэш GUID загружен: {guid_cache.path} (записей: {len(guid_cache)})")
+                if PREFILTER_ENABLED and prepare_login_filter(ad_conn) is not None:
+                    self.log_signal.emit("🧮 Фильтр логинов AD обновлён")
             else:
                 self.logger.info(
                     "Выбран режим работы без Active Directory (ручной ввод GUID)")
@@ -124,7 +170,7 @@ class Worker(QThread):
             self.progress_signal.emit(20)
             self.log_signal.emit("🔍 Поиск CSV файлов...")
             self.logger.info("Начало поиска CSV файлов")
-            csv_files = find_csv_files()
+            csv_files = find_csv_files(directory=input_dir)
             if not csv_files:
                 warning_msg = "⚠️ Нет подходящих CSV-файлов для обработки."
                 self.logger.warning(warning_msg)
@@ -139,119 +185,200 @@ class Worker(QThread):
 
             self.progress_signal.emit(30)
             total_files = len(csv_files)
-
-            # Обработка файлов
-            for i, csv_file in enumerate(csv_files):
+            metrics_server = start_http_server() if metrics.enabled else None
+
+            # Обработка файлов: чтение, пакетный поиск в AD (только в режиме asyncio)
+            # и запись; без asyncio файлы обрабатываются по одному
+            positions = {csv_file: i for i, csv_file in enumerate(csv_files)}
+            last_logger = None  # Логгер последнего обработанного файла
+            done = 0
+
+            def report_error(csv_file: str, e: Exception):
+                """Сообщает об ошибке обработки файла."""
+                error_msg = f"❌ Ошибка обработки файла {csv_file}: {str(e)}"
+                self.logger.error(error_msg)
+                self.logger.debug(
+                    f"Детали ошибки: {traceback.format_exc()}")
+                self.log_signal.emit(error_msg)
+                metrics.count('files_failed')
+
+            def read_file(csv_file: str) -> Optional[Dict]:
+                """Читает файл; None — ошибка."""
+                i = positions[csv_file]
                 self.logger.info(
                     f"Начало обработки файла {i+1}/{total_files}: {csv_file}")
                 self.log_signal.emit(
                     f"📄 Обработка файла ({i+1}/{total_files}): {csv_file}")
 
-                try:
-                    file_path = os.path.join('.', csv_file)
-                    base_name = os.path.splitext(csv_file)[0]
-                    self.logger.debug(f"Полный путь к файлу: {file_path}")
-
-                    # Создаём LogManager и получаем логгер
-                    log_manager = LogManager(csv_file)
-                    logger = log_manager.get_logger()
-                    logger.info(f"🚀 Начата обработка файла: {csv_file}")
-
-                    if self.mode == 'y' and AD_ENABLED:
-                        logger.info(
-                            f"✅ Используется GUID домена из AD: {ad_guid}")
-                    else:
-                        logger.info(
-                            f"✅ Используется вручную введённый GUID домена: {ad_guid}")
-
-                    # Определение кодировки и чтение CSV
-                    self.logger.debug(
-                        f"Определение кодировки файла: {file_path}")
-                    encoding = get_file_encoding(file_path)
-                    logger.info(f"Определена кодировка: {encoding}")
-                    self.logger.info(f"Кодировка файла {csv_file}: {encoding}")
-                    self.logger.debug(f"Чтение CSV файла: {file_path}")
-                    rows = read_csv_file(file_path, encoding)
-                    logger.info(f"Прочитано строк: {len(rows)}")
-                    self.logger.info(
-                        f"Прочитано {len(rows)} строк из файла {csv_file}")
-
-                    updated_rows = []
-                    users_data = []
-                    self.logger.debug(
-                        f"Начало обработки строк из файла {csv_file}")
-
-                    for row_idx, row in enumerate(rows):
-                        name = (row.get('name') or '').strip()
-                        if not name:
-                            logger.debug(
-                                f"Строка {row_idx + 1}: пропущена (пустое имя)")
-                            continue
-                        # Передаем все необходимые аргументы
-                        processed_row = process_user_row(
-                            row,           # row
-                            row_idx,       # row_index
-                            csv_file,      # csv_file
-                            self.mode,     # mode
-                            ad_conn,       # ad_conn
-                            ad_guid,       # ad_guid
-                            not_found_in_ad,  # not_found_in_ad
-                            logger         # logger
-                        )
-                        if processed_row:
-                            updated_rows.append(processed_row)
-                            users_data.append(processed_row)
-
-                    self.logger.info(
-                        f"Обработано {len(users_data)} записей из файла {csv_file}")
-                    self.log_signal.emit(
-                        f"  ✅ Обработано записей: {len(users_data)}")
-
-                    # Генерация XML
-                    self.logger.info(
-                        f"Начало генерации XML файлов для {csv_file}")
-                    self.log_signal.emit(f"  📄 Генерация XML файлов...")
-                    sys_xml = generate_access_xml(ad_guid, users_data)
-                    energy_xml = generate_energy_xml(users_data)
-                    sys_xml_filename = f"{base_name}{ACCESS_SUFFIX}"
-                    energy_xml_filename = f"{base_name}{ENERGY_SUFFIX}"
-                    self.logger.debug(f"Запись Access XML: {sys_xml_filename}")
-                    with open(sys_xml_filename, 'w', encoding='utf-8') as f:
-                        f.write(sys_xml)
-                    self.logger.debug(
-                        f"Запись Energy XML: {energy_xml_filename}")
-                    with open(energy_xml_filename, 'w', encoding='utf-8') as f:
-                        f.write(energy_xml)
-                    logger.info(f"✅ Успешно сгенерированы XML-файлы: "
-                                f"{sys_xml_filename}, {energy_xml_filename}")
-                    self.logger.info(
-                        f"XML файлы успешно созданы: {sys_xml_filename}, {energy_xml_filename}")
-                    self.log_signal.emit(
-                        f"  ✅ XML файлы созданы: {ACCESS_SUFFIX}, {ENERGY_SUFFIX}")
-
-                    # Перезапись CSV
-                    self.logger.debug(f"Перезапись CSV файла: {file_path}")
-                    write_csv_file(file_path, updated_rows)
-                    logger.info(f"✅ CSV файл обновлён и сохранён: {csv_file}")
-                    self.logger.info(f"CSV файл успешно обновлён: {csv_file}")
-                    self.log_signal.emit(f"  ✅ CSV файл обновлён")
-                    logger.info(f"✅ Обработка файла '{csv_file}' завершена.")
-                    self.logger.info(
-                        f"Обработка файла {csv_file} завершена успешно")
-
-                except Exception as e:
-                    error_msg = f"❌ Ошибка обработки файла {csv_file}: {str(e)}"
-                    self.logger.error(error_msg)
-                    self.logger.debug(
-                        f"Детали ошибки: {traceback.format_exc()}")
-                    self.log_signal.emit(error_msg)
-                    continue
+                with metrics.file_scope(csv_file):
+                    try:
+                        file_path = os.path.join(input_dir, csv_file)
+                        base_name = os.path.join(input_dir, os.path.splitext(csv_file)[0])
+                        self.logger.debug(f"Полный путь к файлу: {file_path}")
+
+                        # Создаём LogManager и получаем логгер
+                        log_manager = LogManager(csv_file)
+                        logger = log_manager.get_logger()
+                        instrument_logger(logger)
+                        logger.info(f"🚀 Начата обработка файла: {csv_file}")
+
+                        if self.mode == 'y' and AD_ENABLED:
+                            logger.info(
+                                f"✅ Используется GUID домена из AD: {ad_guid}")
+                        else:
+                            logger.info(
+                                f"✅ Используется вручную введённый GUID домена: {ad_guid}")
+
+                        # Определение кодировки и чтение CSV (или табличной выгрузки)
+                        table_source = is_table_file(csv_file)
+                        if table_source:
+                            self.logger.debug(f"Чтение табличного файла: {file_path}")
+                            with metrics.timer('csv_read'):
+                                rows = read_table_file(file_path)
+                        else:
+                            self.logger.debug(
+                                f"Определение кодировки файла: {file_path}")
+                            with metrics.timer('encoding_detection'):
+                                encoding = get_file_encoding(file_path)
+                            logger.info(f"Определена кодировка: {encoding}")
+                            self.logger.info(f"Кодировка файла {csv_file}: {encoding}")
+                            self.logger.debug(f"Чтение CSV файла: {file_path}")
+                            with metrics.timer('csv_read'):
+                                rows = read_csv_file(file_path, encoding)
+                        metrics.count('rows_read', len(rows))
+                        logger.info(f"Прочитано строк: {len(rows)}")
+                        self.logger.info(
+                            f"Прочитано {len(rows)} строк из файла {csv_file}")
+
+                        # Проверка структуры до поиска в AD и генерации XML
+                        if VALIDATION_ENABLED and rows:
+                            with metrics.timer('validation'):
+                                validator = validate_rows(rows, csv_file)
+                            try:
+                                valid = report_validation(validator, base_name, logger)
+                            except OSError as e:
+                                logger.error(f"❌ Ошибка записи отчёта о проверке: {e}")
+                                valid = not validator.failed
+                            if validator.error_count:
+                                self.log_signal.emit(
+                                    f"  {'❌' if not valid else '⚠️'} Ошибок проверки: "
+                                    f"{validator.error_count}")
+                            if not valid:
+                                error_msg = (f"❌ Файл {csv_file} не прошёл проверку, "
+                                             f"обработка пропущена")
+                                self.logger.error(error_msg)
+                                self.log_signal.emit(error_msg)
+                                metrics.count('files_failed')
+                                return None
+
+                        return {'csv_file': csv_file, 'file_path': file_path,
+                                'base_name': base_name, 'logger': logger, 'rows': rows,
+                                'table_source': table_source, 'prefetched': None}
+                    except Exception as e:
+                        report_error(csv_file, e)
+                        return None
+
+            async def resolve_file(job: Dict) -> Dict:
+                """Пакетный поиск логинов файла в AD (ldap3 ASYNC)."""
+                if ad_conn is not None:
+                    job['prefetched'] = await prefetch_ad_lookups_async(
+                        job['rows'], job['logger'], dup_index)
+                return job
+
+            def write_file(job: Dict) -> bool:
+                """Обрабатывает строки файла и записывает результаты."""
+                nonlocal last_logger
+                csv_file, file_path, base_name = job['csv_file'], job['file_path'], job['base_name']
+                logger, rows, table_source = job['logger'], job['rows'], job['table_source']
+                last_logger = logger
+                with metrics.file_scope(csv_file):
+                    try:
+                        self.logger.debug(
+                            f"Начало обработки строк из файла {csv_file}")
+
+                        processing_start = time.perf_counter()
+                        updated_rows, users_data = process_rows(
+                            rows, csv_file, self.mode, ad_conn, ad_guid, not_found_in_ad,
+                            logger, dup_index, prefetched=job['prefetched'])
+                        metrics.add_time(
+                            'row_processing', time.perf_counter() - processing_start)
+                        metrics.count('users_processed', len(users_data))
+
+                        if registry is not None:
+                            with metrics.timer('registry'):
+                                changed = registry.upsert_users(users_data, csv_file, ad_guid)
+                            self.logger.info(
+                                f"Реестр пользователей: добавлено или изменено записей: {changed}")
+
+                        self.logger.info(
+                            f"Обработано {len(users_data)} записей из файла {csv_file}")
+                        self.log_signal.emit(
+                            f"  ✅ Обработано записей: {len(users_data)}")
+
+                        # Генерация XML
+                        self.logger.info(
+                            f"Начало генерации XML файлов для {csv_file}")
+                        self.log_signal.emit(f"  📄 Генерация XML файлов...")
+                        sys_xml = generate_access_xml(ad_guid, users_data)
+                        energy_xml = generate_energy_xml(users_data)
+                        sys_xml_filename = f"{base_name}{ACCESS_SUFFIX}"
+                        energy_xml_filename = f"{base_name}{ENERGY_SUFFIX}"
+                        with metrics.timer('xml_write'):
+                            self.logger.debug(f"Запись Access XML: {sys_xml_filename}")
+                            bytes_written = atomic_write_text(sys_xml_filename, sys_xml)
+                            self.logger.debug(
+                                f"Запись Energy XML: {energy_xml_filename}")
+                            bytes_written += atomic_write_text(energy_xml_filename, energy_xml)
+                        metrics.count('bytes_written', bytes_written)
+                        logger.info(f"✅ Успешно сгенерированы XML-файлы: "
+                                    f"{sys_xml_filename}, {energy_xml_filename}")
+                        self.logger.info(
+                            f"XML файлы успешно созданы: {sys_xml_filename}, {energy_xml_filename}")
+                        self.log_signal.emit(
+                            f"  ✅ XML файлы созданы: {ACCESS_SUFFIX}, {ENERGY_SUFFIX}")
+
+                        # Перезапись CSV (или файл обогащения), только если строки изменились
+                        self.logger.debug(f"Перезапись CSV файла: {file_path}")
+                        with metrics.timer('csv_write'):
+                            written = write_back_csv(file_path, rows, updated_rows, base_name,
+                                                     'sidecar' if table_source else CSV_WRITEBACK)
+                        metrics.count('files_processed')
+                        if written:
+                            metrics.count('bytes_written', os.path.getsize(written))
+                            logger.info(f"✅ CSV файл обновлён и сохранён: {written}")
+                            self.logger.info(f"CSV файл успешно обновлён: {written}")
+                            self.log_signal.emit(f"  ✅ CSV файл обновлён")
+                        else:
+                            metrics.count('csv_writes_skipped')
+                            logger.info(f"CSV файл не изменился, перезапись пропущена: {csv_file}")
+                            self.log_signal.emit(f"  ✅ CSV файл не изменился")
+                        logger.info(f"✅ Обработка файла '{csv_file}' завершена.")
+                        self.logger.info(
+                            f"Обработка файла {csv_file} завершена успешно")
+
+                        return True
+                    except Exception as e:
+                        report_error(csv_file, e)
+                        return False
+
+            def finish_file(csv_file: str, success: bool):
+                """Обновляет метрики и прогресс после записи файла."""
+                nonlocal done
+                done += 1
+                write_textfile(metrics)
 
                 # Обновляем прогресс
-                progress = 30 + int((i + 1) / total_files * 60)
+                progress = 30 + int(done / total_files * 60)
                 self.progress_signal.emit(progress)
                 self.logger.debug(f"Прогресс обработки: {progress}%")
 
+            if ASYNC_ENABLED:
+                run_async(csv_files, read_file, resolve_file, write_file, on_result=finish_file)
+            else:
+                for csv_file in csv_files:
+                    job = read_file(csv_file)
+                    finish_file(csv_file, write_file(job) if job is not None else False)
+
             # --- Сохранение not_in_AD.csv ---
             if self.mode == 'y' and AD_ENABLED and not_found_in_ad:
                 self.logger.info(
@@ -259,24 +386,16 @@ class Worker(QThread):
                 self.log_signal.emit(
                     f"💾 Сохранение списка пользователей не найденных в AD ({len(not_found_in_ad)} записей)...")
                 try:
-                    not_found_in_ad.sort(key=lambda x: x['login'])
-                    with open(NOT_IN_AD_CSV, 'w', newline='', encoding='utf-8') as f:
-                        import csv
-                        writer = csv.DictWriter(
-                            f, fieldnames=['login', 'name', 'person_guid'], delimiter=';')
-                        writer.writeheader()
-                        writer.writerows(not_found_in_ad)
-                    if csv_files:
-                        last_logger = logger  # Используем последний логгер
+                    written = not_found_in_ad.write(os.path.join(input_dir, NOT_IN_AD_CSV))
+                    if last_logger is not None:
                         last_logger.warning(
-                            f"🟡 Логины не из AD сохранены в: {NOT_IN_AD_CSV}")
+                            f"🟡 Логины не из AD сохранены в: {NOT_IN_AD_CSV} (записей: {written})")
                     self.log_signal.emit(
-                        f"✅ Логины не из AD сохранены в: {NOT_IN_AD_CSV}")
+                        f"✅ Логины не из AD сохранены в: {NOT_IN_AD_CSV} (записей: {written})")
                     self.logger.info(
                         f"Список пользователей не найденных в AD успешно сохранен в: {NOT_IN_AD_CSV}")
                 except Exception as e:
-                    if csv_files:
-                        last_logger = logger
+                    if last_logger is not None:
                         last_logger.error(
                             f"❌ Ошибка записи {NOT_IN_AD_CSV}: {e}")
                     error_msg = f"❌ Ошибка записи {NOT_IN_AD_CSV}: {e}"
@@ -284,6 +403,49 @@ class Worker(QThread):
                     self.logger.debug(
                         f"Детали ошибки: {traceback.format_exc()}")
                     self.log_signal.emit(error_msg)
+                finally:
+                    not_found_in_ad.close()
+
+            # --- Сохранение отчёта о дубликатах ---
+            if dup_index is not None and dup_index.records:
+                try:
+                    dup_index.write_report(os.path.join(input_dir, DUPLICATES_CSV))
+                    warning_msg = (
+                        f"🟡 Найдено дубликатов: {len(dup_index.records)}, "
+                        f"из них конфликтов: {len(dup_index.conflicts)}. Отчёт: {DUPLICATES_CSV}")
+                    self.logger.warning(warning_msg)
+                    self.log_signal.emit(warning_msg)
+                except Exception as e:
+                    error_msg = f"❌ Ошибка записи {DUPLICATES_CSV}: {e}"
+                    self.logger.error(error_msg)
+                    self.logger.debug(
+                        f"Детали ошибки: {traceback.format_exc()}")
+                    self.log_signal.emit(error_msg)
+
+            # --- Обновление постоянного кэша GUID ---
+            if guid_cache is not None:
+                for login, guid in dup_index.resolved_ad_guids().items():
+                    guid_cache.put(login, guid)
+                try:
+                    guid_cache.save()
+                except Exception as e:
+                    self.logger.warning(f"Не удалось сохранить кэш GUID {guid_cache.path}: {e}")
+            if guid_table is not None:
+                guid_table.close()
+
+            # --- Синхронизация директорий с результатами (политика fsync batch) ---
+            sync_directories()
+
+            # --- Отчёт о метриках ---
+            if metrics.enabled:
+                try:
+                    report_path = metrics.write_report(log_dir)
+                    self.logger.info(f"Метрики запуска сохранены в: {report_path}")
+                    self.log_signal.emit(f"📊 Метрики запуска: {report_path}")
+                except Exception as e:
+                    self.logger.warning(f"Не удалось сохранить метрики запуска: {e}")
+                write_textfile(metrics)
+            stop_http_server(metrics_server)
 
             success_msg = "✅ Обработка всех файлов завершена!"
             self.logger.info(success_msg)
@@ -291,11 +453,6 @@ class Worker(QThread):
             self.progress_signal.emit(100)
             self.finished_signal.emit()
 
-            # Возвращаемся в исходную директорию
-            os.chdir(original_dir)
-            self.logger.info(
-                f"Возвращение в исходную директорию: {original_dir}")
-
         except Exception as e:
             error_msg = f"❌ Критическая ошибка в рабочем потоке: {str(e)}"
             self.logger.error(error_msg)
@@ -311,6 +468,8 @@ class UserCreatorWindow(QMainWindow):
         self.logger.info("Инициализация главного окна приложения")
         self.settings = QSettings('UserCreator', 'GUI')
         self.worker = None
+        # Скрытый переключатель профилирования: Ctrl+Shift+P или USER_CREATOR_PROFILE=1
+        self.profile_enabled = profiling_requested()
         self.init_ui()
         self.load_settings()
         self.logger.info("Главное окно приложения инициализировано")
@@ -639,6 +798,10 @@ class UserCreatorWindow(QMainWindow):
         self.radio_manual.toggled.connect(self.on_mode_change)
         self.on_mode_change()
 
+        # Скрытое сочетание клавиш для включения профилирования
+        self.profile_shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), self)
+        self.profile_shortcut.activated.connect(self.toggle_profiling)
+
         # Применяем глобальные стили
         self.setStyleSheet("""
             QMainWindow {
@@ -690,6 +853,13 @@ class UserCreatorWindow(QMainWindow):
             self.manual_guid_widget.setVisible(True)
             self.logger.info("Выбран режим работы без AD (ручной)")
 
+    def toggle_profiling(self):
+        """Включает/выключает профилирование следующего запуска (скрытая функция)."""
+        self.profile_enabled = not self.profile_enabled
+        state = "включено" if self.profile_enabled else "выключено"
+        self.logger.info(f"Профилирование {state}")
+        self.statusBar().showMessage(f"Профилирование {state}")
+
     def browse_input_directory(self):
         """Открывает диалог выбора директории."""
         self.logger.debug("Открытие диалога выбора директории")
@@ -746,7 +916,8 @@ class UserCreatorWindow(QMainWindow):
         self.logger.info("Все проверки пройдены, запуск рабочего потока")
 
         # Создаем и запускаем поток обработки
-        self.worker = Worker(mode, ad_password, manual_guid, input_dir)
+        self.worker = Worker(mode, ad_password, manual_guid, input_dir,
+                             profile=self.profile_enabled)
         self.worker.log_signal.connect(self.log_message)
         self.worker.progress_signal.connect(self.progress_bar.setValue)
         self.worker.finished_signal.connect(self.on_processing_finished)